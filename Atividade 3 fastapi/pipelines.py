@@ -1,42 +1,24 @@
-def pipeline_clientes_por_faixa_etaria():
-    return [
-        {
-            "$group": {
-                "_id": {
-                    "$switch": {
-                        "branches": [
-                            {"case": {"$lt": ["$idade", 20]}, "then": "<20"},
-                            {"case": {"$lt": ["$idade", 30]}, "then": "20-29"},
-                            {"case": {"$lt": ["$idade", 40]}, "then": "30-39"},
-                            {"case": {"$lt": ["$idade", 50]}, "then": "40-49"}
-                        ],
-                        "default": "50+"
-                    }
-                },
-                "total_clientes": {"$sum": 1},
-                "total_gasto": {"$sum": "$ultima_compra.valor"},
-                "clientes": {"$push": "$nome"}
-            }
-        },
-        {
-            "$sort": {"_id": 1}
-        }
-    ]
+# "faixa_etaria" e "produtos_mais_vendidos" da Atividade 3, registrados na
+# Atividade 4 como "clientes_por_faixa" e "produtos_clientes_distintos"
+# (services/registro_pipelines.py). Os pipelines são montados por
+# services/pipelines.py de lá, com as mesmas faixas de idade (LIMITES_IDADE e
+# ROTULOS_IDADE) dos outros relatórios.
+import sys
+from pathlib import Path
 
-def pipeline_produtos_mais_vendidos(limit=5):
-    return [
-        {
-            "$group": {
-                "_id": "$ultima_compra.produto",
-                "total_vendas": {"$sum": 1},
-                "faturamento_total": {"$sum": "$ultima_compra.valor"},
-                "clientes": {"$addToSet": "$nome"}
-            }
-        },
-        {
-            "$sort": {"faturamento_total": -1}
-        },
-        {
-            "$limit": limit
-        }
-    ]
\ No newline at end of file
+sys.path.append(str(Path(__file__).resolve().parent.parent / "Atividade 4" / "meu_projeto"))
+
+from services.pipelines import (  # noqa: E402
+    pipeline_clientes_por_faixa,
+    pipeline_produtos_clientes_distintos,
+)
+
+# Quantos nomes de exemplo cada grupo devolve ($firstN guarda só esses,
+# em vez de acumular todos os nomes do grupo em um array)
+MAX_CLIENTES_EXEMPLO = 10
+
+def pipeline_clientes_por_faixa_etaria(max_clientes=MAX_CLIENTES_EXEMPLO):
+    return pipeline_clientes_por_faixa(max_clientes)
+
+def pipeline_produtos_mais_vendidos(limit=5, max_clientes=MAX_CLIENTES_EXEMPLO):
+    return pipeline_produtos_clientes_distintos(limit, max_clientes)
@@ -0,0 +1,158 @@
+"""Controle de admissão por classe de rota (análises x CRUD)
+
+Cada classe tem o seu orçamento de requisições simultâneas e uma fila de espera
+limitada. Com a fila cheia, ou depois de esperar mais que o limite, a
+requisição é recusada na hora com 503 e Retry-After, em vez de acumular
+agregações que saturam o mongod e atrasam as rotas de CRUD.
+"""
+import asyncio
+import math
+import re
+import time
+import weakref
+from typing import Any, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from prometheus_client import Counter, Gauge
+
+ADMISSAO_FILA = Gauge("admissao_fila", "Requisições aguardando vaga", ["classe"])
+ADMISSAO_EM_EXECUCAO = Gauge("admissao_em_execucao", "Requisições em execução", ["classe"])
+ADMISSAO_REJEICOES = Counter("admissao_rejeicoes_total", "Requisições recusadas com 503", ["classe", "motivo"])
+
+# Relatórios (inclusive a exportação completa) e o explain, que executa o
+# pipeline inteiro, disputam o orçamento de análises
+ROTAS_ANALISE = re.compile(r"/analise/|/relatorios/exportacao/|^/diagnostico/pipelines/[^/]+/explain$")
+ROTAS_CRUD = re.compile(r"^(/empresas/[^/]+)?/(clientes|compras|relatorios)(/|$)")
+
+
+class Sobrecarga(Exception):
+    def __init__(self, motivo: str, retry_after: int):
+        super().__init__(motivo)
+        self.motivo = motivo
+        self.retry_after = retry_after
+
+
+class LimitadorAdmissao:
+    """Semáforo com fila de espera limitada e espera máxima"""
+
+    def __init__(self, classe: str, max_concorrentes: int, max_fila: int, espera_max_ms: float):
+        self.classe = classe
+        self.max_concorrentes = max_concorrentes
+        self.max_fila = max_fila
+        self.espera_max_ms = espera_max_ms
+        self._semaforo = asyncio.Semaphore(max_concorrentes)
+        self.em_execucao = 0
+        self.na_fila = 0
+        self.admitidas = 0
+        self.rejeitadas_fila_cheia = 0
+        self.rejeitadas_espera = 0
+        self.esperas = 0
+        self.espera_total_ms = 0.0
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.espera_max_ms / 1000))
+
+    async def entrar(self) -> None:
+        """Ocupa uma vaga ou levanta Sobrecarga (fila cheia ou espera esgotada)"""
+        if self._semaforo.locked():
+            if self.na_fila >= self.max_fila:
+                self.rejeitadas_fila_cheia += 1
+                ADMISSAO_REJEICOES.labels(self.classe, "fila_cheia").inc()
+                raise Sobrecarga("fila_cheia", self.retry_after)
+            self.na_fila += 1
+            ADMISSAO_FILA.labels(self.classe).inc()
+            inicio = time.perf_counter()
+            try:
+                # acquire na própria tarefa: um cancelamento (espera esgotada ou cliente
+                # que desconectou) chega dentro dele, que devolve a vaga já recebida.
+                # wait_for (3.11) roda o acquire em outra tarefa e pode engolir o
+                # cancelamento ou perder a vaga.
+                async with asyncio.timeout(self.espera_max_ms / 1000):
+                    await self._semaforo.acquire()
+            except TimeoutError:
+                self.rejeitadas_espera += 1
+                ADMISSAO_REJEICOES.labels(self.classe, "espera").inc()
+                raise Sobrecarga("espera", self.retry_after)
+            finally:
+                self.na_fila -= 1
+                ADMISSAO_FILA.labels(self.classe).dec()
+                self.esperas += 1
+                self.espera_total_ms += (time.perf_counter() - inicio) * 1000
+        else:
+            await self._semaforo.acquire()
+        self.em_execucao += 1
+        self.admitidas += 1
+        ADMISSAO_EM_EXECUCAO.labels(self.classe).inc()
+
+    def sair(self) -> None:
+        self.em_execucao -= 1
+        ADMISSAO_EM_EXECUCAO.labels(self.classe).dec()
+        self._semaforo.release()
+
+    def estatisticas(self) -> Dict[str, Any]:
+        return {
+            "max_concorrentes": self.max_concorrentes,
+            "max_fila": self.max_fila,
+            "espera_max_ms": self.espera_max_ms,
+            "em_execucao": self.em_execucao,
+            "na_fila": self.na_fila,
+            "admitidas": self.admitidas,
+            "rejeitadas_fila_cheia": self.rejeitadas_fila_cheia,
+            "rejeitadas_espera": self.rejeitadas_espera,
+            # Média das requisições que passaram pela fila (admitidas ou não)
+            "espera_media_ms": round(self.espera_total_ms / self.esperas, 3) if self.esperas else 0.0,
+        }
+
+
+def classe_da_rota(caminho: str) -> Optional[str]:
+    """analises, crud ou None (métricas, diagnóstico e documentação não passam pelo limite)"""
+    if ROTAS_ANALISE.search(caminho):
+        return "analises"
+    if ROTAS_CRUD.match(caminho):
+        return "crud"
+    return None
+
+
+async def controlar_admissao(request: Request, call_next):
+    """Middleware HTTP: segura a vaga da classe até o fim do corpo da resposta"""
+    limitadores: Dict[str, LimitadorAdmissao] = getattr(request.app.state, "limitadores", {})
+    limitador = limitadores.get(classe_da_rota(request.url.path))
+    if limitador is None:
+        return await call_next(request)
+    try:
+        await limitador.entrar()
+    except Sobrecarga as e:
+        return JSONResponse(
+            {"detail": f"Servidor sobrecarregado ({limitador.classe}: {e.motivo}); tente novamente"},
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    liberada = False
+
+    def liberar():
+        nonlocal liberada
+        if not liberada:
+            liberada = True
+            limitador.sair()
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        liberar()
+        raise
+    # Respostas em streaming (NDJSON, CSV) continuam ocupando a vaga enquanto enviam
+    corpo = response.body_iterator
+
+    async def corpo_com_vaga():
+        try:
+            async for parte in corpo:
+                yield parte
+        finally:
+            liberar()
+
+    response.body_iterator = corpo_com_vaga()
+    # Cliente que desconecta antes do primeiro bloco: o gerador nunca começa
+    weakref.finalize(response.body_iterator, liberar)
+    return response
@@ -0,0 +1,51 @@
+"""Compara dois resultados de benchmark e destaca regressões
+
+Uso: python -m benchmarks.comparar base.json novo.json [--tolerancia 10]
+Sai com código 1 se alguma operação ficar mais lenta que a tolerância (p50).
+"""
+import argparse
+import json
+import sys
+
+def _indexar(resultado):
+    linhas = {}
+    for escala, medicoes in resultado["escalas"].items():
+        for linha in medicoes["rotas"] + medicoes["analises"]:
+            linhas[(escala, linha["operacao"])] = linha
+    return linhas
+
+def _variacao(antes: float, depois: float) -> float:
+    return (depois - antes) / antes * 100 if antes else 0.0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("novo")
+    parser.add_argument("--tolerancia", type=float, default=10.0, help="Piora máxima aceita no p50, em %%")
+    args = parser.parse_args(argv)
+
+    with open(args.base, encoding="utf-8") as arquivo:
+        base = json.load(arquivo)
+    with open(args.novo, encoding="utf-8") as arquivo:
+        novo = json.load(arquivo)
+    print(f"base {base.get('commit')} -> novo {novo.get('commit')}")
+
+    antes, depois = _indexar(base), _indexar(novo)
+    regressoes = 0
+    for chave in sorted(antes.keys() & depois.keys(), key=lambda c: (int(c[0]), c[1])):
+        a, d = antes[chave], depois[chave]
+        p50 = _variacao(a["p50_ms"], d["p50_ms"])
+        p99 = _variacao(a["p99_ms"], d["p99_ms"])
+        vazao = _variacao(a["vazao_ops"], d["vazao_ops"])
+        cpu = _variacao(a.get("cpu_ms", 0), d.get("cpu_ms", 0))
+        marca = ""
+        if p50 > args.tolerancia:
+            marca = "  <-- regressão"
+            regressoes += 1
+        print(f"{chave[0]:>10} {chave[1]:<45} p50 {p50:+7.1f}%  p99 {p99:+7.1f}%  vazão {vazao:+7.1f}%  cpu {cpu:+7.1f}%  "
+              f"docs {a['docs_examinados']} -> {d['docs_examinados']}  "
+              f"ops {a.get('operacoes_mongo', '-')} -> {d.get('operacoes_mongo', '-')}{marca}")
+    return 1 if regressoes else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+"""Benchmark reproduzível das rotas CRUD e dos relatórios em várias escalas
+
+Uso (a partir de meu_projeto, com um mongod local):
+    python -m benchmarks.executar --escalas 20,10000,1000000 --saida resultados.json
+    python -m benchmarks.comparar base.json resultados.json
+
+Para medir o modo de resposta rápida, rode duas vezes e compare:
+    python -m benchmarks.executar --saida padrao.json
+    python -m benchmarks.executar --respostas-rapidas --saida rapido.json
+
+Cada escala recria o banco de benchmark, carrega os clientes sintéticos,
+reconstrói os rollups e mede latência (p50/p99), vazão e documentos examinados
+(contador scannedObjects do servidor) de cada operação.
+
+Com --empresa-pequena N, cada escala carrega também uma segunda empresa com N
+clientes fixos e mede os relatórios dela (cabeçalho X-Empresa-Id): a latência
+da empresa pequena deve ficar estável enquanto a grande cresce. Para medir uma
+empresa em coleção dedicada, rode com EMPRESAS_DEDICADAS=pequena.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+BANCO_PADRAO = "clientes_benchmark"
+EMPRESA_PEQUENA = "pequena"
+RELATORIOS = ["faixa-etaria", "rfm", "produtos-mais-vendidos", "maior-valor-compra", "comportamento-idade", "dashboard"]
+
+def _percentil(amostras: List[float], p: float) -> float:
+    ordenadas = sorted(amostras)
+    indice = min(len(ordenadas) - 1, max(0, round(p / 100 * (len(ordenadas) - 1))))
+    return ordenadas[indice]
+
+def _contadores(db) -> Tuple[int, int]:
+    """Documentos examinados e operações recebidas pelo servidor (idas ao banco)"""
+    status = db.command("serverStatus")
+    return status["metrics"]["queryExecutor"]["scannedObjects"], sum(status["opcounters"].values())
+
+def _commit_atual() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "desconhecido"
+
+def carregar_dados(db, quantidade: int, semente: int, pequena: int = 0) -> float:
+    """Recria as coleções de clientes com os dados sintéticos; retorna a duração
+
+    A EMPRESA_PADRAO recebe ``quantidade`` clientes e, se ``pequena`` > 0, a
+    empresa EMPRESA_PEQUENA recebe ``pequena`` clientes (mesmos ids).
+    """
+    from benchmarks.gerador import gerar_clientes, lotes
+    from database import configurar_indices
+    from services import rollups
+    from services.derivados import campos_derivados
+    from services.empresas import colecao_clientes, empresa_padrao
+
+    db.client.drop_database(db.name)
+    configurar_indices(db)
+    inicio = time.perf_counter()
+    agora = datetime.now(timezone.utc)
+    cargas = [(empresa_padrao(), quantidade, semente)]
+    if pequena:
+        cargas.append((EMPRESA_PEQUENA, pequena, semente + 2))
+    for empresa_id, total, semente_empresa in cargas:
+        for lote in lotes(gerar_clientes(total, semente_empresa), 10000):
+            for cliente in lote:
+                cliente.update(campos_derivados(cliente))
+                cliente["empresa_id"] = empresa_id
+                cliente["atualizado_em"] = agora
+                cliente["versao"] = 1
+            db[colecao_clientes(empresa_id)].insert_many(lote, ordered=False)
+    rollups.reconstruir_rollups(db)
+    return time.perf_counter() - inicio
+
+async def medir(
+    nome: str, operacao: Callable[[int], Awaitable[Any]], db, repeticoes: int, concorrencia: int
+) -> Dict[str, Any]:
+    """Latência sequencial (p50/p99), CPU e bytes por requisição e vazão concorrente
+
+    A operação pode devolver a resposta HTTP; nesse caso o tamanho do corpo
+    entra na conta de bytes/s.
+    """
+    latencias = []
+    tamanho = 0
+    examinados_antes, operacoes_antes = _contadores(db)
+    cpu_inicio = time.process_time()
+    for i in range(repeticoes):
+        inicio = time.perf_counter()
+        resposta = await operacao(i)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        tamanho += len(getattr(resposta, "content", b""))
+    cpu_ms = (time.process_time() - cpu_inicio) * 1000 / repeticoes
+    examinados_depois, operacoes_depois = _contadores(db)
+    examinados = (examinados_depois - examinados_antes) / repeticoes
+    # Desconta o próprio serverStatus da leitura inicial
+    operacoes = (operacoes_depois - operacoes_antes - 1) / repeticoes
+
+    total = repeticoes * concorrencia
+    semaforo = asyncio.Semaphore(concorrencia)
+    async def limitada(i):
+        async with semaforo:
+            await operacao(repeticoes + i)
+    inicio = time.perf_counter()
+    await asyncio.gather(*(limitada(i) for i in range(total)))
+    duracao = time.perf_counter() - inicio
+    return {
+        "operacao": nome,
+        "p50_ms": round(statistics.median(latencias), 3),
+        "p99_ms": round(_percentil(latencias, 99), 3),
+        "vazao_ops": round(total / duracao, 1),
+        "cpu_ms": round(cpu_ms, 3),
+        "bytes_resposta": tamanho // repeticoes,
+        "bytes_s": round(tamanho / (sum(latencias) / 1000), 1) if tamanho else 0.0,
+        "docs_examinados": round(examinados, 1),
+        "operacoes_mongo": round(operacoes, 2),
+    }
+
+async def executar_escala(app, db, quantidade: int, args) -> Dict[str, Any]:
+    import httpx
+    from benchmarks.gerador import gerar_clientes
+    from config import get_settings
+    from services.cliente_service_async import ClienteServiceAsync
+
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://benchmark") as http:
+        def checar(resposta):
+            if resposta.status_code >= 500:
+                raise RuntimeError(f"{resposta.request.url}: {resposta.status_code} {resposta.text}")
+            return resposta
+
+        existentes = [f"c{(i % quantidade) + 1:08d}" for i in range(10 ** 6)]
+        novos = iter(gerar_clientes(10 ** 6, semente=args.semente + 1))
+        criados: List[str] = []
+
+        async def criar(i):
+            cliente = next(novos)
+            cliente["id"] = f"n{i:08d}"
+            criados.append(cliente["id"])
+            checar(await http.post("/clientes/", json=cliente))
+
+        async def deletar(i):
+            if criados:
+                checar(await http.delete(f"/clientes/{criados.pop()}"))
+
+        rotas = {
+            "POST /clientes": criar,
+            "GET /clientes/{id}": lambda i: http.get(f"/clientes/{existentes[i]}"),
+            "GET /clientes/{id} (If-None-Match)": lambda i: http.get(
+                f"/clientes/{existentes[0]}", headers={"If-None-Match": f'"{existentes[0]}-1"'}
+            ),
+            "PUT /clientes/{id}": lambda i: http.put(f"/clientes/{existentes[i]}", json={"idade": 20 + i % 60}),
+            "POST /clientes/batch-get": lambda i: http.post(
+                "/clientes/batch-get", json={"ids": existentes[i * 50:(i + 1) * 50]}
+            ),
+            "GET /clientes": lambda i: http.get("/clientes/", params={"limite": 50}),
+            "GET /clientes?nome": lambda i: http.get("/clientes/", params={"nome": "Ana", "limite": 50}),
+            "DELETE /clientes/{id}": deletar,
+        }
+        for relatorio in RELATORIOS:
+            rotas[f"GET /clientes/analise/{relatorio}"] = lambda i, r=relatorio: http.get(f"/clientes/analise/{r}")
+        if args.empresa_pequena:
+            # Mesmas rotas para a empresa pequena, que divide o banco com a grande
+            cabecalho = {"X-Empresa-Id": EMPRESA_PEQUENA}
+            rotas["GET /clientes/{id} [pequena]"] = lambda i: http.get(
+                f"/clientes/{existentes[i % args.empresa_pequena]}", headers=cabecalho
+            )
+            for relatorio in RELATORIOS:
+                rotas[f"GET /clientes/analise/{relatorio} [pequena]"] = lambda i, r=relatorio: http.get(
+                    f"/clientes/analise/{r}", headers=cabecalho
+                )
+
+        resultados_rotas = []
+        for nome, operacao in rotas.items():
+            async def verificada(i, operacao=operacao):
+                resposta = await operacao(i)
+                if resposta is not None:
+                    checar(resposta)
+                return resposta
+            resultados_rotas.append(await medir(nome, verificada, db, args.repeticoes, args.concorrencia))
+
+    # Métodos de análise chamados direto no serviço (sem HTTP e sem cache)
+    settings = get_settings()
+    service = ClienteServiceAsync(app.state.db, usar_campos_derivados=settings.pipelines_campos_derivados)
+    metodos = {
+        "analisar_faixa_etaria": service.analisar_faixa_etaria,
+        "segmentacao_rfm": service.segmentacao_rfm,
+        "produtos_mais_vendidos": service.produtos_mais_vendidos,
+        "clientes_maior_valor_compra": service.clientes_maior_valor_compra,
+        "comportamento_por_idade": service.comportamento_por_idade,
+    }
+    resultados_analises = []
+    for nome, metodo in metodos.items():
+        resultados_analises.append(
+            await medir(nome, lambda i, m=metodo: m(), db, args.repeticoes, args.concorrencia)
+        )
+    return {"rotas": resultados_rotas, "analises": resultados_analises}
+
+async def principal(args) -> Dict[str, Any]:
+    # As configurações são lidas uma única vez; o banco de benchmark precisa vir antes
+    os.environ["MONGO_DB"] = args.banco
+    if args.uri:
+        os.environ["MONGO_URI"] = args.uri
+    if not args.com_cache:
+        os.environ["CACHE_ANALISES_TTL_SEGUNDOS"] = "0"
+    os.environ["RESPOSTAS_RAPIDAS"] = "true" if args.respostas_rapidas else "false"
+    from config import get_settings
+    from database import criar_cliente_mongo
+    from main import app, lifespan
+
+    settings = get_settings()
+    cliente_sync = criar_cliente_mongo(settings)
+    db = cliente_sync[settings.mongo_db]
+    resultado = {
+        "commit": _commit_atual(),
+        "data": datetime.now(timezone.utc).isoformat(),
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("saida",)},
+        "escalas": {},
+    }
+    try:
+        for quantidade in args.escalas:
+            print(f"Escala {quantidade}: carregando dados...")
+            carga = carregar_dados(db, quantidade, args.semente, args.empresa_pequena)
+            async with lifespan(app):
+                medicoes = await executar_escala(app, db, quantidade, args)
+            resultado["escalas"][str(quantidade)] = {"carga_segundos": round(carga, 3), **medicoes}
+            for linha in medicoes["rotas"] + medicoes["analises"]:
+                print(f"  {linha['operacao']:<45} p50={linha['p50_ms']:>9.3f}ms p99={linha['p99_ms']:>9.3f}ms "
+                      f"vazão={linha['vazao_ops']:>8.1f}/s cpu={linha['cpu_ms']:>7.3f}ms "
+                      f"bytes/s={linha['bytes_s']:>12.0f} docs={linha['docs_examinados']} ops={linha['operacoes_mongo']}")
+    finally:
+        if not args.manter_dados:
+            cliente_sync.drop_database(args.banco)
+        cliente_sync.close()
+    return resultado
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--escalas", default="20,1000,100000",
+                        type=lambda s: [int(float(x)) for x in s.split(",")],
+                        help="Quantidades de clientes, ex.: 20,1000,100000,1e6,1e7")
+    parser.add_argument("--repeticoes", type=int, default=30, help="Amostras sequenciais por operação")
+    parser.add_argument("--concorrencia", type=int, default=8, help="Requisições simultâneas na medição de vazão")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--uri", default=None, help="URI do MongoDB (padrão: MONGO_URI)")
+    parser.add_argument("--banco", default=BANCO_PADRAO)
+    parser.add_argument("--com-cache", action="store_true", help="Mantém o cache de relatórios ligado")
+    parser.add_argument("--respostas-rapidas", action="store_true", help="Liga RESPOSTAS_RAPIDAS (orjson, sem revalidação)")
+    parser.add_argument("--empresa-pequena", type=int, default=0,
+                        help="Carrega também uma empresa com N clientes e mede os relatórios dela")
+    parser.add_argument("--manter-dados", action="store_true")
+    parser.add_argument("--saida", default="benchmark_resultados.json")
+    args = parser.parse_args(argv)
+    resultado = asyncio.run(principal(args))
+    with open(args.saida, "w", encoding="utf-8") as arquivo:
+        json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em {args.saida}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Gerador determinístico de clientes sintéticos (salão/loja de beleza)
+
+A mesma semente sempre produz os mesmos clientes, em qualquer escala, para que
+os resultados dos benchmarks sejam comparáveis entre commits.
+"""
+import random
+from datetime import date, timedelta
+from typing import Dict, Iterator, List
+
+NOMES = [
+    "Ana", "Beatriz", "Camila", "Daniela", "Eduarda", "Fernanda", "Gabriela", "Helena", "Isabela", "Júlia",
+    "Larissa", "Mariana", "Natália", "Patrícia", "Rafaela", "Sofia", "Tatiane", "Vitória", "Bruno", "Carlos",
+    "Diego", "Felipe", "Gustavo", "João", "Lucas", "Marcos", "Pedro", "Rafael", "Thiago", "Vinícius",
+]
+SOBRENOMES = [
+    "Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira", "Lima", "Gomes",
+    "Costa", "Ribeiro", "Martins", "Carvalho", "Almeida", "Lopes", "Soares", "Fernandes", "Vieira", "Barbosa",
+]
+# (produto, preço base): a popularidade segue a ordem da lista (distribuição tipo Zipf)
+PRODUTOS = [
+    ("Shampoo", 35.0), ("Condicionador", 38.0), ("Corte de cabelo", 60.0), ("Manicure", 30.0),
+    ("Hidratação capilar", 90.0), ("Batom", 45.0), ("Base", 80.0), ("Máscara de cílios", 55.0),
+    ("Escova progressiva", 250.0), ("Coloração", 150.0), ("Pedicure", 35.0), ("Design de sobrancelha", 40.0),
+    ("Perfume", 180.0), ("Creme facial", 120.0), ("Depilação", 70.0), ("Limpeza de pele", 130.0),
+    ("Maquiagem completa", 200.0), ("Protetor solar", 65.0), ("Óleo capilar", 50.0), ("Esmalte", 12.0),
+]
+PESOS_PRODUTOS = [1 / (posicao + 1) for posicao in range(len(PRODUTOS))]
+
+# Produtos comprados juntos: cada cliente do histórico tem um grupo preferido
+GRUPOS_PRODUTOS = [
+    ["Shampoo", "Condicionador", "Hidratação capilar", "Óleo capilar", "Escova progressiva", "Coloração"],
+    ["Manicure", "Pedicure", "Esmalte", "Depilação"],
+    ["Batom", "Base", "Máscara de cílios", "Maquiagem completa", "Design de sobrancelha"],
+    ["Creme facial", "Limpeza de pele", "Protetor solar", "Perfume", "Corte de cabelo"],
+]
+
+DATA_REFERENCIA = date(2025, 7, 29)
+
+def _idade(rnd: random.Random) -> int:
+    # Público concentrado entre 25 e 45 anos, com cauda de jovens e idosos
+    if rnd.random() < 0.8:
+        idade = rnd.gauss(36, 10)
+    else:
+        idade = rnd.uniform(16, 85)
+    return int(min(max(idade, 16), 95))
+
+def _compra(rnd: random.Random) -> Dict:
+    indice = rnd.choices(range(len(PRODUTOS)), weights=PESOS_PRODUTOS)[0]
+    produto, preco_base = PRODUTOS[indice]
+    valor = round(preco_base * rnd.lognormvariate(0, 0.25), 2)
+    # Recência com cauda longa: a maioria comprou há poucos meses
+    dias = min(int(rnd.expovariate(1 / 90)), 730)
+    return {"produto": produto, "valor": valor, "data": (DATA_REFERENCIA - timedelta(days=dias)).isoformat()}
+
+def gerar_clientes(quantidade: int, semente: int = 42) -> Iterator[Dict]:
+    """Gera clientes no formato de ClienteCreate; ids sequenciais 'c00000001'..."""
+    rnd = random.Random(semente)
+    for numero in range(1, quantidade + 1):
+        cliente = {
+            "id": f"c{numero:08d}",
+            "nome": f"{rnd.choice(NOMES)} {rnd.choice(SOBRENOMES)}",
+            "idade": _idade(rnd),
+            "ultima_compra": _compra(rnd) if rnd.random() < 0.9 else None,
+        }
+        yield cliente
+
+def gerar_historico(quantidade: int, semente: int = 42, compras_por_cliente: int = 4) -> Iterator[Dict]:
+    """Compras agregadas por cliente e produto (formato de compras_cliente_produto)
+
+    70% dos clientes têm histórico; 80% das compras de cada um saem do seu grupo
+    preferido e o resto segue a popularidade geral, para que os produtos de um
+    mesmo grupo apareçam juntos.
+    """
+    rnd = random.Random(semente + 1)
+    precos = dict(PRODUTOS)
+    for numero in range(1, quantidade + 1):
+        if rnd.random() >= 0.7:
+            continue
+        grupo = rnd.choice(GRUPOS_PRODUTOS)
+        compras: Dict[str, int] = {}
+        for _ in range(rnd.randint(1, 2 * compras_por_cliente - 1)):
+            if rnd.random() < 0.8:
+                produto = rnd.choice(grupo)
+            else:
+                produto = PRODUTOS[rnd.choices(range(len(PRODUTOS)), weights=PESOS_PRODUTOS)[0]][0]
+            compras[produto] = compras.get(produto, 0) + 1
+        for produto, total in compras.items():
+            yield {
+                "cliente_id": f"c{numero:08d}", "produto": produto,
+                "compras": total, "valor": round(precos[produto] * total, 2),
+            }
+
+def lotes(iteravel: Iterator[Dict], tamanho: int) -> Iterator[List[Dict]]:
+    lote = []
+    for item in iteravel:
+        lote.append(item)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
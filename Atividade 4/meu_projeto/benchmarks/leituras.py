@@ -0,0 +1,140 @@
+"""Carga do primário com as análises no primário x nos secundários
+
+Uso (a partir de meu_projeto, com o binário mongod disponível):
+    python -m benchmarks.leituras --clientes 100000 --crud 2000 --analises 200
+
+Sobe um replica set local de três membros (benchmarks/replica_set.py), carrega
+os clientes sintéticos e roda o mesmo tráfego misto (GET /clientes/{id} e
+relatórios em paralelo) duas vezes: com LEITURAS_ANALISES=primary e com
+secondaryPreferred. Para cada membro, conta os comandos de leitura recebidos
+(find, aggregate e getMore do serverStatus). Com secondaryPreferred a carga de
+leitura do primário deve cair para perto da do CRUD.
+
+Depois verifica a leitura das próprias escritas: cria um cliente com
+X-Consistencia-Causal e, com o token devolvido, lê o relatório de maior valor
+(servido por um secundário), que já deve trazer o cliente novo.
+
+Sai com código 1 se o primário não tiver menos leituras com secondaryPreferred
+ou se a leitura causal não enxergar a escrita.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from collections import Counter
+from typing import Any, Dict, List
+
+from benchmarks.executar import BANCO_PADRAO, RELATORIOS, carregar_dados
+from benchmarks.replica_set import PORTAS_PADRAO, membro, replica_set_local
+
+COMANDOS_LEITURA = ("find", "aggregate", "getMore")
+
+def _leituras(porta: int) -> int:
+    with membro(porta) as cliente:
+        comandos = cliente.admin.command("serverStatus")["metrics"]["commands"]
+    return sum(comandos.get(nome, {}).get("total", 0) for nome in COMANDOS_LEITURA)
+
+def _configurar(modo: str) -> None:
+    from config import get_settings
+    os.environ["LEITURAS_ANALISES"] = modo
+    get_settings.cache_clear()
+
+async def trafego(args) -> Dict[str, int]:
+    """CRUD e relatórios em paralelo; devolve a contagem de status HTTP"""
+    import httpx
+    from main import app, lifespan
+
+    status = Counter()
+    async with lifespan(app):
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://leituras", timeout=None) as http:
+            async def crud(inicio: int):
+                for i in range(inicio, args.crud, args.concorrencia):
+                    resposta = await http.get(f"/clientes/c{(i * 7919) % args.clientes + 1:08d}")
+                    status[f"crud_{resposta.status_code}"] += 1
+
+            async def analista(inicio: int):
+                for i in range(inicio, args.analises, args.concorrencia_analises):
+                    resposta = await http.get(f"/clientes/analise/{RELATORIOS[i % len(RELATORIOS)]}")
+                    status[f"analise_{resposta.status_code}"] += 1
+
+            await asyncio.gather(
+                *(crud(i) for i in range(args.concorrencia)),
+                *(analista(i) for i in range(args.concorrencia_analises)),
+            )
+    return dict(status)
+
+async def leitura_causal() -> bool:
+    """Escreve pelo primário e lê o relatório (secundário) com o token da escrita"""
+    import httpx
+    from consistencia import CABECALHO
+    from main import app, lifespan
+
+    async with lifespan(app):
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://leituras", timeout=None) as http:
+            novo = {
+                "id": "causal-1", "nome": "Leitura Causal", "idade": 30,
+                "ultima_compra": {"produto": "Notebook", "valor": 10 ** 9, "data": "2024-01-01"},
+            }
+            escrita = await http.post("/clientes/", json=novo, headers={CABECALHO: "1"})
+            token = escrita.headers.get(CABECALHO)
+            if escrita.status_code != 201 or not token:
+                print(f"Escrita causal falhou: {escrita.status_code} {escrita.text}")
+                return False
+            leitura = await http.get("/clientes/analise/maior-valor-compra?limit=1", headers={CABECALHO: token})
+            corpo = leitura.json() if leitura.status_code == 200 else []
+            return bool(corpo) and corpo[0]["id"] == novo["id"]
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clientes", type=int, default=100000)
+    parser.add_argument("--crud", type=int, default=2000, help="Requisições GET /clientes/{id} por rodada")
+    parser.add_argument("--analises", type=int, default=200, help="Requisições de relatório por rodada")
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument("--concorrencia-analises", type=int, default=4)
+    parser.add_argument("--mongod", default="mongod", help="Binário do mongod")
+    parser.add_argument("--portas", default=",".join(map(str, PORTAS_PADRAO)),
+                        type=lambda s: [int(p) for p in s.split(",")])
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--banco", default=BANCO_PADRAO)
+    args = parser.parse_args(argv)
+
+    with replica_set_local(args.portas, args.mongod) as uri:
+        # As configurações são lidas na inicialização; caches desligados para
+        # que cada requisição chegue ao banco
+        os.environ.update({
+            "MONGO_URI": uri,
+            "MONGO_DB": args.banco,
+            "CACHE_ANALISES_TTL_SEGUNDOS": "0",
+            "CACHE_CLIENTES_TTL_SEGUNDOS": "0",
+        })
+        _configurar("primary")
+        from config import get_settings
+        from database import criar_cliente_mongo
+        settings = get_settings()
+        cliente = criar_cliente_mongo(settings)
+        carregar_dados(cliente[settings.mongo_db], args.clientes, args.semente)
+
+        leituras: Dict[str, List[int]] = {}
+        for modo in ("primary", "secondaryPreferred"):
+            _configurar(modo)
+            antes = [_leituras(porta) for porta in args.portas]
+            status = asyncio.run(trafego(args))
+            leituras[modo] = [_leituras(porta) - inicial for porta, inicial in zip(args.portas, antes)]
+            print(f"LEITURAS_ANALISES={modo}: {status}")
+            print("  leituras por membro: " + "  ".join(
+                f"{porta}{' (primário)' if i == 0 else ''}={total}"
+                for i, (porta, total) in enumerate(zip(args.portas, leituras[modo]))
+            ))
+        causal = asyncio.run(leitura_causal())
+        print(f"Leitura causal após escrita: {'ok' if causal else 'NÃO viu a escrita'}")
+        cliente.close()
+
+    primario_antes, primario_depois = leituras["primary"][0], leituras["secondaryPreferred"][0]
+    reducao = 1 - primario_depois / primario_antes if primario_antes else 0.0
+    print(f"Leituras no primário: {primario_antes} -> {primario_depois} ({reducao:.0%} a menos)")
+    return 0 if primario_depois < primario_antes and causal else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Verifica que a memória dos relatórios não cresce com o volume de dados
+
+Uso (a partir de meu_projeto):
+    python -m benchmarks.memoria                       # só os sketches, sem banco
+    python -m benchmarks.memoria --banco-escalas 1000,100000,1000000
+
+Sketches: mede o pico de memória (tracemalloc) e o número de registradores do
+HyperLogLog ao inserir cada vez mais valores distintos.
+
+Pipelines (com --banco-escalas e um mongod local): carrega os clientes
+sintéticos em cada escala e mede o maior documento (BSON) produzido por cada
+relatório. Com $push/$addToSet esse tamanho cresce com a coleção; com $firstN e
+contagens em dois $group ele deve ficar constante.
+
+Sai com código 1 se algum valor crescer mais que --tolerancia entre a menor e a
+maior escala.
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+from typing import Dict, List
+
+def medir_sketches(escalas: List[int]) -> Dict[int, Dict[str, float]]:
+    from services.sketches import HyperLogLog
+    resultado = {}
+    for quantidade in escalas:
+        tracemalloc.start()
+        sketch = HyperLogLog()
+        for i in range(quantidade):
+            sketch.adicionar(f"c{i:08d}")
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        estimativa = sketch.estimar()
+        resultado[quantidade] = {
+            "pico_bytes": pico,
+            "registradores": len(sketch.registradores),
+            "erro_pct": round(abs(estimativa - quantidade) / quantidade * 100, 2),
+        }
+    return resultado
+
+def medir_pipelines(escalas: List[int], semente: int) -> Dict[int, Dict[str, float]]:
+    import bson
+    from benchmarks.executar import carregar_dados
+    from config import get_settings
+    from database import criar_cliente_mongo
+    from services import registro_pipelines
+    from services.empresas import colecao_clientes, empresa_padrao
+
+    relatorios = {
+        nome: registro_pipelines.sem_gravacao(registro_pipelines.obter(nome).montar(empresa_padrao(), **argumentos))
+        for nome, argumentos in (
+            ("faixa_etaria", {}),
+            ("produtos_mais_vendidos", {"limit": 20}),
+            ("comportamento_idade", {}),
+            ("rollup_produto", {}),
+        )
+    }
+    settings = get_settings()
+    cliente = criar_cliente_mongo(settings)
+    db = cliente[settings.mongo_db]
+    colecao = db[colecao_clientes(empresa_padrao())]
+    resultado = {}
+    try:
+        for quantidade in escalas:
+            carregar_dados(db, quantidade, semente)
+            resultado[quantidade] = {
+                nome: max(
+                    (len(bson.encode(doc)) for doc in colecao.aggregate(pipeline, allowDiskUse=True)),
+                    default=0,
+                )
+                for nome, pipeline in relatorios.items()
+            }
+    finally:
+        cliente.drop_database(settings.mongo_db)
+        cliente.close()
+    return resultado
+
+def _verificar(titulo: str, medicoes: Dict[int, Dict[str, float]], campos: List[str], tolerancia: float) -> int:
+    print(titulo)
+    for quantidade, valores in medicoes.items():
+        print(f"  {quantidade:>10}: " + "  ".join(f"{k}={v}" for k, v in valores.items()))
+    menor, maior = medicoes[min(medicoes)], medicoes[max(medicoes)]
+    falhas = 0
+    for campo in campos:
+        if menor[campo] and maior[campo] > menor[campo] * (1 + tolerancia / 100):
+            print(f"  CRESCEU: {campo} {menor[campo]} -> {maior[campo]}")
+            falhas += 1
+    return falhas
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--escalas", default="10000,100000,1000000",
+                        type=lambda s: [int(float(x)) for x in s.split(",")],
+                        help="Quantidades de valores distintos inseridos no sketch")
+    parser.add_argument("--banco-escalas", default=None,
+                        type=lambda s: [int(float(x)) for x in s.split(",")],
+                        help="Quantidades de clientes para medir os pipelines (requer mongod)")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--banco", default="clientes_benchmark_memoria")
+    parser.add_argument("--tolerancia", type=float, default=10.0, help="Crescimento máximo aceito, em %%")
+    args = parser.parse_args(argv)
+
+    falhas = _verificar(
+        "HyperLogLog (pico de memória e registradores por escala)",
+        medir_sketches(args.escalas), ["pico_bytes", "registradores"], args.tolerancia,
+    )
+    if args.banco_escalas:
+        # As configurações são lidas uma única vez; o banco precisa vir antes
+        os.environ["MONGO_DB"] = args.banco
+        medicoes = medir_pipelines(args.banco_escalas, args.semente)
+        falhas += _verificar(
+            "Maior documento de cada relatório (bytes BSON)",
+            medicoes, list(next(iter(medicoes.values()))), args.tolerancia,
+        )
+    print("Memória estável." if not falhas else f"{falhas} medida(s) cresceram com os dados.")
+    return 1 if falhas else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""Recomendações em escala: carga, consultas, sincronização incremental e campanhas
+
+Uso (a partir de meu_projeto; requer numpy e scipy, não usa o banco):
+    python -m benchmarks.recomendacoes --clientes 1000000 --processos 0,1,2,4
+
+Monta o modelo direto dos clientes e do histórico sintéticos (gerar_clientes e
+gerar_historico), sem o MongoDB, e mede:
+
+- a carga completa (matriz, coocorrência e similaridade) e o índice por produto;
+- p50/p99 de "produtos para o cliente" e de "clientes para o produto" (com o
+  índice e sem ele);
+- a aplicação de um lote de alterações (clientes alterados, novos e removidos e
+  compras novas), conferida contra uma carga completa dos mesmos dados;
+- a pontuação de uma campanha com o catálogo inteiro em série (processos=0) e
+  no pool com N processos, conferindo que o resultado não muda.
+
+Sai com código 1 se a sincronização incremental divergir da carga completa, se
+o pool mudar o resultado da campanha ou se o p99 das consultas com índice
+passar de --limite-ms.
+"""
+import argparse
+import multiprocessing
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Set
+
+from benchmarks.executar import _percentil
+
+EMPRESA = "benchmark"
+
+def _clientes(quantidade: int, semente: int, alterados: Dict[str, Dict], removidos: Set[str]) -> Iterator[Dict]:
+    """Documentos na projeção do modelo; _id sequencial como o ObjectId de cada cliente"""
+    from benchmarks.gerador import gerar_clientes
+    for numero, cliente in enumerate(gerar_clientes(quantidade, semente), 1):
+        if cliente["id"] in removidos:
+            continue
+        yield alterados.get(cliente["id"]) or {"_id": numero, "id": cliente["id"], "ultima_compra": cliente["ultima_compra"]}
+
+def _historico(quantidade: int, semente: int, novas: Dict[tuple, int], somente: Set[str] = None) -> Iterator[Dict]:
+    from benchmarks.gerador import gerar_historico
+    pendentes = dict(novas)
+    for doc in gerar_historico(quantidade, semente):
+        if somente is not None and doc["cliente_id"] not in somente:
+            continue
+        doc["compras"] += pendentes.pop((doc["cliente_id"], doc["produto"]), 0)
+        yield doc
+    for (cliente_id, produto), compras in pendentes.items():
+        if somente is None or cliente_id in somente:
+            yield {"cliente_id": cliente_id, "produto": produto, "compras": compras}
+
+def _modelo():
+    from pymongo import MongoClient
+    from services.recomendacoes import ModeloRecomendacao
+    # connect=False: o modelo é alimentado direto, sem consultas ao banco
+    return ModeloRecomendacao(MongoClient(connect=False)["benchmark_recomendacoes"], EMPRESA)
+
+def _latencias(funcao, argumentos: List) -> Dict[str, float]:
+    amostras = []
+    for argumento in argumentos:
+        inicio = time.perf_counter()
+        funcao(*argumento)
+        amostras.append((time.perf_counter() - inicio) * 1000)
+    return {"p50_ms": round(_percentil(amostras, 50), 3), "p99_ms": round(_percentil(amostras, 99), 3)}
+
+def _divergencias(incremental, completo) -> List[str]:
+    import numpy as np
+    if set(incremental._linhas) != set(completo._linhas):
+        return ["clientes ativos diferentes"]
+    linhas = [incremental._linhas[i] for i in completo.ids]
+    colunas = [incremental._codigos_produto[p] for p in completo.produtos]
+    problemas = []
+    diferenca = incremental.matriz[linhas][:, colunas] - completo.matriz
+    if diferenca.nnz and abs(diferenca).max() > 1e-9:
+        problemas.append("matriz cliente x produto")
+    if not np.allclose(incremental.coocorrencia[np.ix_(colunas, colunas)], completo.coocorrencia, atol=1e-6):
+        problemas.append("coocorrência")
+    if not np.array_equal(incremental.compradores[colunas], completo.compradores):
+        problemas.append("compradores por produto")
+    return problemas
+
+def campanha(modelo, produtos: List[str], pool, blocos: int, limite: int) -> Dict:
+    """Mesma divisão em blocos do GerenciadorRecomendacoes; sem pool, pontua em série"""
+    from services.recomendacoes import combinar_campanha, pontuar_bloco
+    ids, blocos = modelo.blocos_campanha(produtos, blocos)
+    mapear = pool.map if pool is not None else map
+    resultados = list(mapear(pontuar_bloco, *zip(*blocos), [limite] * len(blocos)))
+    return combinar_campanha(produtos, ids, resultados, limite)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clientes", type=lambda s: int(float(s)), default=1000000)
+    parser.add_argument("--alteracoes", type=int, default=1000, help="Tamanho de cada tipo de alteração do lote")
+    parser.add_argument("--consultas", type=int, default=2000)
+    parser.add_argument("--processos", default="0,1,2,4", type=lambda s: [int(p) for p in s.split(",")])
+    parser.add_argument("--limite", type=int, default=100, help="Clientes por produto na campanha")
+    parser.add_argument("--limite-ms", type=float, default=20.0, help="p99 máximo das consultas com índice")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args(argv)
+    rnd = random.Random(args.semente)
+    falhas = 0
+
+    # Os documentos são gerados antes para que a carga meça só o modelo
+    clientes = list(_clientes(args.clientes, args.semente, {}, set()))
+    historico = list(_historico(args.clientes, args.semente, {}))
+    modelo = _modelo()
+    inicio = time.perf_counter()
+    modelo._montar(clientes, historico)
+    carga = time.perf_counter() - inicio
+    del clientes, historico
+    inicio = time.perf_counter()
+    modelo.indexar()
+    indexacao = time.perf_counter() - inicio
+    matriz = modelo.matriz
+    print(f"Carga de {len(modelo)} clientes x {len(modelo.produtos)} produtos ({matriz.nnz} pares): {carga:.2f}s")
+    print(f"  matriz: {(matriz.data.nbytes + matriz.indices.nbytes + matriz.indptr.nbytes) / 2 ** 20:.1f} MiB; "
+          f"índice de {len(modelo.produtos)} produtos: {indexacao:.2f}s")
+
+    ids = [f"c{rnd.randint(1, args.clientes):08d}" for _ in range(args.consultas)]
+    produtos = [(rnd.choice(modelo.produtos), 100) for _ in range(args.consultas)]
+    por_cliente = _latencias(modelo.produtos_para_cliente, [(i, 10) for i in ids])
+    por_produto = _latencias(modelo.clientes_para_produto, produtos)
+    modelo._indice = {}
+    sem_indice = _latencias(modelo.clientes_para_produto, [(p, 100) for p in modelo.produtos])
+    print(f"Produtos para o cliente: {por_cliente}")
+    print(f"Clientes para o produto (índice): {por_produto}")
+    print(f"Clientes para o produto (sem índice, 1ª consulta): {sem_indice}")
+    for nome, medida in (("produtos para o cliente", por_cliente), ("clientes para o produto", por_produto)):
+        if medida["p99_ms"] > args.limite_ms:
+            print(f"  LENTO: {nome} p99 {medida['p99_ms']}ms > {args.limite_ms}ms")
+            falhas += 1
+
+    # Lote de alterações: o mesmo estado final também é carregado do zero para conferir
+    from benchmarks.gerador import PRODUTOS
+    existentes = rnd.sample(range(1, args.clientes + 1), 3 * args.alteracoes)
+    alterados = {
+        f"c{n:08d}": {"_id": n, "id": f"c{n:08d}", "ultima_compra": {"produto": rnd.choice(PRODUTOS)[0]}}
+        for n in existentes[:args.alteracoes]
+    }
+    removidos = {f"c{n:08d}": n for n in existentes[args.alteracoes:2 * args.alteracoes]}
+    novas_compras = {(f"c{n:08d}", rnd.choice(PRODUTOS)[0]): 1 for n in existentes[2 * args.alteracoes:]}
+    novos = [
+        {"_id": n, "id": f"c{n:08d}", "ultima_compra": {"produto": rnd.choice(PRODUTOS)[0]}}
+        for n in range(args.clientes + 1, args.clientes + args.alteracoes + 1)
+    ]
+    for doc in novos:
+        novas_compras[(doc["id"], rnd.choice(PRODUTOS)[0])] = 2
+    afetados = set(alterados) | {cliente_id for cliente_id, _ in novas_compras}
+    historico_afetados = list(_historico(args.clientes, args.semente, novas_compras, afetados))
+    inicio = time.perf_counter()
+    with modelo._trava:
+        modelo._aplicar(list(alterados.values()) + novos, historico_afetados, list(removidos.values()))
+    incremental = time.perf_counter() - inicio
+    print(f"Sincronização incremental ({args.alteracoes} alterados, novos, removidos e com compras): "
+          f"{incremental * 1000:.1f}ms")
+
+    completo = _modelo()
+    completo._montar(
+        list(_clientes(args.clientes, args.semente, alterados, set(removidos))) + novos,
+        _historico(args.clientes, args.semente, novas_compras),
+    )
+    divergencias = _divergencias(modelo, completo)
+    print("  igual à carga completa" if not divergencias else f"  DIVERGE da carga completa: {divergencias}")
+    falhas += bool(divergencias)
+    del completo
+
+    referencia = None
+    for processos in args.processos:
+        pool = None
+        if processos:
+            pool = ProcessPoolExecutor(processos, mp_context=multiprocessing.get_context("spawn"))
+            # Aquece os processos (importações) fora da medição
+            list(pool.map(abs, range(processos)))
+        inicio = time.perf_counter()
+        resultado = campanha(modelo, modelo.produtos, pool, max(processos, 1) * 4, args.limite)
+        duracao = time.perf_counter() - inicio
+        if pool is not None:
+            pool.shutdown()
+        referencia = referencia or resultado
+        igual = resultado == referencia
+        print(f"Campanha com {len(modelo.produtos)} produtos, processos={processos}: {duracao:.3f}s, "
+              f"{resultado['clientes_atribuidos']} clientes atribuídos{'' if igual else ' (RESULTADO DIFERENTE)'}")
+        falhas += not igual
+
+    print("Recomendações ok." if not falhas else f"{falhas} verificação(ões) falharam.")
+    return 1 if falhas else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
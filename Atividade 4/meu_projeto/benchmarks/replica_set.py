@@ -0,0 +1,92 @@
+"""Replica set local de três membros para benchmarks e testes de leitura
+
+Uso:
+    from benchmarks.replica_set import replica_set_local
+    with replica_set_local() as uri:
+        ...  # MONGO_URI=uri
+
+Sobe três mongod (o binário vem de --mongod ou do PATH) em pastas temporárias,
+inicia o replica set com o primeiro membro preferido como primário e espera os
+dois secundários ficarem prontos. Tudo é encerrado e apagado na saída.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Iterator, Sequence
+
+PORTAS_PADRAO = (27117, 27118, 27119)
+NOME_PADRAO = "rs_benchmark"
+
+
+def _esperar(condicao, tempo_max_s: float, descricao: str) -> None:
+    limite = time.monotonic() + tempo_max_s
+    while time.monotonic() < limite:
+        try:
+            if condicao():
+                return
+        except Exception:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"Tempo esgotado esperando {descricao}")
+
+
+def membro(porta: int):
+    """Conexão direta com um membro (para serverStatus por servidor)"""
+    from pymongo import MongoClient
+    return MongoClient("127.0.0.1", porta, directConnection=True, serverSelectionTimeoutMS=1000)
+
+
+def _admin(porta: int, *comando):
+    with membro(porta) as cliente:
+        return cliente.admin.command(*comando)
+
+
+@contextmanager
+def replica_set_local(
+    portas: Sequence[int] = PORTAS_PADRAO, mongod: str = "mongod", nome: str = NOME_PADRAO, tempo_max_s: float = 60
+) -> Iterator[str]:
+    pasta = tempfile.mkdtemp(prefix="replica_set_")
+    processos = []
+    try:
+        for porta in portas:
+            dados = os.path.join(pasta, str(porta))
+            os.makedirs(dados)
+            processos.append(subprocess.Popen(
+                [
+                    mongod, "--replSet", nome, "--port", str(porta), "--dbpath", dados,
+                    "--bind_ip", "127.0.0.1", "--oplogSize", "256",
+                    "--logpath", os.path.join(pasta, f"{porta}.log"),
+                ],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.STDOUT,
+            ))
+        for porta in portas:
+            _esperar(lambda: _admin(porta, "ping"), tempo_max_s, f"mongod na porta {porta}")
+
+        _admin(portas[0], "replSetInitiate", {
+            "_id": nome,
+            "members": [
+                {"_id": i, "host": f"127.0.0.1:{porta}", "priority": 2 if i == 0 else 1}
+                for i, porta in enumerate(portas)
+            ],
+        })
+
+        def pronto() -> bool:
+            estados = [m["stateStr"] for m in _admin(portas[0], "replSetGetStatus")["members"]]
+            return estados[0] == "PRIMARY" and all(e == "SECONDARY" for e in estados[1:])
+        _esperar(pronto, tempo_max_s, "primário e secundários do replica set")
+
+        hosts = ",".join(f"127.0.0.1:{porta}" for porta in portas)
+        yield f"mongodb://{hosts}/?replicaSet={nome}"
+    finally:
+        for processo in processos:
+            processo.terminate()
+        for processo in processos:
+            try:
+                processo.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                processo.kill()
+        shutil.rmtree(pasta, ignore_errors=True)
@@ -0,0 +1,108 @@
+"""Teste de carga do controle de admissão: CRUD estável com as análises sobrecarregadas
+
+Uso (a partir de meu_projeto, com um mongod local):
+    python -m benchmarks.sobrecarga --clientes 200000 --rajada 64
+
+Mede o p50/p99 de GET /clientes/{id} sozinho e depois durante uma rajada de
+requisições de dashboard muito maior que o orçamento de análises. Durante a
+rajada, as análises excedentes devem receber 503 (com Retry-After) e o p99 do
+CRUD deve ficar próximo do medido sem carga. Sai com código 1 se o p99 sob
+carga passar de --fator vezes o p99 de referência.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+from benchmarks.executar import BANCO_PADRAO, _percentil, carregar_dados
+
+async def _latencias_crud(http, quantidade: int, amostras: int) -> List[float]:
+    latencias = []
+    for i in range(amostras):
+        inicio = time.perf_counter()
+        resposta = await http.get(f"/clientes/c{(i * 7919) % quantidade + 1:08d}")
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        if resposta.status_code != 200:
+            raise RuntimeError(f"CRUD respondeu {resposta.status_code}: {resposta.text}")
+    return latencias
+
+def _resumo(latencias: List[float]) -> Dict[str, float]:
+    return {"p50_ms": round(statistics.median(latencias), 3), "p99_ms": round(_percentil(latencias, 99), 3)}
+
+async def executar(args) -> Dict[str, Any]:
+    import httpx
+    from main import app, lifespan
+
+    async with lifespan(app):
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://carga", timeout=None) as http:
+            referencia = await _latencias_crud(http, args.clientes, args.amostras)
+
+            status = Counter()
+            parar = asyncio.Event()
+
+            async def analista():
+                while not parar.is_set():
+                    resposta = await http.get("/clientes/analise/dashboard")
+                    status[resposta.status_code] += 1
+                    if resposta.status_code == 503:
+                        # Respeitaria o Retry-After; aqui só cede o loop para manter a pressão
+                        await asyncio.sleep(0.01)
+
+            rajada = [asyncio.create_task(analista()) for _ in range(args.rajada)]
+            await asyncio.sleep(0.5)
+            sob_carga = await _latencias_crud(http, args.clientes, args.amostras)
+            parar.set()
+            await asyncio.gather(*rajada)
+            limitadores = {classe: l.estatisticas() for classe, l in app.state.limitadores.items()}
+
+    return {
+        "crud_referencia": _resumo(referencia),
+        "crud_sob_carga": _resumo(sob_carga),
+        "analises_status": dict(status),
+        "limitadores": limitadores,
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clientes", type=int, default=100000)
+    parser.add_argument("--rajada", type=int, default=64, help="Requisições de dashboard simultâneas")
+    parser.add_argument("--amostras", type=int, default=300, help="Requisições de CRUD por medição")
+    parser.add_argument("--fator", type=float, default=3.0, help="p99 sob carga aceito, em múltiplos da referência")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--banco", default=BANCO_PADRAO)
+    args = parser.parse_args(argv)
+
+    # As configurações são lidas uma única vez; o banco precisa vir antes
+    os.environ["MONGO_DB"] = args.banco
+    os.environ["CACHE_ANALISES_TTL_SEGUNDOS"] = "0"
+    os.environ["CACHE_CLIENTES_TTL_SEGUNDOS"] = "0"
+    from config import get_settings
+    from database import criar_cliente_mongo
+
+    settings = get_settings()
+    cliente = criar_cliente_mongo(settings)
+    try:
+        carregar_dados(cliente[settings.mongo_db], args.clientes, args.semente)
+        resultado = asyncio.run(executar(args))
+    finally:
+        cliente.drop_database(args.banco)
+        cliente.close()
+
+    referencia, carga = resultado["crud_referencia"], resultado["crud_sob_carga"]
+    print(f"CRUD sem carga: p50={referencia['p50_ms']}ms p99={referencia['p99_ms']}ms")
+    print(f"CRUD com {args.rajada} dashboards simultâneos: p50={carga['p50_ms']}ms p99={carga['p99_ms']}ms")
+    print(f"Respostas das análises: {resultado['analises_status']}")
+    for classe, estatisticas in resultado["limitadores"].items():
+        print(f"  {classe}: {estatisticas}")
+    if carga["p99_ms"] > referencia["p99_ms"] * args.fator:
+        print(f"p99 do CRUD sob carga passou de {args.fator}x a referência.")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
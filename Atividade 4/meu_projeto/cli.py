@@ -0,0 +1,153 @@
+"""Comandos de manutenção do banco (executados fora da API, com o cliente síncrono)
+
+Uso:
+    python cli.py rollups reconstruir [--sem-verificar] [--empresa ID]
+    python cli.py rollups verificar [--empresa ID]
+    python cli.py analise paridade [--empresa ID]
+    python cli.py migrar [nome] [--lote 1000] [--reiniciar]
+    python cli.py busca explicar "termo" [--modo prefixo|texto] [--empresa ID]
+    python cli.py pipelines explicar [nome ...] [--empresa ID]
+    python cli.py recomendacoes historico [--empresa ID]
+
+Sem --empresa, a reconstrução cobre todas as empresas e as verificações usam a
+EMPRESA_PADRAO.
+"""
+import argparse
+import sys
+
+from config import get_settings
+from database import criar_cliente_mongo, configurar_indices
+import migracoes
+from services import busca, registro_pipelines, rollups
+from services.empresas import colecao_clientes, empresa_padrao
+
+
+def cmd_rollups(args, db) -> int:
+    if args.acao == "reconstruir":
+        rollups.reconstruir_rollups(db, args.empresa)
+        print("Rollups reconstruídos.")
+        if args.sem_verificar:
+            return 0
+    divergencias = rollups.verificar_rollups(db, args.empresa)
+    for divergencia in divergencias:
+        print(divergencia)
+    print(f"{len(divergencias)} divergência(s) entre rollups e agregações ao vivo.")
+    return 1 if divergencias else 0
+
+
+def cmd_analise(args, db) -> int:
+    from services.analise_vetorizada import verificar_paridade
+    divergencias = verificar_paridade(db, empresa_id=args.empresa)
+    for divergencia in divergencias:
+        print(divergencia)
+    print(f"{len(divergencias)} divergência(s) entre a análise vetorizada e os pipelines.")
+    return 1 if divergencias else 0
+
+
+def cmd_migrar(args, db) -> int:
+    if args.listar:
+        for estado in migracoes.estado_migracoes(db):
+            print(estado)
+        return 0
+    selecionadas = [m for m in migracoes.MIGRACOES if args.nome in (None, m.nome)]
+    if not selecionadas:
+        print(f"Migração desconhecida: {args.nome}")
+        return 1
+    for migracao in selecionadas:
+        alterados = migracoes.executar_migracao(db, migracao, args.lote, args.reiniciar)
+        print(f"{migracao.nome}: {alterados} documento(s) alterado(s).")
+    return 0
+
+
+def cmd_busca(args, db) -> int:
+    empresa_id = args.empresa or empresa_padrao()
+    filtro = busca.filtro_texto(args.termo) if args.modo == "texto" else busca.filtro_prefixo(args.termo)
+    filtro = {"empresa_id": empresa_id, **filtro}
+    plano = db[colecao_clientes(empresa_id)].find(filtro).limit(20).explain()["queryPlanner"]["winningPlan"]
+    estagios = []
+    while plano:
+        estagios.append(plano.get("stage"))
+        plano = plano.get("inputStage") or (plano.get("inputStages") or [None])[0]
+    print(" <- ".join(str(e) for e in estagios))
+    return 1 if "COLLSCAN" in estagios else 0
+
+
+def cmd_pipelines(args, db) -> int:
+    empresa_id = args.empresa or empresa_padrao()
+    nomes = args.nomes or list(registro_pipelines.REGISTRO)
+    com_alertas = 0
+    for nome in nomes:
+        resultado = registro_pipelines.explicar(db, nome, empresa_id)
+        aceitos = f" (aceitos: {', '.join(resultado['alertas_aceitos'])})" if resultado["alertas_aceitos"] else ""
+        print(
+            f"{resultado['pipeline']}: {' <- '.join(resultado['estagios_plano'])} | "
+            f"docs={resultado['docs_examinados']} chaves={resultado['chaves_examinadas']} "
+            f"tempo={resultado['tempo_ms']}ms{aceitos}"
+        )
+        for alerta in resultado["alertas"]:
+            print(f"  ALERTA {alerta}")
+        com_alertas += bool(resultado["alertas"])
+    print(f"{com_alertas} pipeline(s) com alertas.")
+    return 1 if com_alertas else 0
+
+
+def cmd_recomendacoes(args, db) -> int:
+    from services.recomendacoes import reconstruir_historico
+    reconstruir_historico(db, args.empresa)
+    print("Histórico de compras por cliente e produto reconstruído.")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Manutenção do banco de clientes")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_rollups = sub.add_parser("rollups", help="Reconstrói ou verifica os rollups dos relatórios")
+    p_rollups.add_argument("acao", choices=["reconstruir", "verificar"])
+    p_rollups.add_argument("--sem-verificar", action="store_true", help="Não compara com as agregações ao vivo")
+    p_rollups.add_argument("--empresa", help="Restringe a uma empresa")
+    p_rollups.set_defaults(func=cmd_rollups)
+
+    p_analise = sub.add_parser("analise", help="Verifica a análise vetorizada contra os pipelines do MongoDB")
+    p_analise.add_argument("acao", choices=["paridade"])
+    p_analise.add_argument("--empresa", help="Empresa verificada (padrão: EMPRESA_PADRAO)")
+    p_analise.set_defaults(func=cmd_analise)
+
+    p_migrar = sub.add_parser("migrar", help="Executa migrações de dados retomáveis")
+    p_migrar.add_argument("nome", nargs="?", help="Executa apenas esta migração")
+    p_migrar.add_argument("--lote", type=int, default=1000)
+    p_migrar.add_argument("--reiniciar", action="store_true", help="Ignora o progresso salvo")
+    p_migrar.add_argument("--listar", action="store_true", help="Mostra o estado das migrações")
+    p_migrar.set_defaults(func=cmd_migrar)
+
+    p_busca = sub.add_parser("busca", help="Mostra o plano de execução da busca por nome")
+    p_busca.add_argument("acao", choices=["explicar"])
+    p_busca.add_argument("termo")
+    p_busca.add_argument("--modo", choices=["prefixo", "texto"], default="prefixo")
+    p_busca.add_argument("--empresa", help="Empresa da consulta (padrão: EMPRESA_PADRAO)")
+    p_busca.set_defaults(func=cmd_busca)
+
+    p_pipelines = sub.add_parser("pipelines", help="Explain dos pipelines registrados (COLLSCAN, SORT em memória)")
+    p_pipelines.add_argument("acao", choices=["explicar"])
+    p_pipelines.add_argument("nomes", nargs="*", help="Pipelines verificados (padrão: todos)")
+    p_pipelines.add_argument("--empresa", help="Empresa da consulta (padrão: EMPRESA_PADRAO)")
+    p_pipelines.set_defaults(func=cmd_pipelines)
+
+    p_recomendacoes = sub.add_parser("recomendacoes", help="Reconstrói as compras por cliente e produto dos eventos")
+    p_recomendacoes.add_argument("acao", choices=["historico"])
+    p_recomendacoes.add_argument("--empresa", help="Restringe a uma empresa")
+    p_recomendacoes.set_defaults(func=cmd_recomendacoes)
+
+    args = parser.parse_args(argv)
+    settings = get_settings()
+    client = criar_cliente_mongo(settings)
+    try:
+        db = client[settings.mongo_db]
+        configurar_indices(db)
+        return args.func(args, db)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
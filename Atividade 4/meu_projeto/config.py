@@ -0,0 +1,128 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+@dataclass(frozen=True)
+class Settings:
+    mongo_uri: str
+    mongo_db: str
+    mongo_max_pool_size: int
+    mongo_min_pool_size: int
+    mongo_max_idle_time_ms: int
+    mongo_wait_queue_timeout_ms: int
+    mongo_connect_timeout_ms: int
+    mongo_server_selection_timeout_ms: int
+    mongo_socket_timeout_ms: int
+    paginacao_limite_padrao: int
+    paginacao_limite_max: int
+    stream_batch_size: int
+    importacao_tamanho_lote: int
+    importacao_max_erros: int
+    cache_analises_ttl_segundos: float
+    cache_analises_max_entradas: int
+    compras_max_lote: int
+    consulta_lenta_ms: float
+    busca_fuzzy: bool
+    busca_similaridade_min: float
+    pipelines_campos_derivados: bool
+    respostas_rapidas: bool
+    validar_respostas: bool
+    agrupar_buscas_janela_ms: float
+    batch_get_max_ids: int
+    cache_clientes_ttl_segundos: float
+    cache_clientes_max_entradas: int
+    cache_clientes_redis_url: str
+    relatorios_dir: str
+    relatorios_processos: int
+    relatorios_lease_s: float
+    empresa_padrao: str
+    empresas_dedicadas: Tuple[str, ...]
+    admissao_analises_concorrencia: int
+    admissao_analises_fila: int
+    admissao_crud_concorrencia: int
+    admissao_crud_fila: int
+    admissao_espera_max_ms: float
+    analises_max_time_ms: int
+    leituras_analises: str
+    leituras_analises_max_atraso_s: int
+    recomendacoes_sincronizacao_s: float
+    recomendacoes_processos: int
+    recomendacoes_indice_max: int
+    recomendacoes_max_empresas: int
+    recomendacoes_ociosa_s: float
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """Lê as configurações a partir das variáveis de ambiente (ou do .env)"""
+    return Settings(
+        mongo_uri=os.getenv("MONGO_URI", "mongodb://localhost:27017"),
+        mongo_db=os.getenv("MONGO_DB", "clientes_db"),
+        mongo_max_pool_size=int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+        mongo_min_pool_size=int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+        mongo_max_idle_time_ms=int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000")),
+        mongo_wait_queue_timeout_ms=int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000")),
+        mongo_connect_timeout_ms=int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+        mongo_server_selection_timeout_ms=int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+        mongo_socket_timeout_ms=int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000")),
+        paginacao_limite_padrao=int(os.getenv("PAGINACAO_LIMITE_PADRAO", "50")),
+        paginacao_limite_max=int(os.getenv("PAGINACAO_LIMITE_MAX", "500")),
+        stream_batch_size=int(os.getenv("STREAM_BATCH_SIZE", "1000")),
+        importacao_tamanho_lote=int(os.getenv("IMPORTACAO_TAMANHO_LOTE", "1000")),
+        importacao_max_erros=int(os.getenv("IMPORTACAO_MAX_ERROS", "1000")),
+        cache_analises_ttl_segundos=float(os.getenv("CACHE_ANALISES_TTL_SEGUNDOS", "60")),
+        cache_analises_max_entradas=int(os.getenv("CACHE_ANALISES_MAX_ENTRADAS", "256")),
+        compras_max_lote=int(os.getenv("COMPRAS_MAX_LOTE", "10000")),
+        consulta_lenta_ms=float(os.getenv("CONSULTA_LENTA_MS", "100")),
+        busca_fuzzy=os.getenv("BUSCA_FUZZY", "false").lower() in ("1", "true", "sim"),
+        busca_similaridade_min=float(os.getenv("BUSCA_SIMILARIDADE_MIN", "0.3")),
+        # Ative depois de executar a migração 0002_campos_derivados
+        pipelines_campos_derivados=os.getenv("PIPELINES_CAMPOS_DERIVADOS", "false").lower() in ("1", "true", "sim"),
+        # Listagens e relatórios serializados direto com orjson, sem passar pelo response_model
+        respostas_rapidas=os.getenv("RESPOSTAS_RAPIDAS", "false").lower() in ("1", "true", "sim"),
+        # Em debug/testes, valida as respostas rápidas contra o modelo antes de enviar
+        validar_respostas=os.getenv("VALIDAR_RESPOSTAS", "false").lower() in ("1", "true", "sim"),
+        # Janela para juntar GET /clientes/{id} concorrentes em uma consulta; 0 desativa
+        agrupar_buscas_janela_ms=float(os.getenv("AGRUPAR_BUSCAS_JANELA_MS", "2")),
+        batch_get_max_ids=int(os.getenv("BATCH_GET_MAX_IDS", "1000")),
+        # TTL 0 desativa o cache de clientes; com REDIS_URL o cache é compartilhado entre workers
+        cache_clientes_ttl_segundos=float(os.getenv("CACHE_CLIENTES_TTL_SEGUNDOS", "30")),
+        cache_clientes_max_entradas=int(os.getenv("CACHE_CLIENTES_MAX_ENTRADAS", "10000")),
+        cache_clientes_redis_url=os.getenv("CACHE_CLIENTES_REDIS_URL", ""),
+        relatorios_dir=os.getenv("RELATORIOS_DIR", "relatorios_gerados"),
+        relatorios_processos=int(os.getenv("RELATORIOS_PROCESSOS", "2")),
+        # Prazo de um job em execução; o heartbeat o renova e, vencido, outro processo retoma o job
+        relatorios_lease_s=float(os.getenv("RELATORIOS_LEASE_S", "60")),
+        # Empresa usada quando a requisição não informa X-Empresa-Id
+        empresa_padrao=os.getenv("EMPRESA_PADRAO", "padrao"),
+        # Empresas grandes com coleção de clientes própria (separadas por vírgula)
+        empresas_dedicadas=tuple(e.strip() for e in os.getenv("EMPRESAS_DEDICADAS", "").split(",") if e.strip()),
+        # Requisições simultâneas e fila de espera por classe de rota; concorrência 0 desativa o limite
+        admissao_analises_concorrencia=int(os.getenv("ADMISSAO_ANALISES_CONCORRENCIA", "4")),
+        admissao_analises_fila=int(os.getenv("ADMISSAO_ANALISES_FILA", "16")),
+        admissao_crud_concorrencia=int(os.getenv("ADMISSAO_CRUD_CONCORRENCIA", "64")),
+        admissao_crud_fila=int(os.getenv("ADMISSAO_CRUD_FILA", "256")),
+        admissao_espera_max_ms=float(os.getenv("ADMISSAO_ESPERA_MAX_MS", "2000")),
+        # maxTimeMS das agregações da API: o servidor interrompe pipelines descontrolados (0 = sem limite)
+        analises_max_time_ms=int(os.getenv("ANALISES_MAX_TIME_MS", "30000")),
+        # Preferência de leitura dos relatórios (primary, primaryPreferred, secondaryPreferred ou nearest);
+        # CRUD e escritas sempre vão ao primário. Atraso máximo de réplica: 0 = sem limite, senão >= 90 s
+        leituras_analises=os.getenv("LEITURAS_ANALISES", "secondaryPreferred"),
+        leituras_analises_max_atraso_s=int(os.getenv("LEITURAS_ANALISES_MAX_ATRASO_S", "90")),
+        # Intervalo da sincronização incremental dos modelos de recomendação (0 = só a carga inicial)
+        recomendacoes_sincronizacao_s=float(os.getenv("RECOMENDACOES_SINCRONIZACAO_S", "10")),
+        # Processos que pontuam as campanhas; 0 pontua em threads do próprio processo (melhor com 1 CPU)
+        recomendacoes_processos=int(os.getenv("RECOMENDACOES_PROCESSOS", "2")),
+        # Melhores clientes guardados no índice de cada produto
+        recomendacoes_indice_max=int(os.getenv("RECOMENDACOES_INDICE_MAX", "1000")),
+        # Modelos mantidos em memória (os menos usados saem primeiro) e tempo sem consultas
+        # depois do qual o modelo de uma empresa é descartado (0 = nunca)
+        recomendacoes_max_empresas=int(os.getenv("RECOMENDACOES_MAX_EMPRESAS", "32")),
+        recomendacoes_ociosa_s=float(os.getenv("RECOMENDACOES_OCIOSA_S", "900")),
+    )
@@ -0,0 +1,72 @@
+"""Leitura das próprias escritas entre requisições (sessões causais do MongoDB)
+
+As leituras analíticas podem ir para secundários atrasados. Um cliente que
+precisa ver o que acabou de gravar envia o cabeçalho X-Consistencia-Causal:
+"1" na primeira requisição e, nas seguintes, o token devolvido pela resposta
+anterior no mesmo cabeçalho. A requisição roda em uma sessão causal adiantada
+até esse token, e o servidor (inclusive um secundário) só responde depois de
+aplicar as operações até ali (afterClusterTime).
+"""
+import base64
+import binascii
+from typing import Any, Dict
+
+import bson
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+CABECALHO = "X-Consistencia-Causal"
+
+
+def codificar_token(sessao) -> str:
+    """operationTime e clusterTime (assinado) da sessão em um token opaco"""
+    bruto = bson.encode({"operationTime": sessao.operation_time, "clusterTime": sessao.cluster_time})
+    return base64.urlsafe_b64encode(bruto).decode().rstrip("=")
+
+
+def decodificar_token(token: str) -> Dict[str, Any]:
+    if token == "1":
+        return {}
+    try:
+        tempos = bson.decode(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (binascii.Error, bson.errors.BSONError, ValueError):
+        raise ValueError(f"{CABECALHO} inválido")
+    if not isinstance(tempos.get("operationTime"), bson.Timestamp):
+        raise ValueError(f"{CABECALHO} inválido")
+    return tempos
+
+
+async def sessao_causal(request: Request, call_next):
+    """Middleware HTTP: abre a sessão causal pedida pelo cabeçalho e devolve o novo token"""
+    token = request.headers.get(CABECALHO)
+    if not token:
+        return await call_next(request)
+    try:
+        tempos = decodificar_token(token)
+    except ValueError as e:
+        return JSONResponse({"detail": str(e)}, status_code=400)
+    sessao = await request.app.state.db.client.start_session(causal_consistency=True)
+    if tempos.get("clusterTime"):
+        sessao.advance_cluster_time(tempos["clusterTime"])
+    if tempos:
+        sessao.advance_operation_time(tempos["operationTime"])
+    request.state.sessao = sessao
+    try:
+        response = await call_next(request)
+    except BaseException:
+        await sessao.end_session()
+        raise
+    if sessao.operation_time is not None:
+        response.headers[CABECALHO] = codificar_token(sessao)
+    # Respostas em streaming continuam lendo pela sessão enquanto enviam
+    corpo = response.body_iterator
+
+    async def corpo_com_sessao():
+        try:
+            async for parte in corpo:
+                yield parte
+        finally:
+            await sessao.end_session()
+
+    response.body_iterator = corpo_com_sessao()
+    return response
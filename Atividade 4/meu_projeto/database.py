@@ -0,0 +1,230 @@
+import threading
+from typing import Any, Dict, Iterable, List, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import MongoClient
+from pymongo.database import Database
+from pymongo import monitoring
+from pymongo.read_preferences import Nearest, PrimaryPreferred, ReadPreference, SecondaryPreferred
+
+from config import Settings, get_settings
+
+# Por quanto tempo as marcas de remoção ficam disponíveis para sincronização incremental
+REMOCOES_TTL_SEGUNDOS = 7 * 24 * 3600
+
+
+class MonitorPool(monitoring.ConnectionPoolListener):
+    """Coleta estatísticas do pool de conexões para diagnóstico"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.em_uso = 0
+        self.abertas = 0
+        self.checkouts = 0
+        self.falhas_checkout = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            media = self.espera_total / self.checkouts if self.checkouts else 0.0
+            return {
+                "conexoes_em_uso": self.em_uso,
+                "conexoes_abertas": self.abertas,
+                "checkouts": self.checkouts,
+                "falhas_checkout": self.falhas_checkout,
+                "espera_media_ms": round(media * 1000, 3),
+                "espera_max_ms": round(self.espera_max * 1000, 3),
+            }
+
+    def connection_checked_out(self, event):
+        espera = getattr(event, "duration", None) or 0.0
+        with self._lock:
+            self.em_uso += 1
+            self.checkouts += 1
+            self.espera_total += espera
+            self.espera_max = max(self.espera_max, espera)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.em_uso -= 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.falhas_checkout += 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.abertas += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.abertas -= 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+
+def opcoes_cliente(settings: Settings) -> Dict[str, Any]:
+    """Opções de pool e timeouts comuns aos clientes do MongoDB"""
+    return {
+        "maxPoolSize": settings.mongo_max_pool_size,
+        "minPoolSize": settings.mongo_min_pool_size,
+        "maxIdleTimeMS": settings.mongo_max_idle_time_ms,
+        "waitQueueTimeoutMS": settings.mongo_wait_queue_timeout_ms,
+        "connectTimeoutMS": settings.mongo_connect_timeout_ms,
+        "serverSelectionTimeoutMS": settings.mongo_server_selection_timeout_ms,
+        "socketTimeoutMS": settings.mongo_socket_timeout_ms,
+    }
+
+
+def criar_cliente_mongo(settings: Settings, listeners: Iterable = ()) -> MongoClient:
+    """Cria um cliente síncrono (usado por scripts e comandos de manutenção)"""
+    return MongoClient(settings.mongo_uri, event_listeners=list(listeners), **opcoes_cliente(settings))
+
+
+def criar_cliente_mongo_async(
+    settings: Settings, listeners: Iterable = ()
+) -> AsyncIOMotorClient:
+    """Cria o cliente assíncrono compartilhado do processo usado pela API"""
+    return AsyncIOMotorClient(settings.mongo_uri, event_listeners=list(listeners), **opcoes_cliente(settings))
+
+
+# Modos aceitos para as leituras analíticas; "secondary" fica de fora por não ter
+# o primário como reserva quando nenhum secundário está saudável
+MODOS_LEITURA_ANALISES = {
+    "primaryPreferred": PrimaryPreferred,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def preferencia_leitura_analises(settings: Settings):
+    """Preferência de leitura dos relatórios (pipelines, rollups e exportação)
+
+    Com secondaryPreferred, os secundários mais atrasados que
+    LEITURAS_ANALISES_MAX_ATRASO_S deixam de ser elegíveis e, sem nenhum
+    secundário saudável, a leitura volta ao primário. Em um servidor sem
+    replica set a preferência é ignorada.
+    """
+    if settings.leituras_analises == "primary":
+        return ReadPreference.PRIMARY
+    if settings.leituras_analises not in MODOS_LEITURA_ANALISES:
+        raise ValueError(f"LEITURAS_ANALISES inválido: {settings.leituras_analises}")
+    atraso = settings.leituras_analises_max_atraso_s
+    if 0 < atraso < 90:
+        raise ValueError("LEITURAS_ANALISES_MAX_ATRASO_S deve ser 0 (sem limite) ou pelo menos 90")
+    return MODOS_LEITURA_ANALISES[settings.leituras_analises](max_staleness=atraso or -1)
+
+
+def para_analises(colecao):
+    """A mesma coleção (motor ou pymongo) lida com a preferência das análises"""
+    preferencia = preferencia_leitura_analises(get_settings())
+    if preferencia == ReadPreference.PRIMARY:
+        return colecao
+    return colecao.with_options(read_preference=preferencia)
+
+
+def plano_indices() -> List[Tuple[str, List[Tuple[str, Any]], Dict[str, Any]]]:
+    """Índices de cada coleção: (coleção, chaves, opções)
+
+    Os índices das coleções de clientes começam por empresa_id, para que as
+    consultas de uma empresa percorram apenas a faixa do índice dessa empresa.
+    """
+    from services.empresas import colecoes_clientes
+    plano = []
+    for colecao in colecoes_clientes():
+        plano += [
+            (colecao, [("empresa_id", 1), ("id", 1)], {"unique": True}),
+            (colecao, [("empresa_id", 1), ("nome", "text")], {}),
+            (colecao, [("empresa_id", 1), ("atualizado_em", 1)], {}),
+            (colecao, [("empresa_id", 1), ("nome_normalizado", 1)], {}),
+            # Índices dos campos derivados (filtros e ordenações dos relatórios)
+            (colecao, [("empresa_id", 1), ("ultima_compra_em", 1)], {}),
+            (colecao, [("empresa_id", 1), ("faixa_etaria", 1), ("ultima_compra.valor", -1)], {}),
+            (colecao, [("empresa_id", 1), ("ultima_compra.valor", -1)], {}),
+            (colecao, [("empresa_id", 1), ("ultima_compra.produto", 1), ("ultima_compra.valor", 1)], {}),
+        ]
+    return plano + [
+        ("clientes_trigramas", [("empresa_id", 1), ("trigramas", 1)], {}),
+        ("clientes_removidos", [("removido_em", 1)], {"expireAfterSeconds": REMOCOES_TTL_SEGUNDOS}),
+        ("clientes_removidos", [("empresa_id", 1), ("removido_em", 1)], {}),
+        ("rollup_idade", [("empresa_id", 1)], {}),
+        ("rollup_idade_produto", [("empresa_id", 1)], {}),
+        ("rollup_produto", [("empresa_id", 1), ("total_vendas", -1), ("_id", 1)], {}),
+    ]
+
+
+# Índices anteriores à separação por empresa; o índice de texto sai antes da
+# criação (só pode haver um por coleção) e os demais depois dos substitutos
+INDICES_TEXTO_SUBSTITUIDOS = {"clientes": ["nome_text"]}
+INDICES_SUBSTITUIDOS = {
+    "clientes": [
+        "id_1", "atualizado_em_1", "nome_normalizado_1", "ultima_compra_em_1",
+        "faixa_etaria_1_ultima_compra.valor_-1", "ultima_compra.valor_-1",
+        "ultima_compra.produto_1_ultima_compra.valor_1",
+    ],
+    "clientes_trigramas": ["trigramas_1"],
+    "rollup_produto": ["total_vendas_-1__id_1"],
+}
+
+
+def remover_indices(db: Database, indices: Dict[str, List[str]]) -> None:
+    for colecao, nomes in indices.items():
+        existentes = db[colecao].index_information()
+        for nome in nomes:
+            if nome in existentes:
+                db[colecao].drop_index(nome)
+
+
+def configurar_indices(db: Database) -> None:
+    """Migração de inicialização: garante os índices das coleções de clientes"""
+    remover_indices(db, INDICES_TEXTO_SUBSTITUIDOS)
+    for colecao, chaves, opcoes in plano_indices():
+        db[colecao].create_index(chaves, **opcoes)
+    remover_indices(db, INDICES_SUBSTITUIDOS)
+
+
+def substituir_colecao(db: Database, temporaria: str, destino: str) -> None:
+    """Põe a coleção montada em ``temporaria`` no lugar de ``destino`` (rename com dropTarget)
+
+    Os índices de ``destino`` no plano são criados antes da troca, para que as
+    leituras nunca vejam a coleção vazia, pela metade ou sem índice.
+    """
+    if not db.list_collection_names(filter={"name": temporaria}):
+        db.create_collection(temporaria)
+    for colecao, chaves, opcoes in plano_indices():
+        if colecao == destino:
+            db[temporaria].create_index(chaves, **opcoes)
+    db[temporaria].rename(destino, dropTarget=True)
+
+
+async def remover_indices_async(db: AsyncIOMotorDatabase, indices: Dict[str, List[str]]) -> None:
+    for colecao, nomes in indices.items():
+        existentes = await db[colecao].index_information()
+        for nome in nomes:
+            if nome in existentes:
+                await db[colecao].drop_index(nome)
+
+
+async def configurar_indices_async(db: AsyncIOMotorDatabase) -> None:
+    """Mesma migração de índices, executada pelo cliente assíncrono da API"""
+    await remover_indices_async(db, INDICES_TEXTO_SUBSTITUIDOS)
+    for colecao, chaves, opcoes in plano_indices():
+        await db[colecao].create_index(chaves, **opcoes)
+    await remover_indices_async(db, INDICES_SUBSTITUIDOS)
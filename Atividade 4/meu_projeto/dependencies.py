@@ -1,19 +1,65 @@
-from pymongo import MongoClient
-from pymongo.database import Database
-from fastapi import Depends
-from typing import Generator
-from services.cliente_service import ClienteService
+from typing import Optional
+from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorDatabase
+from fastapi import Depends, Header, HTTPException, Request
+from config import get_settings
+from services.cliente_service_async import ClienteServiceAsync
+from services.compra_service import CompraServiceAsync
+from services.empresas import empresa_padrao, validar_empresa_id
+from services.recomendacoes import GerenciadorRecomendacoes
+from services.relatorios import FilaRelatorios
 
-def get_db() -> Generator[Database, None, None]:
-    client = MongoClient("mongodb://localhost:27017")
+def get_db(request: Request) -> AsyncIOMotorDatabase:
+    # Banco ligado ao pool compartilhado criado no lifespan da aplicação
+    return request.app.state.db
+
+def get_sessao(request: Request) -> Optional[AsyncIOMotorClientSession]:
+    # Aberta pelo middleware sessao_causal quando a requisição envia X-Consistencia-Causal
+    return getattr(request.state, "sessao", None)
+
+def get_empresa_id(request: Request, x_empresa_id: Optional[str] = Header(None)) -> str:
+    # Rotas /empresas/{empresa_id}/... têm precedência sobre o cabeçalho X-Empresa-Id
+    empresa_id = request.path_params.get("empresa_id") or x_empresa_id or empresa_padrao()
     try:
-        db = client["clientes_db"]
-        # Configura índices
-        db.clientes.create_index([("id", 1)], unique=True)
-        db.clientes.create_index([("nome", "text")])
-        yield db
-    finally:
-        client.close()
+        return validar_empresa_id(empresa_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def get_cliente_service(
+    request: Request,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    empresa_id: str = Depends(get_empresa_id),
+    sessao: Optional[AsyncIOMotorClientSession] = Depends(get_sessao),
+) -> ClienteServiceAsync:
+    settings = get_settings()
+    return ClienteServiceAsync(
+        db,
+        empresa_id,
+        cache=request.app.state.cache_analises,
+        indexar_trigramas=settings.busca_fuzzy,
+        similaridade_min=settings.busca_similaridade_min,
+        usar_campos_derivados=settings.pipelines_campos_derivados,
+        agrupador=request.app.state.agrupador_clientes,
+        cache_clientes=request.app.state.cache_clientes,
+        max_time_ms=settings.analises_max_time_ms,
+        sessao=sessao,
+    )
+
+def get_compra_service(
+    request: Request,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    empresa_id: str = Depends(get_empresa_id),
+    sessao: Optional[AsyncIOMotorClientSession] = Depends(get_sessao),
+) -> CompraServiceAsync:
+    return CompraServiceAsync(
+        db,
+        empresa_id,
+        cache=request.app.state.cache_analises,
+        max_time_ms=get_settings().analises_max_time_ms,
+        sessao=sessao,
+    )
+
+def get_fila_relatorios(request: Request) -> FilaRelatorios:
+    return request.app.state.fila_relatorios
 
-def get_cliente_service(db: Database = Depends(get_db)) -> ClienteService:
-    return ClienteService(db)
\ No newline at end of file
+def get_recomendacoes(request: Request) -> GerenciadorRecomendacoes:
+    return request.app.state.recomendacoes
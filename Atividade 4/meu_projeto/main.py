@@ -1,34 +1,124 @@
 import sys
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 # Adiciona o diretório pai ao path
 sys.path.append(str(Path(__file__).parent.parent))
 from fastapi import FastAPI
+from admissao import LimitadorAdmissao, controlar_admissao
+from config import get_settings
+from consistencia import sessao_causal
+from database import MonitorPool, criar_cliente_mongo, criar_cliente_mongo_async, configurar_indices_async, preferencia_leitura_analises
+from observabilidade import MonitorComandos, medir_requisicoes, metricas
+from services.agrupador import AgrupadorBuscas
+from services.cache import CacheAnalises
+from services.cache_clientes import BackendMemoria, BackendRedis, CacheClientes
+from services.cliente_service_async import PROJECAO_CLIENTE_VERSAO, buscar_clientes_por_chaves
+from services.compra_service import configurar_colecoes_compras
+from services.recomendacoes import GerenciadorRecomendacoes
+from services.relatorios import FilaRelatorios
 from routers.cliente_router import router as cliente_router
-from dependencies import get_db
+from routers.compra_router import router as compra_router
+from routers.diagnostico_router import router as diagnostico_router
+from routers.recomendacao_router import router as recomendacao_router
+from routers.relatorio_router import router as relatorio_router
+
+def criar_limitadores(settings):
+    limites = {
+        "analises": (settings.admissao_analises_concorrencia, settings.admissao_analises_fila),
+        "crud": (settings.admissao_crud_concorrencia, settings.admissao_crud_fila),
+    }
+    return {
+        classe: LimitadorAdmissao(classe, concorrencia, fila, settings.admissao_espera_max_ms)
+        for classe, (concorrencia, fila) in limites.items() if concorrencia > 0
+    }
+
+def criar_cache_clientes(settings):
+    if settings.cache_clientes_ttl_segundos <= 0:
+        return None
+    if settings.cache_clientes_redis_url:
+        # Dependência opcional, só necessária com o backend compartilhado
+        import redis.asyncio
+        backend = BackendRedis(redis.asyncio.from_url(settings.cache_clientes_redis_url))
+    else:
+        backend = BackendMemoria(settings.cache_clientes_max_entradas)
+    return CacheClientes(backend, settings.cache_clientes_ttl_segundos)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Um único cliente (e pool de conexões) por processo
+    settings = get_settings()
+    # Falha na inicialização, e não na primeira análise, se LEITURAS_ANALISES for inválido
+    preferencia_leitura_analises(settings)
+    monitor = MonitorPool()
+    client = criar_cliente_mongo_async(settings, [monitor, MonitorComandos(settings.consulta_lenta_ms)])
+    db = client[settings.mongo_db]
+    await configurar_indices_async(db)
+    await configurar_colecoes_compras(db)
+    app.state.monitor_pool = monitor
+    app.state.limitadores = criar_limitadores(settings)
+    app.state.cache_analises = CacheAnalises(
+        settings.cache_analises_ttl_segundos, settings.cache_analises_max_entradas
+    )
+    # Criado aqui para ficar preso ao event loop que atende as requisições
+    app.state.agrupador_clientes = None
+    if settings.agrupar_buscas_janela_ms > 0:
+        app.state.agrupador_clientes = AgrupadorBuscas(
+            lambda chaves: buscar_clientes_por_chaves(db, chaves, PROJECAO_CLIENTE_VERSAO),
+            janela_ms=settings.agrupar_buscas_janela_ms,
+            max_lote=settings.batch_get_max_ids,
+        )
+    app.state.cache_clientes = criar_cache_clientes(settings)
+    app.state.db = db
+    app.state.fila_relatorios = FilaRelatorios(
+        db, settings.relatorios_dir, settings.relatorios_processos, settings.relatorios_lease_s
+    )
+    await app.state.fila_relatorios.iniciar()
+    # Os modelos de recomendação carregam e sincronizam em threads, com o cliente síncrono
+    cliente_recomendacoes = criar_cliente_mongo(settings)
+    app.state.recomendacoes = GerenciadorRecomendacoes(
+        cliente_recomendacoes[settings.mongo_db],
+        settings.recomendacoes_sincronizacao_s,
+        settings.recomendacoes_processos,
+        settings.recomendacoes_indice_max,
+        settings.recomendacoes_max_empresas,
+        settings.recomendacoes_ociosa_s,
+    )
+    await app.state.recomendacoes.iniciar()
+    print("Conectado ao MongoDB!")
+    try:
+        yield
+    finally:
+        await app.state.fila_relatorios.encerrar()
+        await app.state.recomendacoes.encerrar()
+        cliente_recomendacoes.close()
+        client.close()
+        print("Conexão com MongoDB fechada.")
 
 app = FastAPI(
     title="API de Análise de Clientes",
     description="API para análise de dados de clientes e suas compras",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
+# A sessão causal só é aberta para requisições admitidas
+app.middleware("http")(sessao_causal)
+app.middleware("http")(controlar_admissao)
+# Registrado por último para envolver o controle de admissão (mede também os 503)
+app.middleware("http")(medir_requisicoes)
+app.add_route("/metrics", metricas, include_in_schema=False)
+
 # Inclui os routers
 app.include_router(cliente_router)
-
-@app.on_event("startup")
-async def startup_db_client():
-    # Inicializa a conexão com o banco de dados
-    db = next(get_db())
-    print("Conectado ao MongoDB!")
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    # Garante que a conexão será fechada
-    db = next(get_db())
-    db.client.close()
-    print("Conexão com MongoDB fechada.")
+app.include_router(compra_router)
+app.include_router(diagnostico_router)
+app.include_router(recomendacao_router)
+app.include_router(relatorio_router)
+# Mesmas rotas com a empresa no caminho (alternativa ao cabeçalho X-Empresa-Id)
+for router_empresa in (cliente_router, compra_router, recomendacao_router, relatorio_router):
+    app.include_router(router_empresa, prefix="/empresas/{empresa_id}")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
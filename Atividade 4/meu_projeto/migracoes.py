@@ -0,0 +1,266 @@
+"""Migrações de dados em lotes, retomáveis a partir do último _id processado
+
+O progresso de cada migração fica na coleção ``migracoes``; uma execução
+interrompida continua de onde parou na próxima chamada. As migrações de
+"clientes" percorrem todas as coleções de clientes (a compartilhada e as
+dedicadas), cada uma com o seu progresso.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError
+
+from config import get_settings
+from services import busca
+from services.derivados import campos_derivados, rotulo_faixa_etaria
+from services.empresas import colecao_clientes, colecoes_clientes, empresa_padrao
+
+
+@dataclass
+class Migracao:
+    nome: str
+    descricao: str
+    # Campos $set de cada documento (None quando nada muda)
+    converter: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]
+    projecao: Dict[str, int] = field(default_factory=dict)
+    # Chamado com os documentos de cada lote depois da gravação
+    apos_lote: Optional[Callable[[Database, List[Dict[str, Any]]], None]] = None
+    # Operador de atualização; $max/$min não sobrescrevem escritas concorrentes
+    operador: str = "$set"
+    colecao: str = "clientes"
+    # Em "clientes", percorre também as coleções dedicadas (colecoes_clientes)
+    dedicadas: bool = True
+    # Restringe os documentos percorridos; chamado na execução (depende da configuração)
+    filtro: Optional[Callable[[], Dict[str, Any]]] = None
+
+
+def _indexar_trigramas(db: Database, docs: List[Dict[str, Any]]) -> None:
+    operacoes = []
+    for doc in docs:
+        if not doc.get("nome"):
+            continue
+        empresa_id = doc.get("empresa_id") or empresa_padrao()
+        operacoes.append(UpdateOne(
+            {"_id": {"empresa_id": empresa_id, "id": doc["id"]}},
+            {"$set": {"empresa_id": empresa_id, "trigramas": busca.trigramas(doc["nome"])}},
+            upsert=True,
+        ))
+    if operacoes:
+        db[busca.COLECAO_TRIGRAMAS].bulk_write(operacoes, ordered=False)
+
+
+def _rechavear_trigramas(db: Database, docs: List[Dict[str, Any]]) -> None:
+    """Regrava os trigramas com _id (empresa, id) e apaga os de _id antigo (só o id)"""
+    _indexar_trigramas(db, docs)
+    db[busca.COLECAO_TRIGRAMAS].delete_many({"_id": {"$in": [doc["id"] for doc in docs]}})
+
+
+def _rechavear_resumo_compras(db: Database, docs: List[Dict[str, Any]]) -> None:
+    """Troca o _id do resumo de compras (cliente_id) por (empresa, cliente_id)"""
+    antigos = [doc for doc in docs if not isinstance(doc["_id"], dict)]
+    if not antigos:
+        return
+    empresa_id = empresa_padrao()
+    db.compras_cliente.bulk_write([
+        UpdateOne(
+            {"_id": {"empresa_id": empresa_id, "cliente_id": doc["_id"]}},
+            {
+                "$inc": {"frequencia": doc.get("frequencia", 0), "valor_total": doc.get("valor_total", 0)},
+                "$min": {"primeira_compra": doc.get("primeira_compra")},
+                "$max": {"ultima_compra": doc.get("ultima_compra")},
+                "$setOnInsert": {"empresa_id": empresa_id},
+            },
+            upsert=True,
+        )
+        for doc in antigos
+    ], ordered=False)
+    db.compras_cliente.delete_many({"_id": {"$in": [doc["_id"] for doc in antigos]}})
+
+
+def _mover_para_colecoes_dedicadas(db: Database, docs: List[Dict[str, Any]]) -> None:
+    """Copia os clientes das EMPRESAS_DEDICADAS para clientes__<empresa> e os apaga da compartilhada
+
+    O _id é mantido (as marcas de remoção continuam valendo). Se a coleção
+    dedicada já tiver o mesmo (empresa, id), gravado depois da mudança de
+    configuração, ele é o mais recente e fica; a cópia antiga só é apagada.
+    """
+    por_colecao: Dict[str, List[Dict[str, Any]]] = {}
+    for doc in docs:
+        por_colecao.setdefault(colecao_clientes(doc["empresa_id"]), []).append(doc)
+    for destino, movidos in por_colecao.items():
+        try:
+            db[destino].bulk_write(
+                [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in movidos], ordered=False
+            )
+        except BulkWriteError as e:
+            if any(erro["code"] != 11000 for erro in e.details["writeErrors"]):
+                raise
+    db.clientes.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+
+
+def _clientes_de_empresas_dedicadas() -> Dict[str, Any]:
+    return {"empresa_id": {"$in": list(get_settings().empresas_dedicadas)}}
+
+
+def _faixa_etaria(doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if doc.get("idade") is None:
+        return None
+    faixa = rotulo_faixa_etaria(doc["idade"])
+    return None if doc.get("faixa_etaria") == faixa else {"faixa_etaria": faixa}
+
+
+def _empresa_padrao(doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    return None if doc.get("empresa_id") else {"empresa_id": empresa_padrao()}
+
+
+MIGRACOES = [
+    Migracao(
+        nome="0001_nome_normalizado",
+        descricao="Preenche nome_normalizado e o índice de trigramas da busca por nome",
+        converter=lambda doc: campos_derivados({"nome": doc.get("nome")}) or None,
+        projecao={"nome": 1, "id": 1},
+        apos_lote=_indexar_trigramas,
+    ),
+    Migracao(
+        nome="0002_campos_derivados",
+        descricao="Preenche faixa_etaria e ultima_compra_em (data BSON) usados pelos pipelines e índices",
+        converter=lambda doc: campos_derivados(
+            {"idade": doc.get("idade"), "ultima_compra": doc.get("ultima_compra")}
+        ),
+        projecao={"idade": 1, "ultima_compra": 1},
+    ),
+    Migracao(
+        nome="0003_versao",
+        descricao="Inicia o campo versao (ETag e If-Match) nos clientes gravados antes dele",
+        converter=lambda doc: None if doc.get("versao") else {"versao": 1},
+        projecao={"versao": 1},
+        operador="$max",
+    ),
+    # Separação por empresa: os dados existentes passam a ser da EMPRESA_PADRAO.
+    # Depois delas, reconstrua os rollups (python cli.py rollups reconstruir).
+    Migracao(
+        nome="0004_empresa_clientes",
+        descricao="Atribui os clientes à empresa padrão e rechaveia os trigramas por (empresa, id)",
+        converter=_empresa_padrao,
+        projecao={"empresa_id": 1, "id": 1, "nome": 1},
+        apos_lote=_rechavear_trigramas,
+    ),
+    Migracao(
+        nome="0005_empresa_compras_cliente_diario",
+        descricao="Atribui os rollups diários de compras por cliente à empresa padrão",
+        converter=_empresa_padrao,
+        projecao={"empresa_id": 1},
+        colecao="compras_cliente_diario",
+    ),
+    Migracao(
+        nome="0006_empresa_compras_produto_diario",
+        descricao="Atribui os rollups diários de compras por produto à empresa padrão",
+        converter=_empresa_padrao,
+        projecao={"empresa_id": 1},
+        colecao="compras_produto_diario",
+    ),
+    Migracao(
+        nome="0007_empresa_compras_cliente",
+        descricao="Rechaveia o resumo de compras de cada cliente por (empresa, cliente_id)",
+        converter=lambda doc: None,
+        apos_lote=_rechavear_resumo_compras,
+        colecao="compras_cliente",
+    ),
+    # Ao incluir uma empresa em EMPRESAS_DEDICADAS, rode antes de reiniciar a API
+    # (as escritas da empresa passam a ir para a coleção dedicada); com --reiniciar
+    # a migração pode ser repetida para as empresas incluídas depois.
+    Migracao(
+        nome="0008_clientes_dedicados",
+        descricao="Move os clientes das EMPRESAS_DEDICADAS da coleção compartilhada para clientes__<empresa>",
+        converter=lambda doc: None,
+        apos_lote=_mover_para_colecoes_dedicadas,
+        dedicadas=False,
+        filtro=_clientes_de_empresas_dedicadas,
+    ),
+    # comportamento_idade v3 agrupa pelo faixa_etaria gravado; até o fim desta
+    # migração, clientes antigos aparecem com "Menor que 20"
+    Migracao(
+        nome="0009_rotulos_faixa_etaria",
+        descricao="Regrava faixa_etaria com os rótulos únicos (\"0-19\" e \"Outros\" para idades fora das faixas)",
+        converter=_faixa_etaria,
+        projecao={"idade": 1, "faixa_etaria": 1},
+    ),
+]
+
+
+def _alvos(migracao: Migracao) -> List[tuple]:
+    """(coleção, chave do progresso) de cada coleção percorrida pela migração"""
+    if migracao.colecao != "clientes" or not migracao.dedicadas:
+        return [(migracao.colecao, migracao.nome)]
+    # A compartilhada mantém a chave original (progresso gravado antes das dedicadas)
+    return [
+        (colecao, migracao.nome if colecao == "clientes" else f"{migracao.nome}@{colecao}")
+        for colecao in colecoes_clientes()
+    ]
+
+
+def executar_migracao(db: Database, migracao: Migracao, tamanho_lote: int = 1000, reiniciar: bool = False) -> int:
+    """Aplica a migração em lotes ordenados por _id; retorna quantos documentos mudaram"""
+    return sum(
+        _executar_em_colecao(db, migracao, colecao, chave, tamanho_lote, reiniciar)
+        for colecao, chave in _alvos(migracao)
+    )
+
+
+def _executar_em_colecao(
+    db: Database, migracao: Migracao, nome_colecao: str, chave: str, tamanho_lote: int, reiniciar: bool
+) -> int:
+    controle = db.migracoes
+    if reiniciar:
+        controle.delete_one({"_id": chave})
+    estado = controle.find_one({"_id": chave}) or {}
+    if estado.get("concluida"):
+        return 0
+
+    colecao = db[nome_colecao]
+    ultimo_id = estado.get("ultimo_id")
+    alterados = 0
+    while True:
+        filtro = dict(migracao.filtro()) if migracao.filtro else {}
+        if ultimo_id is not None:
+            filtro["_id"] = {"$gt": ultimo_id}
+        lote = list(colecao.find(filtro, migracao.projecao or None).sort("_id", 1).limit(tamanho_lote))
+        if not lote:
+            break
+        operacoes = []
+        for doc in lote:
+            campos = migracao.converter(doc)
+            if campos:
+                operacoes.append(UpdateOne({"_id": doc["_id"]}, {migracao.operador: campos}))
+        if operacoes:
+            alterados += colecao.bulk_write(operacoes, ordered=False).modified_count
+        if migracao.apos_lote:
+            migracao.apos_lote(db, lote)
+        ultimo_id = lote[-1]["_id"]
+        controle.update_one(
+            {"_id": chave},
+            {"$set": {"ultimo_id": ultimo_id, "atualizado_em": datetime.now(timezone.utc)},
+             "$inc": {"alterados": len(operacoes)}},
+            upsert=True,
+        )
+    controle.update_one(
+        {"_id": chave},
+        {"$set": {"concluida": True, "concluida_em": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+    return alterados
+
+
+def estado_migracoes(db: Database) -> List[Dict[str, Any]]:
+    estados = {doc["_id"]: doc for doc in db.migracoes.find()}
+    return [
+        {
+            "nome": m.nome, "colecao": colecao, "descricao": m.descricao,
+            **{k: v for k, v in estados.get(chave, {}).items() if k != "_id"},
+        }
+        for m in MIGRACOES
+        for colecao, chave in _alvos(m)
+    ]
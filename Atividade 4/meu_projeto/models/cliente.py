@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 
 class UltimaCompra(BaseModel):
     produto: str
@@ -20,4 +20,27 @@ class ClienteUpdate(BaseModel):
     ultima_compra: Optional[UltimaCompra] = None
 
 class ClienteResponse(ClienteBase):
-    ultima_compra: Optional[UltimaCompra] = None
\ No newline at end of file
+    ultima_compra: Optional[UltimaCompra] = None
+
+class ClientePagina(BaseModel):
+    itens: List[ClienteResponse]
+    next: Optional[str] = None  # Cursor opaco para a próxima página
+
+class BatchGetRequest(BaseModel):
+    ids: List[str] = Field(..., min_length=1)
+
+class BatchGetResponse(BaseModel):
+    itens: List[ClienteResponse]  # Na ordem dos ids pedidos, sem repetições
+    nao_encontrados: List[str] = []
+
+class ErroImportacao(BaseModel):
+    linha: int
+    id: Optional[str] = None
+    erro: str
+
+class ResultadoImportacao(BaseModel):
+    total_linhas: int = 0
+    inseridos: int = 0
+    atualizados: int = 0
+    total_erros: int = 0
+    erros: List[ErroImportacao] = []  # Limitado a IMPORTACAO_MAX_ERROS
@@ -0,0 +1,25 @@
+from datetime import datetime, timezone
+from pydantic import BaseModel, Field, field_validator
+from typing import List
+
+class CompraCreate(BaseModel):
+    cliente_id: str = Field(..., min_length=1)
+    produto: str = Field(..., min_length=1)
+    valor: float = Field(..., ge=0)
+    data: datetime
+
+    @field_validator("data")
+    @classmethod
+    def data_em_utc(cls, data: datetime) -> datetime:
+        # Sem fuso vale como UTC; assim datas com e sem fuso do mesmo lote são comparáveis
+        if data.tzinfo is None:
+            return data.replace(tzinfo=timezone.utc)
+        return data.astimezone(timezone.utc)
+
+class LoteCompras(BaseModel):
+    compras: List[CompraCreate] = Field(..., min_length=1)
+
+class ResultadoIngestaoCompras(BaseModel):
+    registradas: int
+    clientes_afetados: int
+    produtos_afetados: int
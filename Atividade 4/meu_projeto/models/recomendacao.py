@@ -0,0 +1,28 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+class ProdutoRecomendado(BaseModel):
+    produto: str
+    pontuacao: float
+    semelhante_a: Optional[str] = None  # Produto já comprado que motivou a recomendação; None = mais comprado
+
+class ClienteRecomendado(BaseModel):
+    id: str
+    pontuacao: float
+
+class ProdutoSimilar(BaseModel):
+    produto: str
+    similaridade: float  # Cosseno entre as colunas dos produtos (0 a 1)
+
+class CampanhaCreate(BaseModel):
+    produtos: List[str] = Field(..., min_length=1, max_length=100)
+    limite: int = Field(100, ge=1, le=10000)  # Clientes listados por produto
+
+class AlvoCampanha(BaseModel):
+    produto: str
+    clientes_atribuidos: int  # Clientes cuja melhor oferta na campanha é este produto
+    clientes: List[ClienteRecomendado]
+
+class ResultadoCampanha(BaseModel):
+    clientes_atribuidos: int
+    produtos: List[AlvoCampanha]
@@ -0,0 +1,25 @@
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+
+NomeAnalise = Literal[
+    "faixa_etaria", "rfm", "produtos_mais_vendidos", "maior_valor_compra", "comportamento_idade", "clientes"
+]
+
+class RelatorioCreate(BaseModel):
+    analises: List[NomeAnalise] = Field(..., min_length=1)
+    formato: Literal["csv", "xlsx", "pdf"] = "csv"
+    limit: int = Field(10, ge=1, le=1000)  # Usado pelos rankings (produtos e maior valor)
+
+class RelatorioStatus(BaseModel):
+    id: str
+    status: Literal["pendente", "executando", "concluido", "erro"]
+    progresso: float = 0.0  # De 0 a 1
+    analises: List[str]
+    formato: str
+    criado_em: datetime
+    concluido_em: Optional[datetime] = None
+    heartbeat_em: Optional[datetime] = None  # Último sinal do processo que executa o job
+    tamanho_bytes: Optional[int] = None
+    erro: Optional[str] = None
+    arquivo: Optional[str] = None  # URL de download quando concluído
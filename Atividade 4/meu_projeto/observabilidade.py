@@ -0,0 +1,95 @@
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict
+
+from fastapi import Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from pymongo import monitoring
+
+logger_lentas = logging.getLogger("mongo.consultas_lentas")
+
+REQUISICAO_LATENCIA = Histogram(
+    "http_requisicao_segundos", "Latência das requisições por rota", ["metodo", "rota", "status"]
+)
+MONGO_COMANDO_LATENCIA = Histogram(
+    "mongo_comando_segundos", "Duração dos comandos do MongoDB", ["comando", "colecao", "pipeline"]
+)
+MONGO_COMANDO_FALHAS = Counter(
+    "mongo_comando_falhas_total", "Comandos do MongoDB que falharam", ["comando", "colecao", "pipeline"]
+)
+MONGO_DOCUMENTOS = Counter(
+    "mongo_documentos_retornados_total", "Documentos retornados pelos comandos do MongoDB", ["comando", "colecao", "pipeline"]
+)
+
+async def medir_requisicoes(request: Request, call_next):
+    """Middleware HTTP: registra a latência usando o caminho modelo da rota"""
+    inicio = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        rota = request.scope.get("route")
+        REQUISICAO_LATENCIA.labels(
+            request.method, getattr(rota, "path", "desconhecida"), str(status)
+        ).observe(time.perf_counter() - inicio)
+
+async def metricas(request: Request) -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+def _documentos_retornados(resposta: Dict[str, Any]) -> int:
+    cursor = resposta.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+    return int(resposta.get("n", 0) or 0)
+
+class MonitorComandos(monitoring.CommandListener):
+    """Mede cada comando do MongoDB; o nome do pipeline vem do campo 'comment'"""
+
+    def __init__(self, limiar_lento_ms: float = 100):
+        self.limiar_lento_ms = limiar_lento_ms
+        self._lock = threading.Lock()
+        self._em_andamento: Dict[Any, Dict[str, str]] = {}
+
+    def started(self, event):
+        comando = event.command
+        colecao = comando.get(event.command_name)
+        if event.command_name == "getMore":
+            colecao = comando.get("collection")
+        with self._lock:
+            self._em_andamento[(event.connection_id, event.request_id)] = {
+                "colecao": colecao if isinstance(colecao, str) else "",
+                "pipeline": str(comando.get("comment", "")),
+            }
+
+    def _finalizar(self, event) -> Dict[str, str]:
+        with self._lock:
+            return self._em_andamento.pop((event.connection_id, event.request_id), {"colecao": "", "pipeline": ""})
+
+    def succeeded(self, event):
+        contexto = self._finalizar(event)
+        rotulos = (event.command_name, contexto["colecao"], contexto["pipeline"])
+        duracao_ms = event.duration_micros / 1000
+        documentos = _documentos_retornados(event.reply)
+        MONGO_COMANDO_LATENCIA.labels(*rotulos).observe(duracao_ms / 1000)
+        MONGO_DOCUMENTOS.labels(*rotulos).inc(documentos)
+        if duracao_ms >= self.limiar_lento_ms:
+            logger_lentas.warning(json.dumps({
+                "evento": "consulta_lenta",
+                "comando": event.command_name,
+                "colecao": contexto["colecao"],
+                "pipeline": contexto["pipeline"],
+                "duracao_ms": round(duracao_ms, 3),
+                "documentos": documentos,
+                "servidor": "%s:%s" % event.connection_id,
+            }, ensure_ascii=False))
+
+    def failed(self, event):
+        contexto = self._finalizar(event)
+        MONGO_COMANDO_FALHAS.labels(event.command_name, contexto["colecao"], contexto["pipeline"]).inc()
+        MONGO_COMANDO_LATENCIA.labels(
+            event.command_name, contexto["colecao"], contexto["pipeline"]
+        ).observe(event.duration_micros / 1_000_000)
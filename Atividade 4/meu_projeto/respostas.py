@@ -0,0 +1,48 @@
+"""Caminho rápido de resposta para listagens e relatórios
+
+Os serviços já devolvem dicionários com a projeção exata da resposta, então no
+modo rápido (RESPOSTAS_RAPIDAS) as rotas pulam a revalidação do response_model
+e serializam direto com orjson. O response_model continua declarado nas rotas
+para o OpenAPI; com VALIDAR_RESPOSTAS o conteúdo é validado contra ele antes do
+envio (útil em debug e testes). orjson é opcional: sem ele, usa o json padrão.
+"""
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from config import get_settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependência opcional
+    orjson = None
+
+class RespostaJSON(JSONResponse):
+    """JSONResponse que usa orjson quando disponível"""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+def serializar_linha(doc: Any) -> bytes:
+    """Uma linha NDJSON (usada pelo /clientes/stream)"""
+    if orjson is not None:
+        return orjson.dumps(doc, default=str, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(doc, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+_ADAPTADORES = {}
+
+def responder(conteudo: Any, modelo: Any) -> Any:
+    """Devolve o conteúdo cru no modo rápido, ou como está para o response_model validar"""
+    settings = get_settings()
+    if not settings.respostas_rapidas:
+        return conteudo
+    if settings.validar_respostas:
+        adaptador = _ADAPTADORES.get(modelo)
+        if adaptador is None:
+            adaptador = _ADAPTADORES[modelo] = TypeAdapter(modelo)
+        adaptador.validate_python(conteudo)
+    return RespostaJSON(conteudo)
@@ -4,75 +4,257 @@ from pathlib import Path
 # Adiciona o diretório pai ao path
 sys.path.append(str(Path(__file__).parent.parent))
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List, Optional
-from models.cliente import ClienteCreate, ClienteUpdate, ClienteResponse
-from services.cliente_service import ClienteService
+from datetime import date, datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Optional
+from config import get_settings
+from models.cliente import (
+    BatchGetRequest, BatchGetResponse, ClienteCreate, ClienteUpdate, ClienteResponse, ClientePagina, ResultadoImportacao
+)
+from services.cache_clientes import versao_do_etag
+from services.cliente_service_async import ClienteServiceAsync, ConflitoVersao, TempoEsgotado
+from services.pipelines import FACETAS_DASHBOARD
+from services.importacao import linhas_do_corpo, ler_csv, ler_ndjson
 from dependencies import get_cliente_service
+from respostas import responder, serializar_linha
 
 router = APIRouter(prefix="/clientes", tags=["Clientes"])
 
 @router.post("/", response_model=ClienteResponse, status_code=status.HTTP_201_CREATED)
 async def criar_cliente(
     cliente: ClienteCreate, 
-    service: ClienteService = Depends(get_cliente_service)
+    response: Response,
+    service: ClienteServiceAsync = Depends(get_cliente_service)
 ):
     try:
-        return service.criar_cliente(cliente)
+        criado, etag = await service.criar_cliente_versionado(cliente)
+        response.headers["ETag"] = etag
+        return criado
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail="Erro interno")
 
-@router.get("/", response_model=List[ClienteResponse])
-async def listar_clientes(
-    nome: Optional[str] = None,
-    idade_min: Optional[int] = None,
-    service: ClienteService = Depends(get_cliente_service)
+@router.post("/bulk", response_model=ResultadoImportacao)
+async def importar_clientes(
+    request: Request,
+    formato: Optional[str] = Query(None, pattern="^(ndjson|csv)$"),
+    upsert: bool = False,
+    service: ClienteServiceAsync = Depends(get_cliente_service)
 ):
+    # O corpo é lido em streaming; o formato vem do parâmetro ou do Content-Type
+    if formato is None:
+        formato = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    leitor = ler_csv if formato == "csv" else ler_ndjson
+    settings = get_settings()
+    return await service.importar_clientes(
+        leitor(linhas_do_corpo(request.stream())),
+        upsert=upsert,
+        tamanho_lote=settings.importacao_tamanho_lote,
+        max_erros=settings.importacao_max_erros,
+    )
+
+@router.post("/batch-get", response_model=BatchGetResponse)
+async def obter_clientes_em_lote(
+    pedido: BatchGetRequest,
+    service: ClienteServiceAsync = Depends(get_cliente_service)
+):
+    # Uma consulta $in; a resposta segue a ordem pedida e lista os ids ausentes
+    ids = list(dict.fromkeys(pedido.ids))
+    maximo = get_settings().batch_get_max_ids
+    if len(ids) > maximo:
+        raise HTTPException(status_code=400, detail=f"Máximo de {maximo} ids por requisição")
+    encontrados = await service.obter_clientes_por_ids(ids)
+    return responder({
+        "itens": [encontrados[i] for i in ids if i in encontrados],
+        "nao_encontrados": [i for i in ids if i not in encontrados],
+    }, BatchGetResponse)
+
+def _filtros(nome: Optional[str], idade_min: Optional[int]) -> dict:
     filtros = {}
     if nome:
         filtros["nome"] = nome
     if idade_min:
         filtros["idade_min"] = idade_min
-    
-    return service.listar_clientes(filtros)
+    return filtros
 
-@router.get("/{cliente_id}", response_model=ClienteResponse)
+@router.get("/", response_model=ClientePagina)
+async def listar_clientes(
+    nome: Optional[str] = None,
+    idade_min: Optional[int] = None,
+    limite: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    service: ClienteServiceAsync = Depends(get_cliente_service)
+):
+    settings = get_settings()
+    limite = min(limite or settings.paginacao_limite_padrao, settings.paginacao_limite_max)
+    try:
+        return responder(await service.listar_clientes(_filtros(nome, idade_min), limite, cursor), ClientePagina)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/stream")
+async def stream_clientes(
+    nome: Optional[str] = None,
+    idade_min: Optional[int] = None,
+    batch_size: Optional[int] = Query(None, ge=1),
+    service: ClienteServiceAsync = Depends(get_cliente_service)
+):
+    # NDJSON: um cliente por linha, enviado conforme o cursor avança
+    batch_size = batch_size or get_settings().stream_batch_size
+    async def linhas():
+        async for doc in service.stream_clientes(_filtros(nome, idade_min), batch_size):
+            yield serializar_linha(doc)
+    return StreamingResponse(linhas(), media_type="application/x-ndjson")
+
+@router.get("/busca", response_model=List[ClienteResponse])
+async def buscar_clientes(
+    q: str = Query(..., min_length=1),
+    modo: str = Query("prefixo", pattern="^(prefixo|texto|fuzzy)$"),
+    limite: int = Query(20, ge=1, le=100),
+    service: ClienteServiceAsync = Depends(get_cliente_service)
+):
+    try:
+        return responder(await service.buscar_clientes(q, modo, limite), List[ClienteResponse])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _etag_confere(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Comparação fraca (RFC 9110): ignora o prefixo W/
+    return any(valor.strip().removeprefix("W/") == etag for valor in if_none_match.split(","))
+
+@router.get("/{cliente_id}", response_model=ClienteResponse, responses={304: {"description": "Não modificado"}})
 async def obter_cliente(
-    cliente_id: str, 
-    service: ClienteService = Depends(get_cliente_service)
+    cliente_id: str,
+    request: Request,
+    response: Response,
+    service: ClienteServiceAsync = Depends(get_cliente_service)
 ):
     try:
-        return service.obter_cliente_por_id(cliente_id)
+        cliente, etag = await service.obter_cliente_versionado(cliente_id)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    if _etag_confere(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return cliente
 
-@router.put("/{cliente_id}", response_model=ClienteResponse)
+def _versao_esperada(if_match: Optional[str], cliente_id: str) -> Optional[int]:
+    """Versão exigida pelo If-Match; "*" ou ausente não impõem condição"""
+    if not if_match or if_match.strip() == "*":
+        return None
+    versao = versao_do_etag(if_match, cliente_id)
+    if versao is None:
+        raise HTTPException(status_code=412, detail="ETag do If-Match não corresponde ao cliente")
+    return versao
+
+@router.put("/{cliente_id}", response_model=ClienteResponse, responses={412: {"description": "Versão desatualizada"}})
 async def atualizar_cliente(
     cliente_id: str,
     cliente: ClienteUpdate,
-    service: ClienteService = Depends(get_cliente_service)
+    request: Request,
+    response: Response,
+    service: ClienteServiceAsync = Depends(get_cliente_service)
 ):
+    versao = _versao_esperada(request.headers.get("if-match"), cliente_id)
     try:
-        return service.atualizar_cliente(cliente_id, cliente)
+        atualizado, etag = await service.atualizar_cliente_versionado(cliente_id, cliente, versao)
+        response.headers["ETag"] = etag
+        return atualizado
+    except ConflitoVersao as e:
+        raise HTTPException(status_code=412, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail="Erro ao atualizar")
 
-@router.delete("/{cliente_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete("/{cliente_id}", status_code=status.HTTP_204_NO_CONTENT, responses={412: {"description": "Versão desatualizada"}})
 async def deletar_cliente(
     cliente_id: str,
-    service: ClienteService = Depends(get_cliente_service)
+    request: Request,
+    service: ClienteServiceAsync = Depends(get_cliente_service)
 ):
-    if not service.deletar_cliente(cliente_id):
+    versao = _versao_esperada(request.headers.get("if-match"), cliente_id)
+    try:
+        removido = await service.deletar_cliente(cliente_id, versao)
+    except ConflitoVersao as e:
+        raise HTTPException(status_code=412, detail=str(e))
+    if not removido:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
 
 # Rotas de Análise
+def _erro_analise(e: Exception) -> HTTPException:
+    # Pipeline interrompido pelo maxTimeMS: sobrecarga temporária, não erro interno
+    if isinstance(e, TempoEsgotado):
+        return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    return HTTPException(status_code=500, detail=str(e))
+
 @router.get("/analise/faixa-etaria", response_model=List[dict])
-async def analise_faixa_etaria(service: ClienteService = Depends(get_cliente_service)):
+async def analise_faixa_etaria(service: ClienteServiceAsync = Depends(get_cliente_service)):
+    try:
+        return responder(await service.analisar_faixa_etaria(), List[dict])
+    except Exception as e:
+        raise _erro_analise(e)
+
+@router.get("/analise/dashboard", response_model=Dict[str, List[dict]])
+async def analise_dashboard(
+    facetas: Optional[List[str]] = Query(None, description=f"Subconjunto de: {', '.join(FACETAS_DASHBOARD)}"),
+    limit: int = Query(10, ge=1, le=100),
+    service: ClienteServiceAsync = Depends(get_cliente_service)
+):
+    try:
+        return responder(await service.dashboard(facetas or list(FACETAS_DASHBOARD), limit), Dict[str, List[dict]])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise _erro_analise(e)
+
+@router.get("/analise/rfm", response_model=List[dict])
+async def analise_rfm(
+    inicio: Optional[date] = None,
+    fim: Optional[date] = None,
+    service: ClienteServiceAsync = Depends(get_cliente_service)
+):
+    # Com inicio/fim, usa o histórico de compras; sem janela, só a última compra
+    if inicio or fim:
+        fim = fim or date.today()
+        inicio = inicio or fim - timedelta(days=365)
+        if inicio > fim:
+            raise HTTPException(status_code=400, detail="inicio deve ser anterior a fim")
+        inicio, fim = datetime.combine(inicio, datetime.min.time()), datetime.combine(fim, datetime.min.time())
+    try:
+        return responder(await service.segmentacao_rfm(inicio, fim), List[dict])
+    except Exception as e:
+        raise _erro_analise(e)
+
+@router.get("/analise/produtos-mais-vendidos", response_model=List[dict])
+async def analise_produtos_mais_vendidos(
+    limit: int = Query(10, ge=1, le=100),
+    service: ClienteServiceAsync = Depends(get_cliente_service)
+):
+    try:
+        return responder(await service.produtos_mais_vendidos(limit), List[dict])
+    except Exception as e:
+        raise _erro_analise(e)
+
+@router.get("/analise/maior-valor-compra", response_model=List[dict])
+async def analise_maior_valor_compra(
+    limit: int = Query(10, ge=1, le=100),
+    service: ClienteServiceAsync = Depends(get_cliente_service)
+):
+    try:
+        return responder(await service.clientes_maior_valor_compra(limit), List[dict])
+    except Exception as e:
+        raise _erro_analise(e)
+
+@router.get("/analise/comportamento-idade", response_model=List[dict])
+async def analise_comportamento_idade(service: ClienteServiceAsync = Depends(get_cliente_service)):
     try:
-        return service.analisar_faixa_etaria()
+        return responder(await service.comportamento_por_idade(), List[dict])
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise _erro_analise(e)
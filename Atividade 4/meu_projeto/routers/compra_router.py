@@ -0,0 +1,46 @@
+from datetime import date, datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from typing import List
+from config import get_settings
+from models.compra import LoteCompras, ResultadoIngestaoCompras
+from services.cliente_service_async import TempoEsgotado
+from services.compra_service import CompraServiceAsync
+from dependencies import get_compra_service
+
+router = APIRouter(prefix="/compras", tags=["Compras"])
+
+@router.post("/", response_model=ResultadoIngestaoCompras, status_code=status.HTTP_201_CREATED)
+async def registrar_compras(
+    lote: LoteCompras,
+    service: CompraServiceAsync = Depends(get_compra_service)
+):
+    if len(lote.compras) > get_settings().compras_max_lote:
+        raise HTTPException(status_code=413, detail="Lote de compras maior que o permitido")
+    return await service.registrar_compras(lote.compras)
+
+@router.get("/clientes/{cliente_id}/resumo")
+async def resumo_cliente(
+    cliente_id: str,
+    service: CompraServiceAsync = Depends(get_compra_service)
+):
+    try:
+        return await service.resumo_cliente(cliente_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/analise/produtos", response_model=List[dict])
+async def produtos_por_periodo(
+    inicio: date,
+    fim: date,
+    limit: int = Query(10, ge=1, le=100),
+    service: CompraServiceAsync = Depends(get_compra_service)
+):
+    if inicio > fim:
+        raise HTTPException(status_code=400, detail="inicio deve ser anterior a fim")
+    try:
+        return await service.produtos_por_periodo(
+            datetime.combine(inicio, datetime.min.time()), datetime.combine(fim, datetime.min.time()), limit
+        )
+    except TempoEsgotado as e:
+        # maxTimeMS estourado: sobrecarga temporária, como nas rotas de análise de clientes
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from dependencies import get_empresa_id
+from services import registro_pipelines
+
+router = APIRouter(prefix="/diagnostico", tags=["Diagnóstico"])
+
+@router.get("/pool")
+async def estatisticas_pool(request: Request):
+    return request.app.state.monitor_pool.estatisticas()
+
+@router.get("/cache")
+async def estatisticas_cache(request: Request):
+    return request.app.state.cache_analises.estatisticas()
+
+@router.get("/agrupador")
+async def estatisticas_agrupador(request: Request):
+    agrupador = request.app.state.agrupador_clientes
+    return agrupador.estatisticas() if agrupador is not None else {"ativo": False}
+
+@router.get("/admissao")
+async def estatisticas_admissao(request: Request):
+    return {classe: limitador.estatisticas() for classe, limitador in request.app.state.limitadores.items()}
+
+@router.get("/pipelines")
+async def listar_pipelines():
+    return registro_pipelines.listar()
+
+@router.get("/pipelines/{nome}/explain")
+async def explicar_pipeline(nome: str, request: Request, empresa_id: str = Depends(get_empresa_id)):
+    """Executa o explain("executionStats") do pipeline com os argumentos de exemplo
+    
+    Os alertas (COLLSCAN, ORDENACAO_EM_MEMORIA, DISCO) apontam regressões de
+    índice; os que o pipeline aceita por construção vêm em alertas_aceitos.
+    """
+    try:
+        return await registro_pipelines.explicar_async(request.app.state.db, nome, empresa_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/cache-clientes")
+async def estatisticas_cache_clientes(request: Request):
+    cache = request.app.state.cache_clientes
+    return cache.estatisticas() if cache is not None else {"ativo": False}
@@ -0,0 +1,75 @@
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List
+from models.recomendacao import (
+    CampanhaCreate, ClienteRecomendado, ProdutoRecomendado, ProdutoSimilar, ResultadoCampanha
+)
+from services.recomendacoes import GerenciadorRecomendacoes, ModeloRecomendacao
+from dependencies import get_empresa_id, get_recomendacoes
+from respostas import responder
+
+router = APIRouter(prefix="/clientes/analise/recomendacoes", tags=["Recomendações"])
+
+async def _modelo(empresa_id: str, recomendacoes: GerenciadorRecomendacoes) -> ModeloRecomendacao:
+    try:
+        return await recomendacoes.modelo(empresa_id)
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/clientes/{cliente_id}", response_model=List[ProdutoRecomendado])
+async def produtos_para_cliente(
+    cliente_id: str,
+    limite: int = Query(10, ge=1, le=100),
+    empresa_id: str = Depends(get_empresa_id),
+    recomendacoes: GerenciadorRecomendacoes = Depends(get_recomendacoes)
+):
+    modelo = await _modelo(empresa_id, recomendacoes)
+    try:
+        # Em thread: a consulta espera a trava se uma sincronização estiver aplicando alterações
+        return responder(await asyncio.to_thread(modelo.produtos_para_cliente, cliente_id, limite), List[ProdutoRecomendado])
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/produtos/{produto}/clientes", response_model=List[ClienteRecomendado])
+async def clientes_para_produto(
+    produto: str,
+    limite: int = Query(100, ge=1, le=10000),
+    empresa_id: str = Depends(get_empresa_id),
+    recomendacoes: GerenciadorRecomendacoes = Depends(get_recomendacoes)
+):
+    modelo = await _modelo(empresa_id, recomendacoes)
+    try:
+        return responder(await asyncio.to_thread(modelo.clientes_para_produto, produto, limite), List[ClienteRecomendado])
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/produtos/{produto}/similares", response_model=List[ProdutoSimilar])
+async def produtos_similares(
+    produto: str,
+    limite: int = Query(10, ge=1, le=100),
+    empresa_id: str = Depends(get_empresa_id),
+    recomendacoes: GerenciadorRecomendacoes = Depends(get_recomendacoes)
+):
+    modelo = await _modelo(empresa_id, recomendacoes)
+    try:
+        return responder(await asyncio.to_thread(modelo.produtos_similares, produto, limite), List[ProdutoSimilar])
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.post("/campanhas", response_model=ResultadoCampanha)
+async def pontuar_campanha(
+    campanha: CampanhaCreate,
+    empresa_id: str = Depends(get_empresa_id),
+    recomendacoes: GerenciadorRecomendacoes = Depends(get_recomendacoes)
+):
+    # Cada cliente recebe uma única oferta: o produto da campanha com maior pontuação
+    await _modelo(empresa_id, recomendacoes)
+    try:
+        resultado = await recomendacoes.pontuar_campanha(
+            empresa_id, list(dict.fromkeys(campanha.produtos)), campanha.limite
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return responder(resultado, ResultadoCampanha)
@@ -0,0 +1,82 @@
+import os
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
+from config import get_settings
+from models.relatorio import RelatorioCreate, RelatorioStatus
+from services.relatorios import FilaRelatorios, dependencia_ausente, exportar_clientes_csv
+from dependencies import get_db, get_empresa_id, get_fila_relatorios
+
+router = APIRouter(prefix="/relatorios", tags=["Relatórios"])
+
+MIDIA = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "pdf": "application/pdf",
+}
+
+def _url(request: Request, rota: str, job_id: str) -> str:
+    # Mantém a forma da requisição: /empresas/{empresa_id}/relatorios/... ou o cabeçalho
+    params = {k: v for k, v in request.path_params.items() if k == "empresa_id"}
+    return str(request.url_for(rota, job_id=job_id, **params))
+
+def _status(job: dict, request: Request) -> dict:
+    arquivo = None
+    if job["status"] == "concluido":
+        arquivo = _url(request, "baixar_relatorio", job["_id"])
+    return {"id": job["_id"], "arquivo": arquivo, **{k: v for k, v in job.items() if k not in ("_id", "limit")}}
+
+@router.post("/", response_model=RelatorioStatus, status_code=status.HTTP_202_ACCEPTED)
+async def criar_relatorio(
+    pedido: RelatorioCreate,
+    request: Request,
+    response: Response,
+    empresa_id: str = Depends(get_empresa_id),
+    fila: FilaRelatorios = Depends(get_fila_relatorios)
+):
+    pacote = dependencia_ausente(pedido.formato)
+    if pacote:
+        raise HTTPException(status_code=400, detail=f"O formato {pedido.formato} requer o pacote {pacote}")
+    # Mesmas análises sobre os mesmos dados devolvem o job já existente
+    job, novo = await fila.enfileirar(empresa_id, list(dict.fromkeys(pedido.analises)), pedido.formato, pedido.limit)
+    if not novo:
+        response.status_code = status.HTTP_200_OK
+    response.headers["Location"] = _url(request, "obter_relatorio", job["_id"])
+    return _status(job, request)
+
+@router.get("/exportacao/clientes")
+async def exportar_clientes(db=Depends(get_db), empresa_id: str = Depends(get_empresa_id)):
+    # CSV completo enviado conforme o cursor avança, sem passar pela fila
+    return StreamingResponse(
+        exportar_clientes_csv(db, empresa_id, get_settings().stream_batch_size),
+        media_type=MIDIA["csv"],
+        headers={"Content-Disposition": 'attachment; filename="clientes.csv"'},
+    )
+
+@router.get("/{job_id}", response_model=RelatorioStatus)
+async def obter_relatorio(
+    job_id: str,
+    request: Request,
+    empresa_id: str = Depends(get_empresa_id),
+    fila: FilaRelatorios = Depends(get_fila_relatorios)
+):
+    job = await fila.obter(job_id, empresa_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Relatório não encontrado")
+    return _status(job, request)
+
+@router.get("/{job_id}/arquivo")
+async def baixar_relatorio(
+    job_id: str,
+    empresa_id: str = Depends(get_empresa_id),
+    fila: FilaRelatorios = Depends(get_fila_relatorios)
+):
+    job = await fila.obter(job_id, empresa_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Relatório não encontrado")
+    if job["status"] != "concluido":
+        raise HTTPException(status_code=409, detail=f"Relatório ainda não concluído ({job['status']})")
+    caminho = fila.caminho(job)
+    if not os.path.exists(caminho):
+        raise HTTPException(status_code=410, detail="Arquivo removido; solicite o relatório novamente")
+    # FileResponse envia o arquivo em blocos a partir do disco
+    return FileResponse(caminho, media_type=MIDIA[job["formato"]], filename=f"relatorio-{job_id}.{job['formato']}")
@@ -0,0 +1,75 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+class AgrupadorBuscas:
+    """Agrupa buscas individuais concorrentes por chave em uma única consulta em lote
+
+    As chaves pedidas dentro da mesma janela (alguns milissegundos) são enviadas
+    juntas para ``buscar_lote``, que devolve um dicionário chave -> documento.
+    Cada chamador recebe só o seu resultado (ou None, se a chave não existir).
+    Deve ser criado e usado dentro de um único event loop.
+    """
+
+    def __init__(
+        self,
+        buscar_lote: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+        janela_ms: float = 2,
+        max_lote: int = 500,
+    ):
+        self.buscar_lote = buscar_lote
+        self.janela_ms = janela_ms
+        self.max_lote = max_lote
+        self._pendentes: Dict[Hashable, List[asyncio.Future]] = {}
+        self._agendado: Optional[asyncio.TimerHandle] = None
+        self._tarefas: set = set()
+        self.buscas = 0
+        self.lotes = 0
+
+    async def obter(self, chave: Hashable) -> Any:
+        self.buscas += 1
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+        self._pendentes.setdefault(chave, []).append(futuro)
+        if len(self._pendentes) >= self.max_lote:
+            self._despachar()
+        elif self._agendado is None:
+            self._agendado = loop.call_later(self.janela_ms / 1000, self._despachar)
+        return await futuro
+
+    def _despachar(self) -> None:
+        if self._agendado is not None:
+            self._agendado.cancel()
+            self._agendado = None
+        if not self._pendentes:
+            return
+        # Um lote já despachado não recebe novos chamadores: leituras após uma escrita vão para o próximo
+        pendentes, self._pendentes = self._pendentes, {}
+        self.lotes += 1
+        tarefa = asyncio.get_running_loop().create_task(self._executar(pendentes))
+        self._tarefas.add(tarefa)
+        tarefa.add_done_callback(self._tarefas.discard)
+
+    async def _executar(self, pendentes: Dict[Hashable, List[asyncio.Future]]) -> None:
+        try:
+            encontrados = await self.buscar_lote(list(pendentes))
+        except BaseException as e:
+            for futuros in pendentes.values():
+                for futuro in futuros:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        for chave, futuros in pendentes.items():
+            for futuro in futuros:
+                if not futuro.done():
+                    futuro.set_result(encontrados.get(chave))
+
+    def estatisticas(self) -> Dict[str, Any]:
+        return {
+            "janela_ms": self.janela_ms,
+            "max_lote": self.max_lote,
+            "buscas": self.buscas,
+            "lotes": self.lotes,
+            "media_por_lote": round(self.buscas / self.lotes, 2) if self.lotes else 0.0,
+        }
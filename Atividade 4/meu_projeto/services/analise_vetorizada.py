@@ -0,0 +1,313 @@
+"""Motor de análise em memória sobre um snapshot colunar da coleção de clientes
+
+Calcula os mesmos relatórios do ClienteService com operações vetorizadas do
+NumPy, sem repetir agregações no MongoDB. Requer o pacote opcional ``numpy``.
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - dependência opcional
+    np = None
+
+from pymongo.database import Database
+
+from services.comparacao import comparar_relatorios
+from services.empresas import colecao_clientes, empresa_padrao
+from services.pipelines import FAIXA_OUTROS, LIMITES_IDADE, ROTULOS_IDADE
+
+PROJECAO_SNAPSHOT = {"id": 1, "nome": 1, "idade": 1, "ultima_compra": 1, "atualizado_em": 1}
+
+# Limites e rótulos do $bucket de recência em pipeline_segmentacao_rfm
+LIMITES_RECENCIA = [0, 30, 90, 180, 365]
+ROTULOS_RECENCIA = {
+    0: "Ativo (0-30 dias)",
+    30: "Regular (30-90 dias)",
+    90: "Levemente Inativo (90-180 dias)",
+    180: "Inativo (180-365 dias)",
+    "Inativo": "Muito Inativo (365+ dias)",
+}
+
+# Margem para escritas concorrentes com a leitura do snapshot
+MARGEM_SINCRONIZACAO = timedelta(seconds=5)
+
+_SEM_DATA = np.iinfo(np.int64).min if np is not None else None
+
+
+def _dias_desde_epoch(data: Any) -> int:
+    """Converte a data 'YYYY-MM-DD' da última compra em dias desde 1970-01-01"""
+    if not isinstance(data, str):
+        return _SEM_DATA
+    try:
+        return date.fromisoformat(data[:10]).toordinal() - date(1970, 1, 1).toordinal()
+    except ValueError:
+        return _SEM_DATA
+
+
+class AnaliseVetorizada:
+    """Snapshot colunar (NumPy) dos clientes de uma empresa com sincronização incremental"""
+
+    def __init__(self, db: Database, batch_size: int = 10000, empresa_id: Optional[str] = None):
+        if np is None:
+            raise ImportError("A análise vetorizada requer o pacote numpy")
+        self.db = db
+        self.empresa_id = empresa_id or empresa_padrao()
+        self.clientes = db[colecao_clientes(self.empresa_id)]
+        self.batch_size = batch_size
+        self.ultima_sincronizacao: Optional[datetime] = None
+        self._limpar()
+
+    def _limpar(self) -> None:
+        self._linhas: Dict[Any, int] = {}
+        self.ids: List[str] = []
+        self.nomes: List[str] = []
+        self.idade = np.empty(0, dtype=np.float64)
+        self.valor = np.empty(0, dtype=np.float64)
+        self.data = np.empty(0, dtype=np.int64)
+        self.produto = np.empty(0, dtype=np.int32)
+        self.ativo = np.empty(0, dtype=bool)
+        self.produtos: List[str] = []
+        self._codigos_produto: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return int(self.ativo.sum())
+
+    # Sincronização
+    def carregar(self) -> None:
+        """Carrega o snapshot completo a partir da coleção"""
+        self._limpar()
+        self.ultima_sincronizacao = datetime.now(timezone.utc)
+        cursor = self.clientes.find({"empresa_id": self.empresa_id}, PROJECAO_SNAPSHOT).batch_size(self.batch_size)
+        lote = []
+        for doc in cursor:
+            lote.append(doc)
+            if len(lote) >= self.batch_size:
+                self._aplicar(lote)
+                lote = []
+        self._aplicar(lote)
+
+    def atualizar(self) -> Dict[str, int]:
+        """Aplica apenas as alterações feitas desde a última sincronização"""
+        if self.ultima_sincronizacao is None:
+            self.carregar()
+            return {"alterados": len(self), "removidos": 0}
+        desde = self.ultima_sincronizacao - MARGEM_SINCRONIZACAO
+        self.ultima_sincronizacao = datetime.now(timezone.utc)
+        filtro = {"empresa_id": self.empresa_id, "atualizado_em": {"$gt": desde}}
+        alterados = list(self.clientes.find(filtro, PROJECAO_SNAPSHOT))
+        removidos = [
+            doc["_id"] for doc in self.db.clientes_removidos.find(
+                {"empresa_id": self.empresa_id, "removido_em": {"$gt": desde}}, {"_id": 1}
+            )
+        ]
+        self._aplicar(alterados)
+        for _id in removidos:
+            linha = self._linhas.pop(_id, None)
+            if linha is not None:
+                self.ativo[linha] = False
+        if (~self.ativo).sum() > len(self.ativo) // 2:
+            # Muitas linhas inativas: recarrega para compactar as colunas
+            self.carregar()
+        return {"alterados": len(alterados), "removidos": len(removidos)}
+
+    def _codigo_produto(self, produto: Optional[str]) -> int:
+        if produto is None:
+            return -1
+        codigo = self._codigos_produto.get(produto)
+        if codigo is None:
+            codigo = self._codigos_produto[produto] = len(self.produtos)
+            self.produtos.append(produto)
+        return codigo
+
+    def _aplicar(self, docs: List[Dict]) -> None:
+        novos = []
+        for doc in docs:
+            compra = doc.get("ultima_compra") or {}
+            idade = doc.get("idade")
+            valor = compra.get("valor")
+            linha = (
+                doc.get("id"),
+                doc.get("nome"),
+                float(idade) if isinstance(idade, (int, float)) and not isinstance(idade, bool) else np.nan,
+                float(valor) if isinstance(valor, (int, float)) and not isinstance(valor, bool) else np.nan,
+                _dias_desde_epoch(compra.get("data")),
+                self._codigo_produto(compra.get("produto")),
+            )
+            indice = self._linhas.get(doc["_id"])
+            if indice is None:
+                self._linhas[doc["_id"]] = len(self.ids) + len(novos)
+                novos.append(linha)
+            else:
+                self.ids[indice], self.nomes[indice] = linha[0], linha[1]
+                self.idade[indice], self.valor[indice], self.data[indice], self.produto[indice] = linha[2:]
+                self.ativo[indice] = True
+        if not novos:
+            return
+        colunas = list(zip(*novos))
+        self.ids.extend(colunas[0])
+        self.nomes.extend(colunas[1])
+        self.idade = np.concatenate([self.idade, np.array(colunas[2], dtype=np.float64)])
+        self.valor = np.concatenate([self.valor, np.array(colunas[3], dtype=np.float64)])
+        self.data = np.concatenate([self.data, np.array(colunas[4], dtype=np.int64)])
+        self.produto = np.concatenate([self.produto, np.array(colunas[5], dtype=np.int32)])
+        self.ativo = np.concatenate([self.ativo, np.ones(len(novos), dtype=bool)])
+
+    # Relatórios
+    def _buckets_idade(self):
+        """Índice do bucket de idade por linha (0..5) ou 6 para "Outros", igual ao $bucket"""
+        posicao = np.digitize(self.idade, LIMITES_IDADE)
+        return np.where((posicao >= 1) & (posicao < len(LIMITES_IDADE)), posicao - 1, len(LIMITES_IDADE) - 1)
+
+    @staticmethod
+    def _media(soma: float, quantidade: int, casas: int) -> Optional[float]:
+        return round(float(soma) / quantidade, casas) if quantidade else None
+
+    def _chaves_bucket(self) -> List[Any]:
+        return LIMITES_IDADE[:-1] + [FAIXA_OUTROS]
+
+    def analisar_faixa_etaria(self) -> List[Dict[str, Any]]:
+        ativo = self.ativo
+        bucket = self._buckets_idade()[ativo]
+        valor = self.valor[ativo]
+        produto = self.produto[ativo]
+        com_valor = ~np.isnan(valor)
+        n = len(LIMITES_IDADE)
+        totais = np.bincount(bucket, minlength=n)
+        somas = np.bincount(bucket[com_valor], weights=valor[com_valor], minlength=n)
+        quantidades = np.bincount(bucket[com_valor], minlength=n)
+        com_produto = produto >= 0
+        n_produtos = max(len(self.produtos), 1)
+        contagem = np.bincount(
+            bucket[com_produto] * n_produtos + produto[com_produto], minlength=n * n_produtos
+        ).reshape(n, n_produtos)
+        resultado = []
+        for indice, chave in enumerate(self._chaves_bucket()):
+            if totais[indice] == 0:
+                continue
+            linha = contagem[indice]
+            codigos = [c for c in np.flatnonzero(linha)]
+            populares = sorted(codigos, key=lambda c: (-linha[c], self.produtos[c]))[:5]
+            resultado.append({
+                "faixa": ROTULOS_IDADE[chave],
+                "total_clientes": int(totais[indice]),
+                "valor_medio": self._media(somas[indice], int(quantidades[indice]), 2),
+                "produtos_populares": [self.produtos[c] for c in populares],
+            })
+        return sorted(resultado, key=lambda r: r["faixa"])
+
+    def comportamento_por_idade(self) -> List[Dict[str, Any]]:
+        ativo = self.ativo
+        chaves = self._chaves_bucket()
+        rotulos = np.array([ROTULOS_IDADE[chave] for chave in chaves], dtype=object)
+        grupo = rotulos[self._buckets_idade()[ativo]]
+        valor = self.valor[ativo]
+        produto = self.produto[ativo]
+        resultado = []
+        for rotulo in sorted(set(rotulos)):
+            linhas = grupo == rotulo
+            total = int(linhas.sum())
+            if total == 0:
+                continue
+            valores = valor[linhas]
+            valores = valores[~np.isnan(valores)]
+            produtos = produto[linhas]
+            resultado.append({
+                "faixa_etaria": rotulo,
+                "total_clientes": total,
+                "valor_medio_compra": self._media(valores.sum(), len(valores), 2),
+                "variedade_produtos": int(len(np.unique(produtos[produtos >= 0]))),
+            })
+        return resultado
+
+    def produtos_mais_vendidos(self, limit: int = 10) -> List[Dict[str, Any]]:
+        ativo = self.ativo & (self.produto >= 0)
+        produto = self.produto[ativo]
+        valor = self.valor[ativo]
+        n = len(self.produtos)
+        vendas = np.bincount(produto, minlength=n)
+        com_valor = ~np.isnan(valor)
+        totais = np.bincount(produto[com_valor], weights=valor[com_valor], minlength=n)
+        codigos = [c for c in np.flatnonzero(vendas)]
+        codigos.sort(key=lambda c: (-vendas[c], self.produtos[c]))
+        return [
+            {
+                "produto": self.produtos[c],
+                "total_vendas": int(vendas[c]),
+                "valor_total": round(float(totais[c]), 2),
+                "valor_medio": round(float(totais[c]) / int(vendas[c]), 2),
+            }
+            for c in codigos[:limit]
+        ]
+
+    def clientes_maior_valor_compra(self, limit: int = 10) -> List[Dict[str, Any]]:
+        linhas = np.flatnonzero(self.ativo & ~np.isnan(self.valor))
+        if len(linhas) > limit:
+            linhas = linhas[np.argpartition(-self.valor[linhas], limit - 1)[:limit]]
+        linhas = linhas[np.argsort(-self.valor[linhas], kind="stable")]
+        return [
+            {
+                "id": self.ids[i],
+                "nome": self.nomes[i],
+                "idade": int(self.idade[i]) if not np.isnan(self.idade[i]) else None,
+                "produto": self.produtos[self.produto[i]] if self.produto[i] >= 0 else None,
+                "valor_compra": float(self.valor[i]),
+                "data_compra": (date(1970, 1, 1) + timedelta(days=int(self.data[i]))).isoformat()
+                if self.data[i] != _SEM_DATA else None,
+            }
+            for i in linhas
+        ]
+
+    def segmentacao_rfm(self, hoje: Optional[date] = None) -> List[Dict[str, Any]]:
+        hoje = hoje or datetime.now(timezone.utc).date()
+        linhas = self.ativo & (self.data != _SEM_DATA)
+        recencia = (hoje.toordinal() - date(1970, 1, 1).toordinal()) - self.data[linhas]
+        valor = self.valor[linhas]
+        posicao = np.digitize(recencia, LIMITES_RECENCIA)
+        # Fora de [0, 365) vai para o bucket padrão "Inativo", como no $bucket
+        bucket = np.where((posicao >= 1) & (posicao < len(LIMITES_RECENCIA)), posicao - 1, len(LIMITES_RECENCIA) - 1)
+        chaves = LIMITES_RECENCIA[:-1] + ["Inativo"]
+        resultado = []
+        for indice, chave in enumerate(chaves):
+            selecionados = bucket == indice
+            total = int(selecionados.sum())
+            if total == 0:
+                continue
+            valores = valor[selecionados]
+            valores = valores[~np.isnan(valores)]
+            resultado.append({
+                "segmento": ROTULOS_RECENCIA[chave],
+                "recencia_media": self._media(recencia[selecionados].sum(), total, 1),
+                "valor_medio": self._media(valores.sum(), len(valores), 2),
+                "total_clientes": total,
+            })
+        return sorted(resultado, key=lambda r: r["recencia_media"])
+
+
+def verificar_paridade(
+    db: Database, motor: Optional[AnaliseVetorizada] = None, empresa_id: Optional[str] = None
+) -> List[str]:
+    """Compara cada relatório vetorizado com o pipeline equivalente no MongoDB"""
+    from services.cliente_service import ClienteService
+    if motor is not None:
+        empresa_id = motor.empresa_id
+    ao_vivo = ClienteService(db, empresa_id)
+    if motor is None:
+        motor = AnaliseVetorizada(db, empresa_id=empresa_id)
+        motor.carregar()
+    total = len(motor) or 1
+    produtos_vivo = ao_vivo.produtos_mais_vendidos(total)
+    for produto in produtos_vivo:
+        produto["valor_total"] = round(produto["valor_total"], 2)
+    # Campos de amostra (produtos_populares, exemplo_clientes) dependem da ordem natural
+    return (
+        comparar_relatorios("faixa_etaria", motor.analisar_faixa_etaria(), ao_vivo.analisar_faixa_etaria(),
+                            "faixa", ["produtos_populares"])
+        + comparar_relatorios("segmentacao_rfm", motor.segmentacao_rfm(), ao_vivo.segmentacao_rfm(), "segmento")
+        + comparar_relatorios("produtos_mais_vendidos", motor.produtos_mais_vendidos(total), produtos_vivo,
+                              "produto", ["exemplo_clientes"])
+        + comparar_relatorios("maior_valor_compra", motor.clientes_maior_valor_compra(total),
+                              ao_vivo.clientes_maior_valor_compra(total), "id")
+        + comparar_relatorios("comportamento_idade", motor.comportamento_por_idade(),
+                              ao_vivo.comportamento_por_idade(), "faixa_etaria")
+    )
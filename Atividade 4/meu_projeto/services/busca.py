@@ -0,0 +1,47 @@
+import re
+import unicodedata
+from typing import Dict, List
+
+COLECAO_TRIGRAMAS = "clientes_trigramas"
+
+def normalizar_nome(nome: str) -> str:
+    """Minúsculas, sem acentos e com espaços simples (chave de busca por prefixo)"""
+    sem_acentos = "".join(
+        c for c in unicodedata.normalize("NFKD", nome) if not unicodedata.combining(c)
+    )
+    return " ".join(sem_acentos.casefold().split())
+
+def trigramas(texto: str) -> List[str]:
+    """Trigramas do nome normalizado, com bordas para favorecer o início das palavras"""
+    trigs = set()
+    for palavra in normalizar_nome(texto).split():
+        palavra = f"  {palavra} "
+        trigs.update(palavra[i:i + 3] for i in range(len(palavra) - 2))
+    return sorted(trigs)
+
+def filtro_prefixo(termo: str) -> Dict:
+    """Regex ancorada e sensível a maiúsculas: o MongoDB a converte em faixa do índice"""
+    return {"nome_normalizado": {"$regex": "^" + re.escape(normalizar_nome(termo))}}
+
+def filtro_texto(termo: str) -> Dict:
+    return {"$text": {"$search": termo}}
+
+def pipeline_fuzzy(termo: str, limite: int, similaridade_min: float) -> List[Dict]:
+    """Candidatos por trigramas em comum, ordenados pela similaridade de Jaccard"""
+    consulta = trigramas(termo)
+    return [
+        {"$match": {"trigramas": {"$in": consulta}}},
+        {
+            "$project": {
+                "similaridade": {
+                    "$divide": [
+                        {"$size": {"$setIntersection": ["$trigramas", consulta]}},
+                        {"$size": {"$setUnion": ["$trigramas", consulta]}}
+                    ]
+                }
+            }
+        },
+        {"$match": {"similaridade": {"$gte": similaridade_min}}},
+        {"$sort": {"similaridade": -1, "_id": 1}},
+        {"$limit": limite}
+    ]
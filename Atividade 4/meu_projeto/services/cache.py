@@ -0,0 +1,100 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Tuple
+
+# Campos do cliente que alimentam cada relatório (usado na invalidação por escrita)
+CAMPOS_POR_RELATORIO = {
+    "faixa_etaria": {"idade", "ultima_compra"},
+    "rfm": {"ultima_compra"},
+    "produtos_mais_vendidos": {"nome", "ultima_compra"},
+    "maior_valor_compra": {"id", "nome", "idade", "ultima_compra"},
+    "comportamento_idade": {"idade", "ultima_compra"},
+    "dashboard": {"id", "nome", "idade", "ultima_compra"},
+}
+
+def relatorios_afetados(campos: Iterable[str]) -> set:
+    """Relatórios cujo resultado pode mudar quando os campos informados mudam"""
+    campos = set(campos)
+    return {nome for nome, usados in CAMPOS_POR_RELATORIO.items() if usados & campos}
+
+class CacheAnalises:
+    """Cache LRU com TTL para resultados de relatórios, com coalescência de misses"""
+
+    def __init__(self, ttl_segundos: float = 60, max_entradas: int = 256):
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self._entradas: "OrderedDict[Tuple[str, Hashable], Tuple[float, Any]]" = OrderedDict()
+        self._em_andamento: Dict[Tuple[str, Hashable], asyncio.Future] = {}
+        self._geracao: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalescidos = 0
+        self.invalidacoes = 0
+
+    async def obter(self, relatorio: str, params: Hashable, calcular: Callable[[], Awaitable[Any]]) -> Any:
+        """Retorna o resultado em cache ou calcula uma única vez para chamadas concorrentes"""
+        chave = (relatorio, params)
+        entrada = self._entradas.get(chave)
+        if entrada is not None:
+            expira_em, valor = entrada
+            if expira_em > time.monotonic():
+                self._entradas.move_to_end(chave)
+                self.hits += 1
+                return valor
+            del self._entradas[chave]
+
+        pendente = self._em_andamento.get(chave)
+        if pendente is not None:
+            self.coalescidos += 1
+            return await asyncio.shield(pendente)
+
+        self.misses += 1
+        geracao = self._geracao.get(relatorio, 0)
+        futuro = asyncio.get_running_loop().create_future()
+        self._em_andamento[chave] = futuro
+        try:
+            valor = await calcular()
+        except BaseException as e:
+            futuro.set_exception(e)
+            # Evita o aviso de exceção não recuperada quando ninguém aguardava
+            futuro.exception()
+            raise
+        else:
+            futuro.set_result(valor)
+            # Não guarda um resultado calculado antes de uma invalidação
+            if self._geracao.get(relatorio, 0) == geracao:
+                self._guardar(chave, valor)
+            return valor
+        finally:
+            del self._em_andamento[chave]
+
+    def _guardar(self, chave, valor) -> None:
+        self._entradas[chave] = (time.monotonic() + self.ttl_segundos, valor)
+        self._entradas.move_to_end(chave)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+
+    def invalidar(self, relatorios: Iterable[str]) -> None:
+        """Remove os resultados dos relatórios informados"""
+        relatorios = set(relatorios)
+        if not relatorios:
+            return
+        self.invalidacoes += 1
+        for relatorio in relatorios:
+            self._geracao[relatorio] = self._geracao.get(relatorio, 0) + 1
+        for chave in [c for c in self._entradas if c[0] in relatorios]:
+            del self._entradas[chave]
+
+    def estatisticas(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entradas": len(self._entradas),
+            "max_entradas": self.max_entradas,
+            "ttl_segundos": self.ttl_segundos,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalescidos": self.coalescidos,
+            "invalidacoes": self.invalidacoes,
+            "taxa_acerto": round(self.hits / total, 4) if total else 0.0,
+        }
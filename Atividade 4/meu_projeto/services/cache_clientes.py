@@ -0,0 +1,165 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+def _substitui(atual: Optional[Dict[str, Any]], nova: Dict[str, Any]) -> bool:
+    """Uma entrada só substitui outra de versão menor; lápides só saem ao expirar"""
+    if atual is None:
+        return True
+    if atual.get("lapide"):
+        return False
+    return (nova.get("versao") or 0) > (atual.get("versao") or 0)
+
+class BackendMemoria:
+    """Backend em processo: LRU limitado com TTL por entrada"""
+
+    def __init__(self, max_entradas: int = 10000):
+        self.max_entradas = max_entradas
+        self._entradas: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    async def get(self, chave: str) -> Optional[Any]:
+        entrada = self._entradas.get(chave)
+        if entrada is None:
+            return None
+        expira_em, valor = entrada
+        if expira_em <= time.monotonic():
+            del self._entradas[chave]
+            return None
+        self._entradas.move_to_end(chave)
+        return valor
+
+    async def set(self, chave: str, valor: Any, ttl_segundos: float) -> None:
+        self._entradas[chave] = (time.monotonic() + ttl_segundos, valor)
+        self._entradas.move_to_end(chave)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+
+    async def set_se_mais_nova(self, chave: str, valor: Dict[str, Any], ttl_segundos: float) -> bool:
+        # Sem await entre a leitura e a escrita: atômico dentro do event loop
+        if not _substitui(await self.get(chave), valor):
+            return False
+        await self.set(chave, valor, ttl_segundos)
+        return True
+
+    async def delete(self, *chaves: str) -> None:
+        for chave in chaves:
+            self._entradas.pop(chave, None)
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+class BackendRedis:
+    """Adapta um cliente assíncrono compatível com Redis (ex.: redis.asyncio.Redis)
+
+    Permite que vários workers compartilhem o cache; o limite de memória fica a
+    cargo da política de eviction do próprio servidor (maxmemory-policy).
+    """
+
+    # Mesma regra de _substitui, executada no servidor para ser atômica entre os workers
+    SCRIPT_SET_SE_MAIS_NOVA = """
+local atual = redis.call('GET', KEYS[1])
+if atual then
+    local entrada = cjson.decode(atual)
+    if entrada['lapide'] == true then return 0 end
+    if (tonumber(ARGV[2]) or 0) <= (tonumber(entrada['versao']) or 0) then return 0 end
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[3])
+return 1
+"""
+
+    def __init__(self, redis, prefixo: str = "clientes:"):
+        self.redis = redis
+        self.prefixo = prefixo
+
+    async def get(self, chave: str) -> Optional[Any]:
+        bruto = await self.redis.get(self.prefixo + chave)
+        return json.loads(bruto) if bruto is not None else None
+
+    async def set(self, chave: str, valor: Any, ttl_segundos: float) -> None:
+        await self.redis.set(self.prefixo + chave, json.dumps(valor, default=str), px=max(1, int(ttl_segundos * 1000)))
+
+    async def set_se_mais_nova(self, chave: str, valor: Dict[str, Any], ttl_segundos: float) -> bool:
+        return bool(await self.redis.eval(
+            self.SCRIPT_SET_SE_MAIS_NOVA, 1, self.prefixo + chave,
+            json.dumps(valor, default=str), valor.get("versao") or 0, max(1, int(ttl_segundos * 1000)),
+        ))
+
+    async def delete(self, *chaves: str) -> None:
+        if chaves:
+            await self.redis.delete(*(self.prefixo + chave for chave in chaves))
+
+def versao_do_etag(etag: str, cliente_id: str) -> Optional[int]:
+    """Versão contida em um ETag gerado por etag_cliente, ou None se não for um deles"""
+    etag = etag.strip().removeprefix("W/")
+    prefixo = f'"{cliente_id}-'
+    if etag.startswith(prefixo) and etag.endswith('"') and etag[len(prefixo):-1].isdigit():
+        return int(etag[len(prefixo):-1])
+    return None
+
+def etag_cliente(doc: Dict[str, Any]) -> str:
+    """ETag forte a partir da versão do documento (ou do conteúdo, para documentos antigos)"""
+    versao = doc.get("versao")
+    if versao is not None:
+        return f'"{doc["id"]}-{versao}"'
+    conteudo = json.dumps(doc, sort_keys=True, default=str).encode()
+    return f'"{hashlib.blake2b(conteudo, digest_size=12).hexdigest()}"'
+
+class CacheClientes:
+    """Cache read-through de clientes por id, mantido pelos métodos de escrita do serviço
+
+    Cada entrada guarda o documento da resposta e o ETag, para que uma leitura
+    condicional (If-None-Match) seja respondida sem consultar o MongoDB.
+
+    Leituras e escritas concorrentes (inclusive de outros workers, com o
+    BackendRedis) podem tentar gravar versões diferentes do mesmo cliente: a
+    gravação só vale se a versão for mais nova que a do cache. A remoção deixa
+    uma lápide por alguns segundos, para que uma leitura feita antes dela não
+    devolva ao cache um cliente que já não existe.
+    """
+
+    def __init__(self, backend=None, ttl_segundos: float = 30, lapide_segundos: float = 5):
+        self.backend = backend if backend is not None else BackendMemoria()
+        self.ttl_segundos = ttl_segundos
+        self.lapide_segundos = min(lapide_segundos, ttl_segundos)
+        self.hits = 0
+        self.misses = 0
+        self.invalidacoes = 0
+
+    async def obter(self, cliente_id: str) -> Optional[Dict[str, Any]]:
+        entrada = await self.backend.get(cliente_id)
+        if entrada is not None and entrada.get("lapide"):
+            entrada = None
+        if entrada is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entrada
+
+    async def guardar(self, cliente_id: str, doc: Dict[str, Any], etag: str, versao: Optional[int]) -> bool:
+        """Guarda a versão lida ou gravada; não substitui uma versão mais nova nem uma lápide"""
+        entrada = {"doc": doc, "etag": etag, "versao": versao}
+        return await self.backend.set_se_mais_nova(cliente_id, entrada, self.ttl_segundos)
+
+    async def invalidar(self, *cliente_ids: str) -> None:
+        """Troca as entradas por lápides, que bloqueiam o preenchimento até expirarem"""
+        if cliente_ids:
+            self.invalidacoes += 1
+            for cliente_id in cliente_ids:
+                await self.backend.set(cliente_id, {"lapide": True}, self.lapide_segundos)
+
+    def estatisticas(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        estatisticas = {
+            "backend": type(self.backend).__name__,
+            "ttl_segundos": self.ttl_segundos,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidacoes": self.invalidacoes,
+            "taxa_acerto": round(self.hits / total, 4) if total else 0.0,
+        }
+        if isinstance(self.backend, BackendMemoria):
+            estatisticas["entradas"] = len(self.backend)
+            estatisticas["max_entradas"] = self.backend.max_entradas
+        return estatisticas
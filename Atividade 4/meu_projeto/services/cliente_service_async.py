@@ -0,0 +1,530 @@
+import base64
+import json
+import logging
+from datetime import datetime, timezone
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple, Union
+from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorDatabase
+from pydantic import ValidationError
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, ExecutionTimeout
+from database import para_analises
+from models.cliente import ClienteCreate, ClienteUpdate
+from services import busca, pipelines, registro_pipelines, rollups
+from services.agrupador import AgrupadorBuscas
+from services.derivados import campos_derivados
+from services.cache import CacheAnalises, CAMPOS_POR_RELATORIO, relatorios_afetados
+from services.cache_clientes import CacheClientes, etag_cliente
+from services.empresas import colecao_clientes, empresa_padrao
+from services.importacao import ErroLinha
+
+def codificar_cursor(ultimo_id: str) -> str:
+    """Gera o token opaco de paginação a partir do último id da página"""
+    bruto = json.dumps({"id": ultimo_id}).encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip("=")
+
+def decodificar_cursor(cursor: str) -> str:
+    """Recupera o último id a partir do token de paginação"""
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return json.loads(bruto)["id"]
+    except Exception:
+        raise ValueError("Cursor de paginação inválido")
+
+logger = logging.getLogger(__name__)
+
+# Campos devolvidos pela API (sem _id e sem os campos derivados internos)
+PROJECAO_CLIENTE = {"_id": 0, "id": 1, "nome": 1, "idade": 1, "ultima_compra": 1}
+# Leituras individuais trazem também a versão, usada no ETag
+PROJECAO_CLIENTE_VERSAO = {**PROJECAO_CLIENTE, "versao": 1}
+
+def resposta_cliente(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Recorta um documento completo nos campos devolvidos pela API"""
+    return {campo: doc.get(campo) for campo in PROJECAO_CLIENTE if campo != "_id"}
+
+def separar_versao(doc: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+    """Separa o documento da resposta e o ETag calculado a partir da versão"""
+    return resposta_cliente(doc), etag_cliente(doc)
+
+async def buscar_clientes_por_ids(
+    db: AsyncIOMotorDatabase,
+    empresa_id: str,
+    ids: List[str],
+    projecao: Dict = PROJECAO_CLIENTE,
+    sessao: Optional[AsyncIOMotorClientSession] = None,
+) -> Dict[str, Dict]:
+    """Clientes existentes da empresa indexados pelo id; ids ausentes ficam de fora"""
+    ids = list(dict.fromkeys(ids))
+    docs = await db[colecao_clientes(empresa_id)].find(
+        {"empresa_id": empresa_id, "id": {"$in": ids}}, projecao, session=sessao
+    ).to_list(length=len(ids))
+    return {doc["id"]: doc for doc in docs}
+
+async def buscar_clientes_por_chaves(
+    db: AsyncIOMotorDatabase, chaves: List[Tuple[str, str]], projecao: Dict = PROJECAO_CLIENTE
+) -> Dict[Tuple[str, str], Dict]:
+    """Versão do lote para o agrupador: chaves (empresa, id), uma consulta $in por empresa"""
+    por_empresa: Dict[str, List[str]] = {}
+    for empresa_id, cliente_id in chaves:
+        por_empresa.setdefault(empresa_id, []).append(cliente_id)
+    encontrados = {}
+    for empresa_id, ids in por_empresa.items():
+        docs = await buscar_clientes_por_ids(db, empresa_id, ids, projecao)
+        encontrados.update({(empresa_id, cliente_id): doc for cliente_id, doc in docs.items()})
+    return encontrados
+
+class ConflitoVersao(Exception):
+    """A versão informada (If-Match) não é mais a versão atual do cliente"""
+
+class TempoEsgotado(RuntimeError):
+    """O MongoDB interrompeu a agregação ao atingir o maxTimeMS"""
+
+async def agregar(
+    db: AsyncIOMotorDatabase,
+    empresa_id: str,
+    nome: str,
+    max_time_ms: int = 0,
+    sessao: Optional[AsyncIOMotorClientSession] = None,
+    **argumentos,
+) -> List[Dict]:
+    """Executa um pipeline do registro com as suas opções e tratamento de erros
+    
+    O pipeline sempre começa pelo $match da empresa. O nome@versão segue
+    como 'comment' para aparecer nas métricas e no log de consultas lentas.
+    O maxTimeMS estourado vira TempoEsgotado (503 nas rotas).
+    """
+    definicao = registro_pipelines.obter(nome)
+    opcoes = definicao.opcoes(max_time_ms)
+    alvo = definicao.colecao_alvo(db, empresa_id)
+    try:
+        pipeline = definicao.montar(empresa_id, **argumentos)
+        return await alvo.aggregate(pipeline, session=sessao, **opcoes).to_list(length=None)
+    except ExecutionTimeout as e:
+        limite = opcoes.get("maxTimeMS")
+        logger.warning("Pipeline %s sobre %s excedeu %s ms", definicao.identificador, alvo.name, limite)
+        raise TempoEsgotado(f"Pipeline {nome} excedeu o tempo limite de {limite} ms") from e
+    except Exception as e:
+        logger.exception("Falha no pipeline %s sobre %s", definicao.identificador, alvo.name)
+        raise RuntimeError(f"Erro ao executar pipeline {nome}: {str(e)}") from e
+
+class ClienteServiceAsync:
+    """Versão assíncrona do ClienteService usada pelas rotas da API"""
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        empresa_id: Optional[str] = None,
+        cache: Optional[CacheAnalises] = None,
+        indexar_trigramas: bool = False,
+        similaridade_min: float = 0.3,
+        usar_campos_derivados: bool = False,
+        agrupador: Optional[AgrupadorBuscas] = None,
+        cache_clientes: Optional[CacheClientes] = None,
+        max_time_ms: int = 0,
+        sessao: Optional[AsyncIOMotorClientSession] = None,
+    ):
+        self.db = db
+        # Toda leitura e escrita fica restrita à empresa (prefixo dos índices)
+        self.empresa_id = empresa_id or empresa_padrao()
+        self.clientes = db[colecao_clientes(self.empresa_id)]
+        self.cache = cache
+        self.indexar_trigramas = indexar_trigramas
+        self.similaridade_min = similaridade_min
+        # Usa as variantes de pipeline baseadas em faixa_etaria/ultima_compra_em
+        self.usar_campos_derivados = usar_campos_derivados
+        # Quando presente, junta buscas por id concorrentes em uma consulta $in
+        self.agrupador = agrupador
+        # Cache read-through dos documentos individuais (GET /clientes/{id})
+        self.cache_clientes = cache_clientes
+        # Limite de tempo das agregações no servidor (0 = sem limite)
+        self.max_time_ms = max_time_ms
+        # Sessão causal da requisição (X-Consistencia-Causal): as leituras veem as
+        # escritas anteriores do cliente, então não passam pelos caches nem pelo agrupador
+        self.sessao = sessao
+    
+    def _invalidar_relatorios(self, relatorios) -> None:
+        if self.cache is not None:
+            self.cache.invalidar(relatorios)
+    
+    async def _aplicar_rollups(self, removidos: List[Dict] = (), adicionados: List[Dict] = ()) -> None:
+        """Mantém os contadores de rollup aplicando a diferença entre versões do cliente"""
+        for colecao, operacoes in rollups.operacoes_rollup(removidos, adicionados).items():
+            await self.db[colecao].bulk_write(operacoes, ordered=True, session=self.sessao)
+    
+    async def _atualizar_trigramas(self, clientes: List[Dict]) -> None:
+        """Mantém a coleção de trigramas usada pela busca aproximada"""
+        if not self.indexar_trigramas:
+            return
+        operacoes = [
+            UpdateOne(
+                {"_id": {"empresa_id": self.empresa_id, "id": c["id"]}},
+                {"$set": {"empresa_id": self.empresa_id, "trigramas": busca.trigramas(c["nome"])}},
+                upsert=True,
+            )
+            for c in clientes if c.get("nome")
+        ]
+        if operacoes:
+            await self.db[busca.COLECAO_TRIGRAMAS].bulk_write(operacoes, ordered=False, session=self.sessao)
+    
+    # Operações CRUD
+    async def criar_cliente(self, cliente: ClienteCreate) -> Dict:
+        """Cria um novo cliente"""
+        resposta, _ = await self.criar_cliente_versionado(cliente)
+        return resposta
+    
+    async def criar_cliente_versionado(self, cliente: ClienteCreate) -> Tuple[Dict, str]:
+        """Cria um novo cliente e devolve também o seu ETag"""
+        cliente_dict = cliente.dict()
+        cliente_dict["empresa_id"] = self.empresa_id
+        cliente_dict.update(campos_derivados(cliente_dict))
+        cliente_dict["atualizado_em"] = datetime.now(timezone.utc)
+        cliente_dict["versao"] = 1
+        # O índice único (empresa_id, id) detecta duplicados na própria inserção (sem find_one antes)
+        try:
+            await self.clientes.insert_one(cliente_dict, session=self.sessao)
+        except DuplicateKeyError:
+            raise ValueError("ID do cliente já existe")
+        
+        await self._aplicar_rollups(adicionados=[cliente_dict])
+        await self._atualizar_trigramas([cliente_dict])
+        self._invalidar_relatorios(CAMPOS_POR_RELATORIO)
+        # O documento gravado já é a resposta: evita reler do banco
+        resposta, etag = separar_versao(cliente_dict)
+        await self._guardar_no_cache(resposta, etag, cliente_dict["versao"])
+        return resposta, etag
+    
+    async def obter_cliente_por_id(self, cliente_id: str) -> Dict:
+        """Obtém um cliente pelo ID"""
+        cliente, _ = await self.obter_cliente_versionado(cliente_id)
+        return cliente
+    
+    async def obter_cliente_versionado(self, cliente_id: str) -> Tuple[Dict, str]:
+        """Obtém um cliente e o seu ETag, passando pelo cache quando configurado"""
+        if self.cache_clientes is not None and self.sessao is None:
+            entrada = await self.cache_clientes.obter(self._chave_cache(cliente_id))
+            if entrada is not None:
+                return entrada["doc"], entrada["etag"]
+        if self.agrupador is not None and self.sessao is None:
+            cliente = await self.agrupador.obter((self.empresa_id, cliente_id))
+        else:
+            cliente = await self.clientes.find_one(
+                self._filtro_versao(cliente_id, None), PROJECAO_CLIENTE_VERSAO, session=self.sessao
+            )
+        if not cliente:
+            raise ValueError("Cliente não encontrado")
+        resposta, etag = separar_versao(cliente)
+        await self._guardar_no_cache(resposta, etag, cliente.get("versao"))
+        return resposta, etag
+    
+    def _chave_cache(self, cliente_id: str) -> str:
+        # O mesmo id pode existir em empresas diferentes
+        return f"{self.empresa_id}/{cliente_id}"
+    
+    async def _guardar_no_cache(self, resposta: Dict, etag: str, versao: Optional[int]) -> None:
+        # Condicional à versão: uma leitura atrasada não sobrescreve uma escrita mais nova
+        if self.cache_clientes is not None:
+            await self.cache_clientes.guardar(self._chave_cache(resposta["id"]), resposta, etag, versao)
+    
+    async def obter_clientes_por_ids(self, ids: List[str]) -> Dict[str, Dict]:
+        """Busca vários clientes em uma única consulta $in (índice único de empresa e id)"""
+        return await buscar_clientes_por_ids(self.db, self.empresa_id, ids, sessao=self.sessao)
+    
+    async def atualizar_cliente(self, cliente_id: str, update_data: ClienteUpdate) -> Dict:
+        """Atualiza um cliente existente"""
+        resposta, _ = await self.atualizar_cliente_versionado(cliente_id, update_data)
+        return resposta
+    
+    async def atualizar_cliente_versionado(
+        self, cliente_id: str, update_data: ClienteUpdate, versao_esperada: Optional[int] = None
+    ) -> Tuple[Dict, str]:
+        """Atualiza um cliente em uma única operação atômica e devolve o novo ETag
+        
+        Com ``versao_esperada`` (If-Match), só grava se a versão não mudou desde
+        a leitura; caso contrário levanta ConflitoVersao.
+        """
+        campos = update_data.dict(exclude_unset=True)
+        campos.update(campos_derivados(campos))
+        campos["atualizado_em"] = datetime.now(timezone.utc)
+        # Retorna a versão anterior (necessária para as diferenças nos rollups);
+        # a nova é montada aqui mesmo, sem outra ida ao banco
+        antigo = await self.clientes.find_one_and_update(
+            self._filtro_versao(cliente_id, versao_esperada),
+            {"$set": campos, "$inc": {"versao": 1}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.BEFORE,
+            session=self.sessao,
+        )
+        
+        if antigo is None:
+            await self._falha_condicional(cliente_id, versao_esperada)
+        
+        novo = {**antigo, **campos, "versao": antigo.get("versao", 0) + 1}
+        await self._aplicar_rollups([antigo], [novo])
+        if "nome" in campos:
+            await self._atualizar_trigramas([novo])
+        self._invalidar_relatorios(relatorios_afetados(campos))
+        resposta, etag = separar_versao(novo)
+        await self._guardar_no_cache(resposta, etag, novo["versao"])
+        return resposta, etag
+    
+    async def deletar_cliente(self, cliente_id: str, versao_esperada: Optional[int] = None) -> bool:
+        """Remove um cliente (opcionalmente só se estiver na versão esperada)"""
+        antigo = await self.clientes.find_one_and_delete(
+            self._filtro_versao(cliente_id, versao_esperada), session=self.sessao
+        )
+        if antigo is None:
+            if versao_esperada is not None and await self.clientes.find_one(
+                self._filtro_versao(cliente_id, None), {"_id": 1}, session=self.sessao
+            ):
+                raise ConflitoVersao("O cliente foi alterado por outra requisição")
+            return False
+        if self.cache_clientes is not None:
+            await self.cache_clientes.invalidar(self._chave_cache(cliente_id))
+        # Marca a remoção para quem sincroniza incrementalmente (analise_vetorizada)
+        await self.db.clientes_removidos.insert_one(
+            {"_id": antigo["_id"], "empresa_id": self.empresa_id, "removido_em": datetime.now(timezone.utc)},
+            session=self.sessao,
+        )
+        await self._aplicar_rollups(removidos=[antigo])
+        if self.indexar_trigramas:
+            await self.db[busca.COLECAO_TRIGRAMAS].delete_one(
+                {"_id": {"empresa_id": self.empresa_id, "id": cliente_id}}, session=self.sessao
+            )
+        self._invalidar_relatorios(CAMPOS_POR_RELATORIO)
+        return True
+    
+    def _filtro_versao(self, cliente_id: str, versao_esperada: Optional[int]) -> Dict:
+        filtro = {"empresa_id": self.empresa_id, "id": cliente_id}
+        if versao_esperada is not None:
+            filtro["versao"] = versao_esperada
+        return filtro
+    
+    async def _falha_condicional(self, cliente_id: str, versao_esperada: Optional[int]) -> None:
+        """Distingue cliente inexistente de versão desatualizada (só no caminho de erro)"""
+        if versao_esperada is not None and await self.clientes.find_one(
+            self._filtro_versao(cliente_id, None), {"_id": 1}, session=self.sessao
+        ):
+            raise ConflitoVersao("O cliente foi alterado por outra requisição")
+        raise ValueError("Cliente não encontrado")
+    
+    def _montar_query(self, filtros: Dict) -> Dict:
+        query = {"empresa_id": self.empresa_id}
+        if "nome" in filtros:
+            query.update(busca.filtro_prefixo(filtros["nome"]))
+        if "idade_min" in filtros:
+            query["idade"] = {"$gte": filtros["idade_min"]}
+        return query
+    
+    async def listar_clientes(
+        self, filtros: Dict = {}, limite: int = 50, cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Lista uma página de clientes ordenada pelo id (paginação por chave)"""
+        query = self._montar_query(filtros)
+        if cursor:
+            query["id"] = {"$gt": decodificar_cursor(cursor)}
+        
+        # Busca um documento a mais para saber se existe próxima página
+        cursor = self.clientes.find(query, PROJECAO_CLIENTE, session=self.sessao)
+        docs = await cursor.sort("id", 1).limit(limite + 1).to_list(length=limite + 1)
+        proximo = codificar_cursor(docs[limite - 1]["id"]) if len(docs) > limite else None
+        return {"itens": docs[:limite], "next": proximo}
+    
+    async def stream_clientes(self, filtros: Dict = {}, batch_size: int = 1000) -> AsyncIterator[Dict]:
+        """Percorre os clientes direto do cursor, sem carregar a coleção em memória"""
+        cursor = self.clientes.find(self._montar_query(filtros), PROJECAO_CLIENTE, session=self.sessao)
+        cursor = cursor.sort("id", 1).batch_size(batch_size)
+        async for doc in cursor:
+            yield doc
+    
+    async def buscar_clientes(self, termo: str, modo: str = "prefixo", limite: int = 20) -> List[Dict]:
+        """Busca por nome: prefixo (autocompletar), texto (palavras inteiras) ou fuzzy"""
+        if modo == "prefixo":
+            filtro = {"empresa_id": self.empresa_id, **busca.filtro_prefixo(termo)}
+            cursor = self.clientes.find(filtro, PROJECAO_CLIENTE, session=self.sessao).sort("nome_normalizado", 1)
+            return await cursor.limit(limite).to_list(length=limite)
+        if modo == "texto":
+            # Ordena pelo textScore sem projetá-lo (MongoDB 4.4+), mantendo a projeção exata da resposta
+            # A igualdade em empresa_id é o prefixo exigido pelo índice de texto composto
+            filtro = {"empresa_id": self.empresa_id, **busca.filtro_texto(termo)}
+            cursor = self.clientes.find(filtro, PROJECAO_CLIENTE, session=self.sessao)
+            cursor = cursor.sort([("relevancia", {"$meta": "textScore"})])
+            return await cursor.limit(limite).to_list(length=limite)
+        if modo == "fuzzy":
+            if not self.indexar_trigramas:
+                raise ValueError("Busca aproximada desativada (BUSCA_FUZZY)")
+            candidatos = await self._agregar(
+                "busca_fuzzy", termo=termo, limite=limite, similaridade_min=self.similaridade_min
+            )
+            ordem = {c["_id"]["id"]: i for i, c in enumerate(candidatos)}
+            docs = await self.clientes.find(
+                {"empresa_id": self.empresa_id, "id": {"$in": list(ordem)}}, PROJECAO_CLIENTE, session=self.sessao
+            ).to_list(length=limite)
+            return sorted(docs, key=lambda d: ordem[d["id"]])
+        raise ValueError("Modo de busca inválido")
+
+    async def importar_clientes(
+        self,
+        registros: AsyncIterator[Tuple[int, Union[Dict, ErroLinha]]],
+        upsert: bool = False,
+        tamanho_lote: int = 1000,
+        max_erros: int = 1000,
+    ) -> Dict[str, Any]:
+        """Importa clientes em lotes, com relatório de erros por linha"""
+        resultado = {"total_linhas": 0, "inseridos": 0, "atualizados": 0, "total_erros": 0, "erros": []}
+        
+        def registrar_erro(linha: int, erro: str, cliente_id: Optional[str] = None):
+            resultado["total_erros"] += 1
+            if len(resultado["erros"]) < max_erros:
+                resultado["erros"].append({"linha": linha, "id": cliente_id, "erro": erro})
+        
+        lote: List[Tuple[int, Dict]] = []
+        async for linha, registro in registros:
+            resultado["total_linhas"] += 1
+            if isinstance(registro, ErroLinha):
+                registrar_erro(linha, registro.mensagem)
+                continue
+            if not isinstance(registro, dict):
+                registrar_erro(linha, "Registro deve ser um objeto JSON")
+                continue
+            try:
+                doc = ClienteCreate(**registro).dict()
+                doc["empresa_id"] = self.empresa_id
+                doc.update(campos_derivados(doc))
+                doc["atualizado_em"] = datetime.now(timezone.utc)
+                doc["versao"] = 1
+                lote.append((linha, doc))
+            except ValidationError as e:
+                campos = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+                registrar_erro(linha, campos, registro.get("id"))
+                continue
+            if len(lote) >= tamanho_lote:
+                await self._gravar_lote(lote, upsert, resultado, registrar_erro)
+                lote = []
+        if lote:
+            await self._gravar_lote(lote, upsert, resultado, registrar_erro)
+        if resultado["inseridos"] or resultado["atualizados"]:
+            self._invalidar_relatorios(CAMPOS_POR_RELATORIO)
+        return resultado
+    
+    async def _gravar_lote(self, lote, upsert, resultado, registrar_erro) -> None:
+        """Grava um lote sem ordenação; falhas individuais não interrompem o lote"""
+        antigos = {}
+        if upsert:
+            ids = [doc["id"] for _, doc in lote]
+            filtro = {"empresa_id": self.empresa_id, "id": {"$in": ids}}
+            async for doc in self.clientes.find(filtro, {"_id": 0}, session=self.sessao):
+                antigos[doc["id"]] = doc
+            # A substituição continua a sequência de versões (muda o ETag)
+            for _, doc in lote:
+                if doc["id"] in antigos:
+                    doc["versao"] = antigos[doc["id"]].get("versao", 0) + 1
+        falhas = set()
+        try:
+            if upsert:
+                result = await self.clientes.bulk_write(
+                    [ReplaceOne(self._filtro_versao(doc["id"], None), doc, upsert=True) for _, doc in lote],
+                    ordered=False,
+                    session=self.sessao,
+                )
+                resultado["inseridos"] += result.upserted_count
+                resultado["atualizados"] += result.matched_count
+            else:
+                result = await self.clientes.insert_many([doc for _, doc in lote], ordered=False, session=self.sessao)
+                resultado["inseridos"] += len(result.inserted_ids)
+        except BulkWriteError as e:
+            detalhes = e.details
+            resultado["inseridos"] += detalhes.get("nInserted", 0) + detalhes.get("nUpserted", 0)
+            resultado["atualizados"] += detalhes.get("nMatched", 0)
+            for erro in detalhes.get("writeErrors", []):
+                falhas.add(erro["index"])
+                linha, doc = lote[erro["index"]]
+                mensagem = "ID do cliente já existe" if erro.get("code") == 11000 else erro.get("errmsg", "Erro de escrita")
+                registrar_erro(linha, mensagem, doc["id"])
+        
+        gravados = [doc for indice, (_, doc) in enumerate(lote) if indice not in falhas]
+        removidos = [antigos[doc["id"]] for doc in gravados if doc["id"] in antigos]
+        await self._aplicar_rollups(removidos, gravados)
+        if removidos and self.cache_clientes is not None:
+            await self.cache_clientes.invalidar(*(self._chave_cache(doc["id"]) for doc in removidos))
+        await self._atualizar_trigramas(gravados)
+
+    # Métodos de Análise
+    async def analisar_faixa_etaria(self) -> List[Dict[str, Any]]:
+        """Agrupa clientes por faixa etária com estatísticas de compra (lido dos rollups)"""
+        async def calcular():
+            docs_idade, docs_idade_produto = await self._ler_rollups_idade()
+            return rollups.relatorio_faixa_etaria(docs_idade, docs_idade_produto)
+        return await self._com_cache("faixa_etaria", (), calcular)
+    
+    async def segmentacao_rfm(
+        self, inicio: Optional[datetime] = None, fim: Optional[datetime] = None
+    ) -> List[Dict[str, Any]]:
+        """Segmentação RFM (Recência, Frequência, Valor Monetário)
+        
+        Sem janela, usa apenas a recência da última compra de cada cliente; com
+        janela, calcula R/F/M a partir dos rollups diários de compras.
+        """
+        if inicio is None or fim is None:
+            return await self._executar_pipeline(
+                "segmentacao_rfm", "rfm", campos_derivados=self.usar_campos_derivados
+            )
+        return await self._executar_pipeline("rfm_janela", "rfm", (inicio, fim), inicio=inicio, fim=fim)
+    
+    async def produtos_mais_vendidos(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Lista os produtos mais vendidos (lido dos rollups)"""
+        async def calcular():
+            cursor = para_analises(self.db[rollups.COLECAO_PRODUTO]).find(
+                {**rollups.FILTRO_PRODUTOS, "empresa_id": self.empresa_id},
+                comment="produtos_mais_vendidos",
+                session=self.sessao,
+            ).sort(rollups.ORDEM_PRODUTOS).limit(limit)
+            return [rollups.relatorio_produto(doc) async for doc in cursor]
+        return await self._com_cache("produtos_mais_vendidos", (limit,), calcular)
+    
+    async def clientes_maior_valor_compra(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Lista clientes que fizeram as compras de maior valor"""
+        return await self._executar_pipeline("maior_valor_compra", "maior_valor_compra", (limit,), limit=limit)
+    
+    async def comportamento_por_idade(self) -> List[Dict[str, Any]]:
+        """Analisa comportamento de compra por faixa etária (lido dos rollups)"""
+        async def calcular():
+            docs_idade, docs_idade_produto = await self._ler_rollups_idade()
+            return rollups.relatorio_comportamento_por_idade(docs_idade, docs_idade_produto)
+        return await self._com_cache("comportamento_idade", (), calcular)
+    
+    async def dashboard(self, facetas: List[str], limit: int = 10) -> Dict[str, List[Dict[str, Any]]]:
+        """Calcula vários relatórios em uma única agregação com $facet"""
+        desconhecidas = set(facetas) - set(pipelines.FACETAS_DASHBOARD)
+        if desconhecidas:
+            raise ValueError(f"Relatórios desconhecidos: {', '.join(sorted(desconhecidas))}")
+        facetas = sorted(set(facetas))
+        resultado = await self._executar_pipeline(
+            "dashboard", "dashboard", (tuple(facetas), limit),
+            facetas=facetas, limit=limit, campos_derivados=self.usar_campos_derivados,
+        )
+        return resultado[0] if resultado else {nome: [] for nome in facetas}
+    
+    async def _ler_rollups_idade(self) -> Tuple[List[Dict], List[Dict]]:
+        docs_idade = await para_analises(self.db[rollups.COLECAO_IDADE]).find(
+            {"empresa_id": self.empresa_id}, comment="rollups_idade", session=self.sessao
+        ).to_list(length=None)
+        docs_idade_produto = await para_analises(self.db[rollups.COLECAO_IDADE_PRODUTO]).find(
+            {"empresa_id": self.empresa_id, "total": {"$gt": 0}}, comment="rollups_idade", session=self.sessao
+        ).to_list(length=None)
+        return docs_idade, docs_idade_produto
+    
+    async def _com_cache(self, relatorio: str, params: Tuple, calcular) -> Any:
+        if self.cache is not None and self.sessao is None:
+            # A empresa faz parte da chave; a invalidação por relatório vale para todas
+            return await self.cache.obter(relatorio, (self.empresa_id, *params), calcular)
+        return await calcular()
+    
+    async def _executar_pipeline(
+        self, nome: str, relatorio: Optional[str] = None, params: Tuple = (), **argumentos
+    ) -> List[Dict]:
+        """Executa um pipeline registrado, usando o cache quando o relatório é nomeado"""
+        if relatorio is not None:
+            return await self._com_cache(relatorio, params, lambda: self._agregar(nome, **argumentos))
+        return await self._agregar(nome, **argumentos)
+    
+    async def _agregar(self, nome: str, **argumentos) -> List[Dict]:
+        return await agregar(self.db, self.empresa_id, nome, self.max_time_ms, self.sessao, **argumentos)
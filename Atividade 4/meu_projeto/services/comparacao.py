@@ -0,0 +1,19 @@
+from typing import Any, Dict, Iterable, List
+
+
+def _normalizar(relatorio: List[Dict], chave: str, ignorar: Iterable[str] = ()) -> Dict[Any, Dict]:
+    ignorar = set(ignorar)
+    return {r[chave]: {k: v for k, v in r.items() if k not in ignorar} for r in relatorio}
+
+
+def comparar_relatorios(
+    nome: str, obtido: List[Dict], esperado: List[Dict], chave: str, ignorar: Iterable[str] = ()
+) -> List[str]:
+    """Compara dois relatórios linha a linha pela chave; retorna as divergências"""
+    a = _normalizar(obtido, chave, ignorar)
+    b = _normalizar(esperado, chave, ignorar)
+    return [
+        f"{nome}[{k}]: obtido={a.get(k)} esperado={b.get(k)}"
+        for k in sorted(set(a) | set(b), key=str)
+        if a.get(k) != b.get(k)
+    ]
@@ -0,0 +1,238 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+from database import para_analises, remover_indices_async
+from models.compra import CompraCreate
+from services.cache import CacheAnalises
+from services.cliente_service_async import agregar
+from services.empresas import empresa_padrao
+from services.sketches import HyperLogLog
+
+logger = logging.getLogger(__name__)
+
+COLECAO_COMPRAS = "compras"
+# metaField dos eventos: os buckets da time-series são separados por empresa e cliente
+META_COMPRAS = "meta"
+INDICE_COMPRAS = [("empresa_id", 1), ("cliente_id", 1), ("data", 1)]
+COLECAO_CLIENTE_DIARIO = "compras_cliente_diario"
+COLECAO_PRODUTO_DIARIO = "compras_produto_diario"
+COLECAO_CLIENTE_RESUMO = "compras_cliente"
+# Compras de cada cliente por produto (matriz das recomendações)
+COLECAO_CLIENTE_PRODUTO = "compras_cliente_produto"
+# Sincronização incremental e releitura das linhas de um cliente (services/recomendacoes.py)
+INDICES_CLIENTE_PRODUTO = [[("empresa_id", 1), ("atualizado_em", 1)], [("empresa_id", 1), ("cliente_id", 1)]]
+# Sketch HyperLogLog dos clientes distintos de cada produto no dia
+CAMPO_CLIENTES_HLL = "clientes_hll"
+
+# Índices anteriores à separação por empresa (o único impediria o mesmo cliente/produto em duas empresas)
+INDICES_COMPRAS_SUBSTITUIDOS = {
+    COLECAO_COMPRAS: ["cliente_id_1_data_1"],
+    COLECAO_CLIENTE_DIARIO: ["cliente_id_1_dia_1", "dia_1_cliente_id_1_compras_1_valor_1"],
+    COLECAO_PRODUTO_DIARIO: ["produto_1_dia_1", "dia_1_produto_1_vendas_1_valor_1"],
+}
+
+def inicio_do_dia(data: datetime) -> datetime:
+    """Meia-noite UTC do dia da data (sem fuso, a data já é tratada como UTC)"""
+    if data.tzinfo is not None:
+        data = data.astimezone(timezone.utc)
+    return datetime(data.year, data.month, data.day)
+
+async def configurar_colecoes_compras(db: AsyncIOMotorDatabase) -> None:
+    """Cria a coleção time-series de eventos e os índices dos rollups de compras
+
+    Migração: o metaField de uma time-series não pode ser alterado no lugar
+    (collMod não o muda e a coleção não pode ser renomeada). Um banco criado
+    com o metaField antigo ("cliente_id", que mistura as empresas nos buckets)
+    continua funcionando, porque empresa_id e cliente_id seguem gravados no
+    topo de cada evento. Para passar ao metaField novo: pare as escritas de
+    compras, copie os eventos para uma coleção comum, apague "compras",
+    reinicie a API (que recria a coleção) e reinsira os eventos com o campo
+    "meta" ({empresa_id, cliente_id}).
+    """
+    try:
+        await db.create_collection(
+            COLECAO_COMPRAS,
+            timeseries={"timeField": "data", "metaField": META_COMPRAS, "granularity": "hours"},
+        )
+    except CollectionInvalid:
+        # Já existe
+        async for info in db.list_collections(filter={"name": COLECAO_COMPRAS}):
+            meta = info.get("options", {}).get("timeseries", {}).get("metaField")
+            if meta not in (None, META_COMPRAS):
+                logger.warning(
+                    "A coleção %s usa o metaField %r; veja a migração em configurar_colecoes_compras",
+                    COLECAO_COMPRAS, meta,
+                )
+    except OperationFailure:
+        # Servidor sem suporte a time-series (< 5.0): usa uma coleção comum
+        await db.create_collection(COLECAO_COMPRAS)
+    try:
+        await db[COLECAO_COMPRAS].create_index(INDICE_COMPRAS)
+    except OperationFailure:
+        # MongoDB 5.0 só indexa o metaField e o timeField de uma time-series
+        await db[COLECAO_COMPRAS].create_index(
+            [(f"{META_COMPRAS}.empresa_id", 1), (f"{META_COMPRAS}.cliente_id", 1), ("data", 1)]
+        )
+    await db[COLECAO_CLIENTE_DIARIO].create_index([("empresa_id", 1), ("cliente_id", 1), ("dia", 1)], unique=True)
+    # Índice de cobertura para as consultas de RFM por janela
+    await db[COLECAO_CLIENTE_DIARIO].create_index(
+        [("empresa_id", 1), ("dia", 1), ("cliente_id", 1), ("compras", 1), ("valor", 1)]
+    )
+    await db[COLECAO_PRODUTO_DIARIO].create_index([("empresa_id", 1), ("produto", 1), ("dia", 1)], unique=True)
+    await db[COLECAO_PRODUTO_DIARIO].create_index(
+        [("empresa_id", 1), ("dia", 1), ("produto", 1), ("vendas", 1), ("valor", 1)]
+    )
+    for chaves in INDICES_CLIENTE_PRODUTO:
+        await db[COLECAO_CLIENTE_PRODUTO].create_index(chaves)
+    await remover_indices_async(db, INDICES_COMPRAS_SUBSTITUIDOS)
+
+class CompraServiceAsync:
+    """Registro de eventos de compra e manutenção dos rollups por cliente e produto"""
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        empresa_id: Optional[str] = None,
+        cache: Optional[CacheAnalises] = None,
+        max_time_ms: int = 0,
+        sessao: Optional[AsyncIOMotorClientSession] = None,
+    ):
+        self.db = db
+        self.empresa_id = empresa_id or empresa_padrao()
+        self.cache = cache
+        self.max_time_ms = max_time_ms
+        # Sessão causal da requisição; com ela os relatórios não saem do cache
+        self.sessao = sessao
+
+    async def registrar_compras(self, compras: List[CompraCreate]) -> Dict[str, Any]:
+        """Grava um lote de eventos e atualiza os agregados com uma escrita por chave"""
+        # As datas chegam em UTC (CompraCreate); os agregados são montados antes de
+        # qualquer escrita, então um lote inválido não deixa eventos sem agregado
+        eventos = [
+            {
+                **compra.dict(), "empresa_id": self.empresa_id,
+                META_COMPRAS: {"empresa_id": self.empresa_id, "cliente_id": compra.cliente_id},
+            }
+            for compra in compras
+        ]
+        por_cliente_dia: Dict[tuple, Dict[str, Any]] = defaultdict(lambda: {"compras": 0, "valor": 0.0})
+        por_produto_dia: Dict[tuple, Dict[str, Any]] = defaultdict(lambda: {"vendas": 0, "valor": 0.0})
+        clientes_produto_dia: Dict[tuple, HyperLogLog] = defaultdict(HyperLogLog)
+        por_cliente_produto: Dict[tuple, Dict[str, Any]] = defaultdict(lambda: {"compras": 0, "valor": 0.0})
+        por_cliente: Dict[str, Dict[str, Any]] = {}
+        for evento in eventos:
+            dia = inicio_do_dia(evento["data"])
+            cliente_dia = por_cliente_dia[(evento["cliente_id"], dia)]
+            cliente_dia["compras"] += 1
+            cliente_dia["valor"] += evento["valor"]
+            produto_dia = por_produto_dia[(evento["produto"], dia)]
+            produto_dia["vendas"] += 1
+            produto_dia["valor"] += evento["valor"]
+            clientes_produto_dia[(evento["produto"], dia)].adicionar(evento["cliente_id"])
+            cliente_produto = por_cliente_produto[(evento["cliente_id"], evento["produto"])]
+            cliente_produto["compras"] += 1
+            cliente_produto["valor"] += evento["valor"]
+            resumo = por_cliente.setdefault(
+                evento["cliente_id"],
+                {"frequencia": 0, "valor_total": 0.0, "primeira": evento["data"], "ultima": evento["data"]},
+            )
+            resumo["frequencia"] += 1
+            resumo["valor_total"] += evento["valor"]
+            resumo["primeira"] = min(resumo["primeira"], evento["data"])
+            resumo["ultima"] = max(resumo["ultima"], evento["data"])
+
+        await self.db[COLECAO_COMPRAS].insert_many(eventos, ordered=False, session=self.sessao)
+        await self.db[COLECAO_CLIENTE_DIARIO].bulk_write([
+            UpdateOne({"empresa_id": self.empresa_id, "cliente_id": cliente_id, "dia": dia}, {"$inc": inc}, upsert=True)
+            for (cliente_id, dia), inc in por_cliente_dia.items()
+        ], ordered=False, session=self.sessao)
+        await self.db[COLECAO_PRODUTO_DIARIO].bulk_write([
+            UpdateOne(
+                {"empresa_id": self.empresa_id, "produto": produto, "dia": dia},
+                # $max registrador a registrador junta o sketch do lote ao já gravado
+                {"$inc": inc, "$max": clientes_produto_dia[(produto, dia)].atualizacao_max(CAMPO_CLIENTES_HLL)},
+                upsert=True,
+            )
+            for (produto, dia), inc in por_produto_dia.items()
+        ], ordered=False, session=self.sessao)
+        await self.db[COLECAO_CLIENTE_RESUMO].bulk_write([
+            UpdateOne(
+                {"_id": {"empresa_id": self.empresa_id, "cliente_id": cliente_id}},
+                {
+                    "$inc": {"frequencia": resumo["frequencia"], "valor_total": resumo["valor_total"]},
+                    "$setOnInsert": {"empresa_id": self.empresa_id},
+                    "$min": {"primeira_compra": resumo["primeira"]},
+                    "$max": {"ultima_compra": resumo["ultima"]},
+                },
+                upsert=True,
+            )
+            for cliente_id, resumo in por_cliente.items()
+        ], ordered=False, session=self.sessao)
+        agora = datetime.now(timezone.utc)
+        await self.db[COLECAO_CLIENTE_PRODUTO].bulk_write([
+            UpdateOne(
+                {"_id": {"empresa_id": self.empresa_id, "cliente_id": cliente_id, "produto": produto}},
+                {
+                    "$inc": inc,
+                    # atualizado_em marca o par para a sincronização incremental das recomendações
+                    "$set": {"atualizado_em": agora},
+                    "$setOnInsert": {"empresa_id": self.empresa_id, "cliente_id": cliente_id, "produto": produto},
+                },
+                upsert=True,
+            )
+            for (cliente_id, produto), inc in por_cliente_produto.items()
+        ], ordered=False, session=self.sessao)
+
+        if self.cache is not None:
+            self.cache.invalidar(["rfm", "produtos_periodo"])
+        return {
+            "registradas": len(eventos),
+            "clientes_afetados": len(por_cliente),
+            "produtos_afetados": len({produto for produto, _ in por_produto_dia}),
+        }
+
+    async def resumo_cliente(self, cliente_id: str) -> Dict[str, Any]:
+        """Frequência e valor monetário acumulados de um cliente"""
+        resumo = await self.db[COLECAO_CLIENTE_RESUMO].find_one(
+            {"_id": {"empresa_id": self.empresa_id, "cliente_id": cliente_id}}, {"empresa_id": 0}, session=self.sessao
+        )
+        if not resumo:
+            raise ValueError("Cliente sem compras registradas")
+        resumo["cliente_id"] = resumo.pop("_id")["cliente_id"]
+        return resumo
+
+    async def produtos_por_periodo(self, inicio: datetime, fim: datetime, limit: int = 10) -> List[Dict[str, Any]]:
+        """Vendas por produto em uma janela de datas, lidas do rollup diário
+        
+        clientes_distintos é a estimativa (HyperLogLog, erro de ~3%) da junção
+        dos sketches diários de cada produto do resultado.
+        """
+        async def calcular():
+            resultado = await agregar(
+                self.db, self.empresa_id, "produtos_periodo", self.max_time_ms, self.sessao,
+                inicio=inicio, fim=fim, limit=limit,
+            )
+            sketches = defaultdict(HyperLogLog)
+            cursor = para_analises(self.db[COLECAO_PRODUTO_DIARIO]).find(
+                {
+                    "empresa_id": self.empresa_id,
+                    "produto": {"$in": [linha["produto"] for linha in resultado]},
+                    "dia": {"$gte": inicio, "$lte": fim},
+                },
+                {"_id": 0, "produto": 1, CAMPO_CLIENTES_HLL: 1},
+                session=self.sessao,
+            )
+            async for doc in cursor:
+                sketches[doc["produto"]].mesclar(doc.get(CAMPO_CLIENTES_HLL))
+            for linha in resultado:
+                linha["clientes_distintos"] = sketches[linha["produto"]].estimar()
+            return resultado
+        if self.cache is not None and self.sessao is None:
+            return await self.cache.obter("produtos_periodo", (self.empresa_id, inicio, fim, limit), calcular)
+        return await calcular()
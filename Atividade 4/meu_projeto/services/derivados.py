@@ -0,0 +1,31 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from services.busca import normalizar_nome
+from services.pipelines import ROTULOS_IDADE
+from services.rollups import bucket_idade
+
+def rotulo_faixa_etaria(idade: Any) -> str:
+    """Mesmo rótulo de expr_faixa_idade (pipelines de faixa etária)"""
+    return ROTULOS_IDADE[bucket_idade(idade)]
+
+def data_compra(compra: Optional[Dict[str, Any]]) -> Optional[datetime]:
+    """Converte a data 'YYYY-MM-DD' da compra em datetime (BSON date)"""
+    data = (compra or {}).get("data")
+    if isinstance(data, datetime):
+        return data
+    try:
+        return datetime.fromisoformat(str(data)[:10]) if data else None
+    except ValueError:
+        return None
+
+def campos_derivados(campos: Dict[str, Any]) -> Dict[str, Any]:
+    """Campos calculados na escrita a partir dos campos informados do cliente"""
+    derivados = {}
+    if campos.get("nome"):
+        derivados["nome_normalizado"] = normalizar_nome(campos["nome"])
+    if campos.get("idade") is not None:
+        derivados["faixa_etaria"] = rotulo_faixa_etaria(campos["idade"])
+    if "ultima_compra" in campos:
+        derivados["ultima_compra_em"] = data_compra(campos["ultima_compra"])
+    return derivados
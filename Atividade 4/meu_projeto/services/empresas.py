@@ -0,0 +1,31 @@
+import re
+from typing import Dict, List
+
+from config import get_settings
+
+PADRAO_ID_EMPRESA = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+def empresa_padrao() -> str:
+    """Empresa das requisições sem X-Empresa-Id e dos documentos anteriores à separação"""
+    return get_settings().empresa_padrao
+
+def validar_empresa_id(empresa_id: str) -> str:
+    if not PADRAO_ID_EMPRESA.match(empresa_id or ""):
+        raise ValueError("Identificador de empresa inválido (letras, números, _ e -, até 64)")
+    return empresa_id
+
+def colecao_clientes(empresa_id: str) -> str:
+    """Coleção de clientes da empresa: dedicada (EMPRESAS_DEDICADAS) ou a compartilhada"""
+    if empresa_id in get_settings().empresas_dedicadas:
+        return f"clientes__{empresa_id}"
+    return "clientes"
+
+def colecoes_clientes() -> List[str]:
+    """Todas as coleções de clientes: a compartilhada e as dedicadas"""
+    return ["clientes"] + [f"clientes__{empresa}" for empresa in get_settings().empresas_dedicadas]
+
+def com_empresa(pipeline: List[Dict], empresa_id: str) -> List[Dict]:
+    """Faz o pipeline começar pelo $match da empresa (usa o prefixo dos índices)"""
+    if pipeline and "$match" in pipeline[0] and "empresa_id" not in pipeline[0]["$match"]:
+        return [{"$match": {"empresa_id": empresa_id, **pipeline[0]["$match"]}}] + pipeline[1:]
+    return [{"$match": {"empresa_id": empresa_id}}] + pipeline
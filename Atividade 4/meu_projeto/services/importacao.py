@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Tuple, Union
+
+CAMPOS_CSV = ["id", "nome", "idade", "produto", "valor", "data"]
+
+@dataclass(frozen=True)
+class ErroLinha:
+    """Linha que não pôde ser lida; vai para o relatório de erros da importação"""
+    mensagem: str
+
+def _decodificar(linha: bytes) -> Union[str, ErroLinha]:
+    try:
+        return linha.decode("utf-8-sig").rstrip("\r")
+    except UnicodeDecodeError as e:
+        return ErroLinha(f"Texto fora de UTF-8 (byte {e.start + 1} da linha)")
+
+async def linhas_do_corpo(corpo: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Union[str, ErroLinha]]]:
+    """Quebra o corpo recebido em pedaços em linhas numeradas (a partir de 1)
+
+    Uma linha que não é UTF-8 válido vira ErroLinha e a importação continua.
+    """
+    resto = b""
+    numero = 0
+    async for pedaco in corpo:
+        resto += pedaco
+        *linhas, resto = resto.split(b"\n")
+        for linha in linhas:
+            numero += 1
+            yield numero, _decodificar(linha)
+    if resto.strip():
+        yield numero + 1, _decodificar(resto)
+
+async def ler_ndjson(linhas: AsyncIterator[Tuple[int, Union[str, ErroLinha]]]) -> AsyncIterator[Tuple[int, Union[Dict, ErroLinha]]]:
+    """Converte cada linha NDJSON em dict (ou em ErroLinha)"""
+    async for numero, linha in linhas:
+        if isinstance(linha, ErroLinha):
+            yield numero, linha
+            continue
+        if not linha.strip():
+            continue
+        try:
+            registro = json.loads(linha)
+        except json.JSONDecodeError as e:
+            yield numero, ErroLinha(f"JSON inválido: {e.msg}")
+            continue
+        if not isinstance(registro, dict):
+            yield numero, ErroLinha("Cada linha deve ser um objeto JSON")
+            continue
+        yield numero, registro
+
+async def ler_csv(linhas: AsyncIterator[Tuple[int, Union[str, ErroLinha]]]) -> AsyncIterator[Tuple[int, Union[Dict, ErroLinha]]]:
+    """Converte registros CSV (id,nome,idade,produto,valor,data) no formato de ClienteCreate
+
+    Um campo entre aspas pode ocupar várias linhas; o registro é numerado pela
+    linha em que começa.
+    """
+    cabecalho = None
+    pendente: List[str] = []
+    inicio = 0
+    async for numero, linha in linhas:
+        if isinstance(linha, ErroLinha):
+            pendente = []
+            yield numero, linha
+            continue
+        if not pendente:
+            if not linha.strip():
+                continue
+            inicio = numero
+        pendente.append(linha)
+        texto = "\n".join(pendente)
+        # Número ímpar de aspas: o campo continua na próxima linha ("" conta duas vezes)
+        if texto.count('"') % 2:
+            continue
+        pendente = []
+        valores = next(csv.reader(io.StringIO(texto, newline="")))
+        if cabecalho is None:
+            cabecalho = [c.strip() for c in valores]
+            continue
+        if len(valores) != len(cabecalho):
+            yield inicio, ErroLinha("Quantidade de colunas diferente do cabeçalho")
+            continue
+        registro = dict(zip(cabecalho, valores))
+        cliente = {"id": registro.get("id"), "nome": registro.get("nome"), "idade": registro.get("idade")}
+        if registro.get("produto"):
+            cliente["ultima_compra"] = {
+                "produto": registro["produto"],
+                "valor": registro.get("valor"),
+                "data": registro.get("data"),
+            }
+        yield inicio, cliente
+    if pendente:
+        yield inicio, ErroLinha("Aspas não fechadas até o fim do arquivo")
@@ -0,0 +1,478 @@
+from datetime import datetime
+from typing import List, Dict
+
+# Tamanho máximo das listas de amostra (nomes, produtos) dentro de um grupo.
+# $firstN guarda só N valores por grupo, em vez de acumular o grupo inteiro com
+# $push/$addToSet (limite de 100 MB por estágio e de 16 MB por documento).
+MAX_AMOSTRA = 5
+MAX_EXEMPLOS = 3
+
+# Faixas de idade de todos os relatórios (faixa_etaria, comportamento_idade, os
+# rollups, o campo derivado faixa_etaria e os pipelines da Atividade 3): limite
+# inferior -> rótulo. Idades fora de [0, 100) ou não numéricas ficam em "Outros".
+LIMITES_IDADE = [0, 20, 30, 40, 50, 60, 100]
+FAIXA_OUTROS = "Outros"
+ROTULOS_IDADE = {
+    0: "0-19", 20: "20-29", 30: "30-39", 40: "40-49", 50: "50-59", 60: "60+", FAIXA_OUTROS: FAIXA_OUTROS,
+}
+
+def expr_faixa_idade(campo: str = "$idade", rotulos: bool = True) -> Dict:
+    """Faixa de idade como expressão, equivalente ao $bucket de LIMITES_IDADE
+
+    Devolve o rótulo (ROTULOS_IDADE) ou, sem rotulos, o limite inferior da faixa
+    (a chave dos rollups); fora das faixas, "Outros".
+    """
+    return {
+        "$switch": {
+            "branches": [
+                {
+                    "case": {"$and": [
+                        {"$isNumber": campo},
+                        {"$gte": [campo, inferior]},
+                        {"$lt": [campo, superior]}
+                    ]},
+                    "then": ROTULOS_IDADE[inferior] if rotulos else inferior
+                }
+                for inferior, superior in zip(LIMITES_IDADE, LIMITES_IDADE[1:])
+            ],
+            "default": FAIXA_OUTROS
+        }
+    }
+
+def _amostra(campo: str, n: int) -> Dict:
+    """Acumulador com os primeiros N valores do campo no grupo (memória limitada)"""
+    return {"$firstN": {"input": campo, "n": n}}
+
+def _sem_nulos(campo: str) -> Dict:
+    # $firstN devolve null para campos ausentes, que $push ignorava
+    return {"$filter": {"input": campo, "cond": {"$ne": ["$$this", None]}}}
+
+def pipeline_faixa_etaria() -> List[Dict]:
+    """Agrupa clientes por faixa etária com estatísticas de compra"""
+    return [
+        {
+            "$bucket": {
+                "groupBy": "$idade",
+                "boundaries": LIMITES_IDADE,
+                "default": FAIXA_OUTROS,
+                "output": {
+                    "total": {"$sum": 1},
+                    "valor_medio": {"$avg": "$ultima_compra.valor"},
+                    "produtos": _amostra("$ultima_compra.produto", MAX_AMOSTRA)
+                }
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "faixa": {
+                    "$switch": {
+                        "branches": [
+                            {"case": {"$eq": ["$_id", chave]}, "then": rotulo}
+                            for chave, rotulo in ROTULOS_IDADE.items()
+                        ],
+                        "default": "Desconhecido"
+                    }
+                },
+                "total_clientes": "$total",
+                "valor_medio": {"$round": ["$valor_medio", 2]},
+                "produtos_populares": _sem_nulos("$produtos")
+            }
+        },
+        {"$sort": {"faixa": 1}}
+    ]
+
+def pipeline_segmentacao_rfm(campos_derivados: bool = False) -> List[Dict]:
+    """Segmentação RFM (Recência, Frequência, Valor Monetário)
+    
+    Com campos_derivados, usa a data BSON gravada em ultima_compra_em (indexada)
+    em vez de converter a string de cada documento com $toDate.
+    """
+    if campos_derivados:
+        filtro = {"ultima_compra_em": {"$type": "date"}}
+        data_compra = "$ultima_compra_em"
+    else:
+        filtro = {
+            "ultima_compra": {"$exists": True},
+            "ultima_compra.data": {"$exists": True}
+        }
+        data_compra = {"$toDate": "$ultima_compra.data"}
+    return [
+        {"$match": filtro},
+        {
+            "$addFields": {
+                "recencia": {
+                    "$dateDiff": {
+                        "startDate": data_compra,
+                        "endDate": "$$NOW",
+                        "unit": "day"
+                    }
+                }
+            }
+        },
+        {
+            "$bucket": {
+                "groupBy": "$recencia",
+                "boundaries": [0, 30, 90, 180, 365],
+                "default": "Inativo",
+                "output": {
+                    "count": {"$sum": 1},
+                    "valor_medio": {"$avg": "$ultima_compra.valor"},
+                    "recencia_media": {"$avg": "$recencia"}
+                }
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "segmento": {
+                    "$switch": {
+                        "branches": [
+                            {"case": {"$eq": ["$_id", 0]}, "then": "Ativo (0-30 dias)"},
+                            {"case": {"$eq": ["$_id", 30]}, "then": "Regular (30-90 dias)"},
+                            {"case": {"$eq": ["$_id", 90]}, "then": "Levemente Inativo (90-180 dias)"},
+                            {"case": {"$eq": ["$_id", 180]}, "then": "Inativo (180-365 dias)"},
+                            {"case": {"$eq": ["$_id", "Inativo"]}, "then": "Muito Inativo (365+ dias)"}
+                        ],
+                        "default": "Desconhecido"
+                    }
+                },
+                "recencia_media": {"$round": ["$recencia_media", 1]},
+                "valor_medio": {"$round": ["$valor_medio", 2]},
+                "total_clientes": "$count"
+            }
+        },
+        {"$sort": {"recencia_media": 1}}
+    ]
+
+def pipeline_produtos_mais_vendidos(limit: int = 10) -> List[Dict]:
+    """Lista os produtos mais vendidos"""
+    return [
+        {
+            "$match": {
+                "ultima_compra.produto": {"$exists": True}
+            }
+        },
+        {
+            "$group": {
+                "_id": "$ultima_compra.produto",
+                "total_vendas": {"$sum": 1},
+                "valor_total": {"$sum": "$ultima_compra.valor"},
+                "exemplo_clientes": _amostra("$nome", MAX_EXEMPLOS)
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "produto": "$_id",
+                "total_vendas": 1,
+                "valor_total": 1,
+                "valor_medio": {"$round": [{"$divide": ["$valor_total", "$total_vendas"]}, 2]},
+                "exemplo_clientes": _sem_nulos("$exemplo_clientes")
+            }
+        },
+        {"$sort": {"total_vendas": -1}},
+        {"$limit": limit}
+    ]
+
+def pipeline_clientes_maior_valor_compra(limit: int = 10) -> List[Dict]:
+    """Lista clientes que fizeram as compras de maior valor"""
+    return [
+        {
+            "$match": {
+                "ultima_compra.valor": {"$exists": True}
+            }
+        },
+        {
+            "$sort": {"ultima_compra.valor": -1}
+        },
+        {
+            "$limit": limit
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "id": 1,
+                "nome": 1,
+                "idade": 1,
+                "produto": "$ultima_compra.produto",
+                "valor_compra": "$ultima_compra.valor",
+                "data_compra": "$ultima_compra.data"
+            }
+        }
+    ]
+
+def pipeline_comportamento_por_idade(campos_derivados: bool = False) -> List[Dict]:
+    """Analisa comportamento de compra por faixa etária
+    
+    Com campos_derivados, agrupa pelo faixa_etaria gravado na escrita em vez de
+    recalcular o $switch para cada documento (clientes sem idade não têm o campo
+    e ficam em "Outros", como no $switch).
+    """
+    faixa = {"$ifNull": ["$faixa_etaria", FAIXA_OUTROS]} if campos_derivados else expr_faixa_idade()
+    # Produtos distintos contados em dois $group (faixa+produto, depois faixa):
+    # a memória cresce com os pares distintos, que podem ir para disco, e não com
+    # um array $addToSet dentro de um único documento
+    return [
+        {
+            "$group": {
+                "_id": {"faixa": faixa, "produto": {"$ifNull": ["$ultima_compra.produto", None]}},
+                "total_clientes": {"$sum": 1},
+                "soma_valor": {"$sum": "$ultima_compra.valor"},
+                "qtd_valor": {"$sum": {"$cond": [{"$isNumber": "$ultima_compra.valor"}, 1, 0]}}
+            }
+        },
+        {
+            "$group": {
+                "_id": "$_id.faixa",
+                "total_clientes": {"$sum": "$total_clientes"},
+                "soma_valor": {"$sum": "$soma_valor"},
+                "qtd_valor": {"$sum": "$qtd_valor"},
+                "variedade_produtos": {"$sum": {"$cond": [{"$eq": ["$_id.produto", None]}, 0, 1]}}
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "faixa_etaria": "$_id",
+                "total_clientes": 1,
+                "valor_medio_compra": {
+                    "$cond": [
+                        {"$gt": ["$qtd_valor", 0]},
+                        {"$round": [{"$divide": ["$soma_valor", "$qtd_valor"]}, 2]},
+                        None
+                    ]
+                },
+                "variedade_produtos": 1
+            }
+        },
+        {"$sort": {"faixa_etaria": 1}}
+    ]
+
+# Relatórios da Atividade 3 (sem empresa: a coleção inteira daquele projeto)
+def pipeline_clientes_por_faixa(max_clientes: int = 10) -> List[Dict]:
+    """Clientes, total gasto e nomes de exemplo por faixa etária"""
+    return [
+        {
+            "$group": {
+                "_id": expr_faixa_idade(),
+                "total_clientes": {"$sum": 1},
+                "total_gasto": {"$sum": "$ultima_compra.valor"},
+                "clientes": _amostra("$nome", max_clientes)
+            }
+        },
+        {"$sort": {"_id": 1}}
+    ]
+
+def pipeline_produtos_clientes_distintos(limit: int = 5, max_clientes: int = 10) -> List[Dict]:
+    """Produtos com maior faturamento, com a contagem de nomes distintos de clientes"""
+    # Nomes distintos em dois $group (produto+nome, depois produto): a contagem
+    # não depende de um array $addToSet com todos os nomes do produto
+    return [
+        {
+            "$group": {
+                "_id": {"produto": "$ultima_compra.produto", "nome": "$nome"},
+                "total_vendas": {"$sum": 1},
+                "faturamento_total": {"$sum": "$ultima_compra.valor"}
+            }
+        },
+        {
+            "$group": {
+                "_id": "$_id.produto",
+                "total_vendas": {"$sum": "$total_vendas"},
+                "faturamento_total": {"$sum": "$faturamento_total"},
+                "clientes_distintos": {"$sum": 1},
+                "clientes": _amostra("$_id.nome", max_clientes)
+            }
+        },
+        {"$sort": {"faturamento_total": -1}},
+        {"$limit": limit}
+    ]
+
+# Dashboard: todos os relatórios em uma única passada pela coleção
+FACETAS_DASHBOARD = {
+    "faixa_etaria": lambda limit, derivados: pipeline_faixa_etaria(),
+    "rfm": lambda limit, derivados: pipeline_segmentacao_rfm(derivados),
+    "produtos_mais_vendidos": lambda limit, derivados: pipeline_produtos_mais_vendidos(limit),
+    "maior_valor_compra": lambda limit, derivados: pipeline_clientes_maior_valor_compra(limit),
+    "comportamento_idade": lambda limit, derivados: pipeline_comportamento_por_idade(derivados),
+}
+
+def pipeline_dashboard(facetas: List[str], limit: int = 10, campos_derivados: bool = False) -> List[Dict]:
+    """Executa os relatórios escolhidos como ramos de um $facet sobre o mesmo scan"""
+    projecao = {"_id": 0, "id": 1, "nome": 1, "idade": 1, "ultima_compra": 1}
+    if campos_derivados:
+        projecao.update({"faixa_etaria": 1, "ultima_compra_em": 1})
+    return [
+        {"$project": projecao},
+        {"$facet": {nome: FACETAS_DASHBOARD[nome](limit, campos_derivados) for nome in facetas}}
+    ]
+
+# Reconstrução dos rollups (services/rollups.py)
+def _expr_empresa(empresa_padrao: str) -> Dict:
+    return {"$ifNull": ["$empresa_id", empresa_padrao]}
+
+def _gravar_rollup(colecao: str) -> List[Dict]:
+    """Replica a empresa do _id no campo indexado e grava com $merge"""
+    return [
+        {"$set": {"empresa_id": "$_id.empresa_id"}},
+        {"$merge": {"into": colecao, "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ]
+
+def pipeline_rollup_idade(empresa_padrao: str, destino: str = "rollup_idade") -> List[Dict]:
+    """Totais e somas de valor por empresa e faixa de idade"""
+    return [
+        {
+            "$group": {
+                "_id": {"empresa_id": _expr_empresa(empresa_padrao), "faixa": expr_faixa_idade(rotulos=False)},
+                "total": {"$sum": 1},
+                "soma_valor": {"$sum": "$ultima_compra.valor"},
+                "qtd_valor": {"$sum": {"$cond": [{"$isNumber": "$ultima_compra.valor"}, 1, 0]}}
+            }
+        },
+        *_gravar_rollup(destino)
+    ]
+
+def pipeline_rollup_idade_produto(empresa_padrao: str, destino: str = "rollup_idade_produto") -> List[Dict]:
+    """Quantidade de clientes por empresa, faixa de idade e produto"""
+    return [
+        {"$match": {"ultima_compra.produto": {"$exists": True, "$ne": None}}},
+        {
+            "$group": {
+                "_id": {
+                    "empresa_id": _expr_empresa(empresa_padrao),
+                    "faixa": expr_faixa_idade(rotulos=False),
+                    "produto": "$ultima_compra.produto"
+                },
+                "total": {"$sum": 1}
+            }
+        },
+        *_gravar_rollup(destino)
+    ]
+
+def pipeline_rollup_produto(empresa_padrao: str, destino: str = "rollup_produto") -> List[Dict]:
+    """Vendas, valor total e amostra de clientes ({id, nome}) por empresa e produto"""
+    return [
+        {"$match": {"ultima_compra.produto": {"$exists": True, "$ne": None}}},
+        {
+            "$group": {
+                "_id": {"empresa_id": _expr_empresa(empresa_padrao), "produto": "$ultima_compra.produto"},
+                "total_vendas": {"$sum": 1},
+                "valor_total": {"$sum": "$ultima_compra.valor"},
+                "amostra_clientes": _amostra({"id": "$id", "nome": "$nome"}, MAX_EXEMPLOS)
+            }
+        },
+        # Só clientes com nome, como nas escritas incrementais (operacoes_rollup)
+        {"$set": {"amostra_clientes": {"$filter": {"input": "$amostra_clientes", "cond": "$$this.nome"}}}},
+        *_gravar_rollup(destino)
+    ]
+
+# Rollups diários de compras (services/compra_service.py)
+def pipeline_rfm_janela(inicio: datetime, fim: datetime) -> List[Dict]:
+    """RFM real por janela: recência, frequência e valor com notas de 1 a 5 por quintil
+
+    As posições vêm de $rank: clientes empatados ficam na mesma posição e
+    recebem a mesma nota, independentemente da ordem em que são lidos.
+    """
+    def nota(posicao: str) -> Dict:
+        return {"$ceil": {"$multiply": [5, {"$divide": [posicao, "$total"]}]}}
+
+    janela_total = {"$count": {}, "window": {"documents": ["unbounded", "unbounded"]}}
+    return [
+        {"$match": {"dia": {"$gte": inicio, "$lte": fim}}},
+        {"$project": {"_id": 0, "cliente_id": 1, "dia": 1, "compras": 1, "valor": 1}},
+        {
+            "$group": {
+                "_id": "$cliente_id",
+                "frequencia": {"$sum": "$compras"},
+                "monetario": {"$sum": "$valor"},
+                "ultima": {"$max": "$dia"}
+            }
+        },
+        {"$set": {"recencia": {"$dateDiff": {"startDate": "$ultima", "endDate": fim, "unit": "day"}}}},
+        {"$setWindowFields": {"sortBy": {"recencia": -1}, "output": {"pos_r": {"$rank": {}}, "total": janela_total}}},
+        {"$setWindowFields": {"sortBy": {"frequencia": 1}, "output": {"pos_f": {"$rank": {}}}}},
+        {"$setWindowFields": {"sortBy": {"monetario": 1}, "output": {"pos_m": {"$rank": {}}}}},
+        {"$set": {"r": nota("$pos_r"), "f": nota("$pos_f"), "m": nota("$pos_m")}},
+        {
+            "$set": {
+                "segmento": {
+                    "$switch": {
+                        "branches": [
+                            {"case": {"$and": [{"$gte": ["$r", 4]}, {"$gte": ["$f", 4]}]}, "then": "Campeões"},
+                            {"case": {"$and": [{"$gte": ["$r", 3]}, {"$gte": ["$f", 3]}]}, "then": "Leais"},
+                            {"case": {"$gte": ["$r", 4]}, "then": "Novos"},
+                            {"case": {"$gte": ["$f", 3]}, "then": "Em Risco"}
+                        ],
+                        "default": "Hibernando"
+                    }
+                }
+            }
+        },
+        {
+            "$group": {
+                "_id": "$segmento",
+                "total_clientes": {"$sum": 1},
+                "recencia_media": {"$avg": "$recencia"},
+                "frequencia_media": {"$avg": "$frequencia"},
+                "valor_medio": {"$avg": "$monetario"},
+                "nota_r": {"$avg": "$r"},
+                "nota_f": {"$avg": "$f"},
+                "nota_m": {"$avg": "$m"}
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "segmento": "$_id",
+                "total_clientes": 1,
+                "recencia_media": {"$round": ["$recencia_media", 1]},
+                "frequencia_media": {"$round": ["$frequencia_media", 2]},
+                "valor_medio": {"$round": ["$valor_medio", 2]},
+                "nota_r": {"$round": ["$nota_r", 2]},
+                "nota_f": {"$round": ["$nota_f", 2]},
+                "nota_m": {"$round": ["$nota_m", 2]}
+            }
+        },
+        {"$sort": {"recencia_media": 1}}
+    ]
+
+def pipeline_produtos_periodo(inicio: datetime, fim: datetime, limit: int = 10) -> List[Dict]:
+    """Produtos mais vendidos em uma janela de datas"""
+    return [
+        {"$match": {"dia": {"$gte": inicio, "$lte": fim}}},
+        {"$project": {"_id": 0, "produto": 1, "vendas": 1, "valor": 1}},
+        {"$group": {"_id": "$produto", "total_vendas": {"$sum": "$vendas"}, "valor_total": {"$sum": "$valor"}}},
+        {
+            "$project": {
+                "_id": 0,
+                "produto": "$_id",
+                "total_vendas": 1,
+                "valor_total": {"$round": ["$valor_total", 2]},
+                "valor_medio": {"$round": [{"$divide": ["$valor_total", "$total_vendas"]}, 2]}
+            }
+        },
+        {"$sort": {"total_vendas": -1, "produto": 1}},
+        {"$limit": limit}
+    ]
+
+def pipeline_historico_cliente_produto(destino: str = "compras_cliente_produto") -> List[Dict]:
+    """Compras e valor por cliente e produto a partir dos eventos (reconstrói compras_cliente_produto)"""
+    return [
+        {
+            "$group": {
+                "_id": {"empresa_id": "$empresa_id", "cliente_id": "$cliente_id", "produto": "$produto"},
+                "compras": {"$sum": 1},
+                "valor": {"$sum": "$valor"}
+            }
+        },
+        {
+            "$set": {
+                "empresa_id": "$_id.empresa_id",
+                "cliente_id": "$_id.cliente_id",
+                "produto": "$_id.produto",
+                "atualizado_em": "$$NOW"
+            }
+        },
+        {"$merge": {"into": destino, "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ]
@@ -0,0 +1,573 @@
+"""Recomendações de produtos por similaridade entre produtos (item-item)
+
+Cada empresa tem uma matriz esparsa cliente x produto (SciPy CSR) com as
+compras de cada cliente: o produto da última compra do documento do cliente e,
+quando houver, o histórico agregado em compras_cliente_produto. O peso de um
+par é log(1 + compras), e a última compra conta como pelo menos uma.
+
+A coocorrência C = XᵀX (produto x produto) é mantida incrementalmente: cada
+linha alterada soma a contribuição nova e subtrai a antiga. A similaridade de
+cosseno entre produtos sai de C a cada sincronização, e com ela:
+
+- produtos para um cliente: soma das similaridades com o que ele já comprou
+  (uma linha da matriz, sem consultar o banco);
+- clientes para um produto: X · S[:, produto]; os melhores clientes de cada
+  produto ficam em um índice montado na carga. Uma sincronização muda S e as
+  linhas alteradas, o que invalida o índice inteiro: só os produtos consultados
+  desde a anterior são refeitos na hora, os demais na primeira consulta;
+- campanhas: cada cliente recebe a oferta de maior pontuação entre os produtos
+  da campanha; os blocos de linhas são pontuados em um pool de processos.
+
+A sincronização segue a da analise_vetorizada (atualizado_em e
+clientes_removidos). C e S são densas: pensadas para catálogos de até alguns
+milhares de produtos. Requer os pacotes opcionais ``numpy`` e ``scipy``.
+"""
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # pragma: no cover - dependência opcional
+    np = sparse = None
+
+from pymongo.database import Database
+
+from services import registro_pipelines
+from services.analise_vetorizada import MARGEM_SINCRONIZACAO
+from database import substituir_colecao
+from services.compra_service import COLECAO_CLIENTE_PRODUTO, INDICES_CLIENTE_PRODUTO
+from services.empresas import colecao_clientes, empresa_padrao
+
+logger = logging.getLogger(__name__)
+
+PROJECAO_CLIENTE = {"id": 1, "ultima_compra.produto": 1}
+PROJECAO_HISTORICO = {"_id": 0, "cliente_id": 1, "produto": 1, "compras": 1}
+
+
+def _matriz_pesos(linhas: Sequence[int], colunas: Sequence[int], compras: Sequence[float], forma: Tuple[int, int]):
+    """CSR com peso log(1 + compras); pares repetidos (última compra e histórico) ficam com o maior valor"""
+    if not forma[1] or not len(linhas):
+        return sparse.csr_matrix(forma, dtype=np.float64)
+    chave = np.asarray(linhas, dtype=np.int64) * forma[1] + np.asarray(colunas, dtype=np.int64)
+    compras = np.asarray(compras, dtype=np.float64)
+    ordem = np.argsort(chave, kind="stable")
+    chave, compras = chave[ordem], compras[ordem]
+    inicios = np.flatnonzero(np.r_[True, chave[1:] != chave[:-1]])
+    pesos = np.log1p(np.maximum.reduceat(compras, inicios))
+    chave = chave[inicios]
+    validos = pesos > 0
+    chave, pesos = chave[validos], pesos[validos]
+    return sparse.csr_matrix((pesos, (chave // forma[1], chave % forma[1])), shape=forma)
+
+
+def _redimensionar(matriz, forma: Tuple[int, int]):
+    """Nova CSR com mais linhas/colunas vazias; os dados são compartilhados, não copiados"""
+    extras = forma[0] - matriz.shape[0]
+    indptr = np.r_[matriz.indptr, np.full(extras, matriz.indptr[-1], dtype=matriz.indptr.dtype)]
+    return sparse.csr_matrix((matriz.data, matriz.indices, indptr), shape=forma)
+
+
+def _substituir_linhas(matriz, linhas, novas):
+    """CSR com as linhas (ordenadas) trocadas pelas de ``novas``; os trechos intactos são copiados em bloco"""
+    indptr = matriz.indptr
+    contagem = np.diff(indptr)
+    contagem[linhas] = np.diff(novas.indptr)
+    dados, indices = [], []
+    anterior = 0
+    for posicao, linha in enumerate(linhas):
+        inicio, fim = novas.indptr[posicao], novas.indptr[posicao + 1]
+        dados += [matriz.data[indptr[anterior]:indptr[linha]], novas.data[inicio:fim]]
+        indices += [matriz.indices[indptr[anterior]:indptr[linha]], novas.indices[inicio:fim]]
+        anterior = linha + 1
+    dados.append(matriz.data[indptr[anterior]:])
+    indices.append(matriz.indices[indptr[anterior]:])
+    novo_indptr = np.zeros(len(indptr), dtype=indptr.dtype)
+    np.cumsum(contagem, out=novo_indptr[1:])
+    return sparse.csr_matrix(
+        (np.concatenate(dados), np.concatenate(indices).astype(indptr.dtype), novo_indptr), shape=matriz.shape
+    )
+
+
+def _melhores(pontuacao, limite: int):
+    """Posições com pontuação positiva, da maior para a menor (empate pela posição)"""
+    candidatos = np.flatnonzero(pontuacao > 0)
+    if len(candidatos) > limite:
+        # No corte, os empatados entram pela posição: o resultado não depende de como as linhas foram divididas
+        valores = pontuacao[candidatos]
+        corte = -np.partition(-valores, limite - 1)[limite - 1]
+        acima = candidatos[valores > corte]
+        candidatos = np.concatenate([acima, candidatos[valores == corte][:limite - len(acima)]])
+    return candidatos[np.lexsort((candidatos, -pontuacao[candidatos]))]
+
+
+class ModeloRecomendacao:
+    """Matriz cliente x produto e similaridade entre produtos de uma empresa, com sincronização incremental
+
+    As consultas (threads das requisições) e a sincronização (tarefa de fundo)
+    se alternam pela trava; a matriz e a similaridade nunca são alteradas no
+    lugar, então quem guardou uma referência continua com um retrato coerente.
+    """
+
+    def __init__(self, db: Database, empresa_id: Optional[str] = None, batch_size: int = 10000, indice_max: int = 1000):
+        if np is None:
+            raise ImportError("As recomendações requerem os pacotes numpy e scipy")
+        self.db = db
+        self.empresa_id = empresa_id or empresa_padrao()
+        self.clientes = db[colecao_clientes(self.empresa_id)]
+        self.historico = db[COLECAO_CLIENTE_PRODUTO]
+        self.batch_size = batch_size
+        self.indice_max = indice_max
+        self.ultima_sincronizacao: Optional[datetime] = None
+        self._trava = threading.Lock()
+        self._limpar()
+
+    # Atributos refeitos por carregar e trocados de uma vez no modelo em uso
+    ESTADO = (
+        "ids", "_linhas", "_documentos", "_ultimo", "produtos", "_codigos_produto",
+        "matriz", "coocorrencia", "similaridade", "compradores", "_indice",
+    )
+
+    def _limpar(self) -> None:
+        self.ids: List[str] = []
+        self._linhas: Dict[str, int] = {}
+        # _id do documento -> linha, para aplicar clientes_removidos
+        self._documentos: Dict[Any, int] = {}
+        # Código do produto da última compra de cada linha (-1 sem compra)
+        self._ultimo: List[int] = []
+        self.produtos: List[str] = []
+        self._codigos_produto: Dict[str, int] = {}
+        self.matriz = sparse.csr_matrix((0, 0), dtype=np.float64)
+        self.coocorrencia = np.zeros((0, 0))
+        self.similaridade = np.zeros((0, 0))
+        self.compradores = np.zeros(0, dtype=np.int64)
+        # Produto -> (linhas, pontuações) dos melhores clientes; esvaziado a cada sincronização
+        self._indice: Dict[int, Tuple[Any, Any]] = {}
+        # Produtos consultados pelo índice desde a última reindexação
+        self._consultados: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._linhas)
+
+    def _codigo_produto(self, produto: Optional[str]) -> int:
+        if produto is None:
+            return -1
+        codigo = self._codigos_produto.get(produto)
+        if codigo is None:
+            codigo = self._codigos_produto[produto] = len(self.produtos)
+            self.produtos.append(produto)
+        return codigo
+
+    def _linha_cliente(self, doc: Dict) -> int:
+        """Linha do cliente (nova se ainda não existe), com a última compra do documento"""
+        linha = self._linhas.get(doc["id"])
+        if linha is None:
+            linha = self._linhas[doc["id"]] = len(self.ids)
+            self.ids.append(doc["id"])
+            self._ultimo.append(-1)
+        self._documentos[doc["_id"]] = linha
+        self._ultimo[linha] = self._codigo_produto((doc.get("ultima_compra") or {}).get("produto"))
+        return linha
+
+    # Sincronização
+    def carregar(self) -> None:
+        """Monta a matriz completa a partir dos clientes e do histórico de compras
+
+        A leitura do banco e o cálculo de XᵀX são feitos em um modelo novo, fora
+        da trava: as consultas seguem no modelo anterior e só esperam a troca
+        das referências.
+        """
+        inicio = datetime.now(timezone.utc)
+        filtro = {"empresa_id": self.empresa_id}
+        novo = ModeloRecomendacao(self.db, self.empresa_id, self.batch_size, self.indice_max)
+        novo._montar(
+            self.clientes.find(filtro, PROJECAO_CLIENTE).batch_size(self.batch_size),
+            self.historico.find(filtro, PROJECAO_HISTORICO).batch_size(self.batch_size),
+        )
+        with self._trava:
+            # Os códigos dos produtos mudam na carga: os consultados são levados pelo nome
+            consultados = {self.produtos[codigo] for codigo in self._consultados}
+            for atributo in self.ESTADO:
+                setattr(self, atributo, getattr(novo, atributo))
+            self._consultados = {self._codigos_produto[p] for p in consultados if p in self._codigos_produto}
+            self.ultima_sincronizacao = inicio
+
+    def _montar(self, clientes: Iterable[Dict], historico: Iterable[Dict]) -> None:
+        self._limpar()
+        for doc in clientes:
+            self._linha_cliente(doc)
+        linhas = [linha for linha, codigo in enumerate(self._ultimo) if codigo >= 0]
+        colunas = [self._ultimo[linha] for linha in linhas]
+        compras = [1] * len(linhas)
+        for doc in historico:
+            linha = self._linhas.get(doc["cliente_id"])
+            # Compras de clientes que não estão na coleção não entram na matriz
+            if linha is not None:
+                linhas.append(linha)
+                colunas.append(self._codigo_produto(doc["produto"]))
+                compras.append(doc.get("compras") or 0)
+        self.matriz = _matriz_pesos(linhas, colunas, compras, (len(self.ids), len(self.produtos)))
+        self.coocorrencia = (self.matriz.T @ self.matriz).toarray()
+        self.compradores = self.matriz.getnnz(axis=0).astype(np.int64)
+        self._recalcular_similaridade()
+
+    def atualizar(self) -> Dict[str, int]:
+        """Refaz apenas as linhas dos clientes alterados, removidos ou com compras novas"""
+        if self.ultima_sincronizacao is None:
+            self.carregar()
+            return {"alterados": len(self), "removidos": 0}
+        desde = self.ultima_sincronizacao - MARGEM_SINCRONIZACAO
+        agora = datetime.now(timezone.utc)
+        filtro = {"empresa_id": self.empresa_id, "atualizado_em": {"$gt": desde}}
+        alterados = list(self.clientes.find(filtro, PROJECAO_CLIENTE))
+        removidos = [
+            doc["_id"] for doc in self.db.clientes_removidos.find(
+                {"empresa_id": self.empresa_id, "removido_em": {"$gt": desde}}, {"_id": 1}
+            )
+        ]
+        com_compras = {doc["cliente_id"] for doc in self.historico.find(filtro, {"_id": 0, "cliente_id": 1})}
+        # A linha é refeita com todo o histórico do cliente, e não só com os pares alterados
+        ids = list({doc["id"] for doc in alterados} | com_compras)
+        historico = list(self.historico.find(
+            {"empresa_id": self.empresa_id, "cliente_id": {"$in": ids}}, PROJECAO_HISTORICO
+        )) if ids else []
+        with self._trava:
+            self.ultima_sincronizacao = agora
+            self._aplicar(alterados, historico, removidos)
+            inativas = len(self.ids) - len(self._linhas)
+        if inativas > len(self.ids) // 2:
+            # Muitas linhas de clientes removidos: recarrega para compactar a matriz
+            self.carregar()
+        return {"alterados": len(ids), "removidos": len(removidos)}
+
+    def _aplicar(self, alterados: List[Dict], historico: List[Dict], removidos: List[Any]) -> None:
+        afetadas = set()
+        for _id in removidos:
+            linha = self._documentos.pop(_id, None)
+            if linha is not None and self._linhas.get(self.ids[linha]) == linha:
+                del self._linhas[self.ids[linha]]
+                afetadas.add(linha)
+        for doc in alterados:
+            afetadas.add(self._linha_cliente(doc))
+        compras_por_linha: Dict[int, List[Tuple[int, float]]] = {}
+        for doc in historico:
+            linha = self._linhas.get(doc["cliente_id"])
+            if linha is not None:
+                compras_por_linha.setdefault(linha, []).append((self._codigo_produto(doc["produto"]), doc.get("compras") or 0))
+                afetadas.add(linha)
+        if not afetadas:
+            return
+
+        # Linhas novas (k x produtos): removidas ficam vazias
+        afetadas = np.array(sorted(afetadas), dtype=np.int64)
+        linhas, colunas, compras = [], [], []
+        for posicao, linha in enumerate(afetadas):
+            if self._linhas.get(self.ids[linha]) != linha:
+                continue
+            if self._ultimo[linha] >= 0:
+                linhas.append(posicao)
+                colunas.append(self._ultimo[linha])
+                compras.append(1)
+            for codigo, quantidade in compras_por_linha.get(linha, ()):
+                linhas.append(posicao)
+                colunas.append(codigo)
+                compras.append(quantidade)
+        forma = (len(self.ids), len(self.produtos))
+        novas = _matriz_pesos(linhas, colunas, compras, (len(afetadas), forma[1]))
+
+        matriz = _redimensionar(self.matriz, forma)
+        antigas = matriz[afetadas]
+        extras = forma[1] - self.coocorrencia.shape[0]
+        coocorrencia = np.pad(self.coocorrencia, ((0, extras), (0, extras)))
+        coocorrencia += (novas.T @ novas - antigas.T @ antigas).toarray()
+        self.coocorrencia = coocorrencia
+        self.compradores = np.pad(self.compradores, (0, extras)) + (
+            np.bincount(novas.indices, minlength=forma[1]) - np.bincount(antigas.indices, minlength=forma[1])
+        )
+
+        self.matriz = _substituir_linhas(matriz, afetadas, novas)
+        self._recalcular_similaridade()
+
+    def _recalcular_similaridade(self) -> None:
+        normas = np.sqrt(np.clip(np.diag(self.coocorrencia), 0, None))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            similaridade = self.coocorrencia / np.outer(normas, normas)
+        similaridade[~np.isfinite(similaridade)] = 0
+        np.fill_diagonal(similaridade, 0)
+        self.similaridade = similaridade
+        self._indice = {}
+
+    # Consultas
+    def _codigo_existente(self, produto: str) -> int:
+        codigo = self._codigos_produto.get(produto)
+        if codigo is None or not self.compradores[codigo]:
+            raise ValueError(f"Produto não encontrado: {produto}")
+        return codigo
+
+    def _pontuar_clientes(self, codigo: int, limite: int):
+        # Uma passada pela matriz: pontuação e se o cliente já comprou o produto (não é candidato)
+        alvo = np.zeros((len(self.produtos), 2))
+        alvo[:, 0] = self.similaridade[:, codigo]
+        alvo[codigo, 1] = 1
+        pontuacao, comprou = (self.matriz @ alvo).T
+        pontuacao[comprou > 0] = 0
+        linhas = _melhores(pontuacao, limite)
+        return linhas, pontuacao[linhas]
+
+    def indexar(self, codigos: Optional[Iterable[int]] = None) -> None:
+        """Calcula os melhores clientes dos produtos, todos por padrão (uma trava por produto, intercalando consultas)"""
+        for codigo in range(len(self.produtos)) if codigos is None else codigos:
+            with self._trava:
+                if codigo < len(self.compradores) and codigo not in self._indice and self.compradores[codigo]:
+                    self._indice[codigo] = self._pontuar_clientes(codigo, self.indice_max)
+
+    def reindexar(self) -> None:
+        """Depois de uma sincronização, refaz só o índice dos produtos consultados desde a anterior"""
+        with self._trava:
+            codigos, self._consultados = sorted(self._consultados), set()
+        self.indexar(codigos)
+
+    def clientes_para_produto(self, produto: str, limite: int = 100) -> List[Dict[str, Any]]:
+        """Clientes que ainda não compraram o produto, pela afinidade com o que já compraram"""
+        with self._trava:
+            codigo = self._codigo_existente(produto)
+            if limite > self.indice_max:
+                linhas, pontuacao = self._pontuar_clientes(codigo, limite)
+            else:
+                if codigo not in self._indice:
+                    self._indice[codigo] = self._pontuar_clientes(codigo, self.indice_max)
+                self._consultados.add(codigo)
+                linhas, pontuacao = self._indice[codigo]
+            return [
+                {"id": self.ids[linha], "pontuacao": round(float(valor), 4)}
+                for linha, valor in zip(linhas[:limite], pontuacao[:limite])
+            ]
+
+    def produtos_para_cliente(self, cliente_id: str, limite: int = 10) -> List[Dict[str, Any]]:
+        """Produtos que o cliente ainda não comprou; sem afinidade suficiente, completa com os mais comprados"""
+        with self._trava:
+            linha = self._linhas.get(cliente_id)
+            if linha is None:
+                raise ValueError("Cliente não encontrado")
+            inicio, fim = self.matriz.indptr[linha], self.matriz.indptr[linha + 1]
+            comprados, pesos = self.matriz.indices[inicio:fim], self.matriz.data[inicio:fim]
+            contribuicoes = pesos[:, None] * self.similaridade[comprados]
+            pontuacao = contribuicoes.sum(axis=0)
+            pontuacao[comprados] = 0
+            escolhidos = list(_melhores(pontuacao, limite))
+            resultado = [
+                {
+                    "produto": self.produtos[codigo],
+                    "pontuacao": round(float(pontuacao[codigo]), 4),
+                    # Produto já comprado que mais contribuiu para a recomendação
+                    "semelhante_a": self.produtos[comprados[np.argmax(contribuicoes[:, codigo])]],
+                }
+                for codigo in escolhidos
+            ]
+            excluidos = set(comprados) | set(escolhidos)
+            for codigo in np.lexsort((np.arange(len(self.compradores)), -self.compradores)):
+                if len(resultado) >= limite or not self.compradores[codigo]:
+                    break
+                if codigo not in excluidos:
+                    resultado.append({"produto": self.produtos[codigo], "pontuacao": 0.0, "semelhante_a": None})
+            return resultado
+
+    def produtos_similares(self, produto: str, limite: int = 10) -> List[Dict[str, Any]]:
+        with self._trava:
+            codigo = self._codigo_existente(produto)
+            similaridade = self.similaridade[codigo]
+            return [
+                {"produto": self.produtos[c], "similaridade": round(float(similaridade[c]), 4)}
+                for c in _melhores(similaridade, limite)
+            ]
+
+    def blocos_campanha(self, produtos: Sequence[str], blocos: int) -> Tuple[List[str], List[Tuple]]:
+        """Retrato da matriz dividido em blocos de linhas para pontuar_bloco; devolve (ids, blocos)"""
+        with self._trava:
+            codigos = np.array([self._codigo_existente(produto) for produto in produtos], dtype=np.int64)
+            matriz, similaridade, ids = self.matriz, self.similaridade[:, codigos], self.ids
+        limites = np.linspace(0, matriz.shape[0], blocos + 1).astype(np.int64)
+        return ids, [
+            (matriz[inicio:fim], similaridade, codigos, int(inicio))
+            for inicio, fim in zip(limites[:-1], limites[1:]) if fim > inicio
+        ]
+
+
+# Pontuação de campanhas (executada no pool de processos)
+def pontuar_bloco(matriz, similaridade, codigos, inicio: int, limite: int):
+    """Oferta de cada cliente do bloco: o produto da campanha de maior pontuação que ele ainda não comprou
+
+    Devolve, por produto, (linhas, pontuações) dos ``limite`` melhores clientes
+    atribuídos a ele e o total de clientes atribuídos.
+    """
+    # Colunas da campanha seguidas das indicadoras dos mesmos produtos (quem já comprou)
+    alvo = np.zeros((similaridade.shape[0], 2 * len(codigos)))
+    alvo[:, :len(codigos)] = similaridade
+    alvo[codigos, len(codigos) + np.arange(len(codigos))] = 1
+    resultado = np.asarray(matriz @ alvo)
+    pontuacao = resultado[:, :len(codigos)]
+    pontuacao[resultado[:, len(codigos):] > 0] = 0
+    oferta = pontuacao.argmax(axis=1)
+    melhor = pontuacao[np.arange(len(oferta)), oferta]
+    resultado = []
+    for posicao in range(len(codigos)):
+        atribuida = np.where(oferta == posicao, melhor, 0)
+        linhas = _melhores(atribuida, limite)
+        resultado.append((linhas + inicio, atribuida[linhas], int((atribuida > 0).sum())))
+    return resultado
+
+
+def combinar_campanha(produtos: Sequence[str], ids: List[str], resultados: List, limite: int) -> Dict[str, Any]:
+    alvos = []
+    for posicao, produto in enumerate(produtos):
+        partes = [resultado[posicao] for resultado in resultados]
+        linhas = np.concatenate([parte[0] for parte in partes])
+        pontuacao = np.concatenate([parte[1] for parte in partes])
+        ordem = np.lexsort((linhas, -pontuacao))[:limite]
+        alvos.append({
+            "produto": produto,
+            "clientes_atribuidos": sum(parte[2] for parte in partes),
+            "clientes": [
+                {"id": ids[linhas[i]], "pontuacao": round(float(pontuacao[i]), 4)} for i in ordem
+            ],
+        })
+    return {"clientes_atribuidos": sum(alvo["clientes_atribuidos"] for alvo in alvos), "produtos": alvos}
+
+
+class GerenciadorRecomendacoes:
+    """Modelos por empresa, carregados no primeiro uso e sincronizados em segundo plano
+
+    Usa o cliente síncrono (as cargas rodam em threads) e lê sempre do
+    primário: um secundário atrasado faria a janela de atualizado_em perder
+    escritas. As recomendações ficam até ``intervalo_s`` atrás das escritas.
+
+    A empresa vem do cabeçalho da requisição: só empresas com clientes ganham
+    um modelo, no máximo ``max_empresas`` ficam em memória (sai o usado há
+    mais tempo) e um modelo sem consultas por ``ociosa_s`` é descartado.
+    """
+
+    def __init__(
+        self, db: Database, intervalo_s: float = 10, processos: int = 2, indice_max: int = 1000,
+        max_empresas: int = 32, ociosa_s: float = 900,
+    ):
+        self.db = db
+        self.intervalo_s = intervalo_s
+        self.processos = processos
+        self.indice_max = indice_max
+        self.max_empresas = max_empresas
+        self.ociosa_s = ociosa_s
+        # Em ordem de uso (LRU), com o instante da última consulta de cada empresa
+        self._modelos: "OrderedDict[str, ModeloRecomendacao]" = OrderedDict()
+        self._usado_em: Dict[str, float] = {}
+        # Só as empresas com carga em andamento
+        self._carregando: Dict[str, asyncio.Lock] = {}
+        self._tarefa: Optional[asyncio.Task] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    async def iniciar(self) -> None:
+        if self.processos > 0:
+            # spawn, como na fila de relatórios: o filho não herda os clientes do MongoDB
+            self._pool = ProcessPoolExecutor(self.processos, mp_context=multiprocessing.get_context("spawn"))
+        if self.intervalo_s > 0:
+            self._tarefa = asyncio.create_task(self._sincronizar())
+
+    async def encerrar(self) -> None:
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            await asyncio.gather(self._tarefa, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    async def modelo(self, empresa_id: str) -> ModeloRecomendacao:
+        modelo = self._modelos.get(empresa_id)
+        if modelo is None:
+            trava = self._carregando.setdefault(empresa_id, asyncio.Lock())
+            try:
+                async with trava:
+                    modelo = self._modelos.get(empresa_id) or await self._carregar(empresa_id)
+            finally:
+                # Quem ainda espera pela trava encontra o modelo (ou tenta de novo) ao entrar
+                if self._carregando.get(empresa_id) is trava:
+                    del self._carregando[empresa_id]
+        self._modelos.move_to_end(empresa_id)
+        self._usado_em[empresa_id] = time.monotonic()
+        return modelo
+
+    async def _carregar(self, empresa_id: str) -> ModeloRecomendacao:
+        modelo = ModeloRecomendacao(self.db, empresa_id, indice_max=self.indice_max)
+        existe = await asyncio.to_thread(modelo.clientes.find_one, {"empresa_id": empresa_id}, {"_id": 1})
+        if existe is None:
+            raise ValueError(f"Empresa sem clientes: {empresa_id}")
+        await asyncio.to_thread(modelo.carregar)
+        await asyncio.to_thread(modelo.indexar)
+        self._modelos[empresa_id] = modelo
+        while len(self._modelos) > self.max_empresas:
+            self._descartar(next(iter(self._modelos)))
+        return modelo
+
+    def _descartar(self, empresa_id: str) -> None:
+        self._modelos.pop(empresa_id, None)
+        self._usado_em.pop(empresa_id, None)
+
+    def _descartar_ociosos(self) -> None:
+        if self.ociosa_s <= 0:
+            return
+        limite = time.monotonic() - self.ociosa_s
+        for empresa_id in [e for e, usado in self._usado_em.items() if usado < limite]:
+            logger.info("Modelo de recomendação da empresa %s descartado por inatividade", empresa_id)
+            self._descartar(empresa_id)
+
+    async def _sincronizar(self) -> None:
+        while True:
+            await asyncio.sleep(self.intervalo_s)
+            self._descartar_ociosos()
+            for empresa_id, modelo in list(self._modelos.items()):
+                try:
+                    alteracoes = await asyncio.to_thread(modelo.atualizar)
+                    if any(alteracoes.values()):
+                        await asyncio.to_thread(modelo.reindexar)
+                except Exception:
+                    logger.exception("Falha ao sincronizar as recomendações da empresa %s", empresa_id)
+
+    async def pontuar_campanha(self, empresa_id: str, produtos: List[str], limite: int) -> Dict[str, Any]:
+        """Uma oferta por cliente entre os produtos da campanha, pontuada em blocos no pool"""
+        modelo = await self.modelo(empresa_id)
+        # Espera a trava do modelo (pode estar em uma sincronização) fora do event loop
+        ids, blocos = await asyncio.to_thread(modelo.blocos_campanha, produtos, max(self.processos, 1) * 4)
+        loop = asyncio.get_running_loop()
+        # Sem pool (processos=0), os blocos rodam nas threads padrão do event loop
+        resultados = await asyncio.gather(*(
+            loop.run_in_executor(self._pool, pontuar_bloco, *bloco, limite) for bloco in blocos
+        ))
+        return combinar_campanha(produtos, ids, resultados, limite)
+
+
+def reconstruir_historico(db: Database, empresa_id: Optional[str] = None) -> None:
+    """Recalcula compras_cliente_produto a partir dos eventos de compras (de uma empresa ou de todas)
+
+    Como em reconstruir_rollups: o histórico é montado em uma coleção
+    temporária, já com os índices, e trocado pelo atual de uma vez; os modelos
+    nunca leem um histórico apagado ou pela metade. Com --empresa, os documentos
+    das demais empresas são copiados como estão. Compras registradas durante a
+    reconstrução se perdem na troca: pare as escritas enquanto o comando roda.
+    """
+    temporaria = f"{COLECAO_CLIENTE_PRODUTO}_reconstrucao"
+    db[temporaria].drop()
+    for chaves in INDICES_CLIENTE_PRODUTO:
+        db[temporaria].create_index(chaves)
+    if empresa_id:
+        db[COLECAO_CLIENTE_PRODUTO].aggregate(
+            [{"$match": {"empresa_id": {"$ne": empresa_id}}}, {"$merge": {"into": temporaria}}]
+        )
+    definicao = registro_pipelines.obter("historico_cliente_produto")
+    definicao.colecao_alvo(db, empresa_id).aggregate(
+        definicao.montar(empresa_id, destino=temporaria), **definicao.opcoes()
+    )
+    substituir_colecao(db, temporaria, COLECAO_CLIENTE_PRODUTO)
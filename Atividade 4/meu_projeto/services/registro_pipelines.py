@@ -0,0 +1,389 @@
+"""Registro dos pipelines de agregação: nome, versão e opções de execução
+
+Cada pipeline usado pela API, pelo cli.py e pelos benchmarks é registrado aqui
+com um nome estável e uma versão (incrementada quando o resultado ou o plano
+esperado muda). O nome@versão segue como 'comment' do comando, de modo que as
+métricas e o log de consultas lentas mostram qual versão estava em execução.
+
+As opções de execução (allowDiskUse, hint, batchSize, maxTimeMS e preferência
+de leitura) ficam junto da definição, e ``explicar``/``analisar_explain``
+verificam o plano com explain("executionStats") para detectar COLLSCAN e
+ordenações em memória antes que cheguem à produção.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from bson import SON
+from pymongo import ReadPreference
+
+from config import get_settings
+from database import preferencia_leitura_analises
+from services import busca, pipelines
+from services.empresas import colecao_clientes, com_empresa, empresa_padrao
+
+# "analises" segue LEITURAS_ANALISES (secundários com atraso máximo, primário como reserva)
+LEITURA_ANALISES = "analises"
+PREFERENCIAS_LEITURA = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+# Alertas do explain; um pipeline pode aceitar os que são inerentes a ele
+COLLSCAN = "COLLSCAN"
+ORDENACAO_EM_MEMORIA = "ORDENACAO_EM_MEMORIA"
+DISCO = "DISCO"
+
+# Estágios que gravam o resultado; o explain com executionStats não os aceita
+ESTAGIOS_GRAVACAO = ("$merge", "$out")
+
+
+@dataclass(frozen=True)
+class PipelineRegistrado:
+    nome: str
+    versao: int
+    construir: Callable[..., List[Dict]]
+    descricao: str = ""
+    # "clientes" é a coleção de clientes da empresa (compartilhada ou dedicada)
+    colecao: str = "clientes"
+    allow_disk_use: bool = False
+    # Nome do índice ou lista de chaves, como em create_index
+    hint: Optional[Union[str, List[Tuple[str, Any]]]] = None
+    batch_size: Optional[int] = None
+    # None usa o limite do serviço (ANALISES_MAX_TIME_MS); 0 não limita
+    max_time_ms: Optional[int] = None
+    # Relatórios seguem LEITURAS_ANALISES; leituras que fazem parte do CRUD usam "primary"
+    preferencia_leitura: str = LEITURA_ANALISES
+    # Argumentos de construir() usados pelo explain do endpoint e do cli.py
+    exemplo: Dict[str, Any] = field(default_factory=dict)
+    alertas_aceitos: Tuple[str, ...] = ()
+
+    @property
+    def identificador(self) -> str:
+        return f"{self.nome}@v{self.versao}"
+
+    def montar(self, empresa_id: Optional[str], **argumentos) -> List[Dict]:
+        """Pipeline com o $match da empresa à frente (sem empresa, cobre todas)"""
+        pipeline = self.construir(**argumentos)
+        return com_empresa(pipeline, empresa_id) if empresa_id else pipeline
+
+    def opcoes(self, max_time_ms_padrao: int = 0) -> Dict[str, Any]:
+        """Argumentos de aggregate(); valem para o motor e para o pymongo"""
+        opcoes: Dict[str, Any] = {"comment": self.identificador}
+        if self.allow_disk_use:
+            opcoes["allowDiskUse"] = True
+        if self.hint is not None:
+            opcoes["hint"] = self.hint
+        if self.batch_size:
+            opcoes["batchSize"] = self.batch_size
+        limite = max_time_ms_padrao if self.max_time_ms is None else self.max_time_ms
+        if limite:
+            opcoes["maxTimeMS"] = limite
+        return opcoes
+
+    def nome_colecao(self, empresa_id: Optional[str]) -> str:
+        if self.colecao == "clientes":
+            return colecao_clientes(empresa_id or empresa_padrao())
+        return self.colecao
+
+    def colecao_alvo(self, db, empresa_id: Optional[str], nome_colecao: Optional[str] = None):
+        """Coleção (motor ou pymongo) já com a preferência de leitura do pipeline"""
+        colecao = db[nome_colecao or self.nome_colecao(empresa_id)]
+        preferencia = resolver_preferencia(self.preferencia_leitura)
+        if preferencia == ReadPreference.PRIMARY:
+            return colecao
+        return colecao.with_options(read_preference=preferencia)
+
+
+def resolver_preferencia(nome: str):
+    if nome == LEITURA_ANALISES:
+        return preferencia_leitura_analises(get_settings())
+    return PREFERENCIAS_LEITURA[nome]
+
+
+REGISTRO: Dict[str, PipelineRegistrado] = {}
+
+
+def registrar(definicao: PipelineRegistrado) -> PipelineRegistrado:
+    if definicao.nome in REGISTRO:
+        raise ValueError(f"Pipeline já registrado: {definicao.nome}")
+    if definicao.preferencia_leitura not in (LEITURA_ANALISES, *PREFERENCIAS_LEITURA):
+        raise ValueError(f"Preferência de leitura inválida: {definicao.preferencia_leitura}")
+    REGISTRO[definicao.nome] = definicao
+    return definicao
+
+
+def obter(nome: str) -> PipelineRegistrado:
+    try:
+        return REGISTRO[nome]
+    except KeyError:
+        raise ValueError(f"Pipeline desconhecido: {nome}")
+
+
+def listar() -> List[Dict[str, Any]]:
+    return [
+        {
+            "nome": d.nome,
+            "versao": d.versao,
+            "descricao": d.descricao,
+            "colecao": d.colecao,
+            "opcoes": d.opcoes(),
+            "preferencia_leitura": d.preferencia_leitura,
+            "alertas_aceitos": list(d.alertas_aceitos),
+        }
+        for d in REGISTRO.values()
+    ]
+
+
+def sem_gravacao(pipeline: List[Dict]) -> List[Dict]:
+    """Remove $merge/$out (e o $set que os prepara não atrapalha o explain)"""
+    return [estagio for estagio in pipeline if not any(op in estagio for op in ESTAGIOS_GRAVACAO)]
+
+
+def comando_explain(
+    definicao: PipelineRegistrado, empresa_id: Optional[str], argumentos: Optional[Dict[str, Any]] = None
+) -> SON:
+    """Comando explain("executionStats") do aggregate, com as opções registradas"""
+    argumentos = definicao.exemplo if argumentos is None else argumentos
+    opcoes = definicao.opcoes()
+    aggregate = {
+        "aggregate": definicao.nome_colecao(empresa_id),
+        "pipeline": sem_gravacao(definicao.montar(empresa_id, **argumentos)),
+        "cursor": {},
+        "comment": opcoes["comment"],
+    }
+    if "allowDiskUse" in opcoes:
+        aggregate["allowDiskUse"] = True
+    if "hint" in opcoes:
+        hint = opcoes["hint"]
+        aggregate["hint"] = hint if isinstance(hint, str) else SON(hint)
+    return SON([("explain", aggregate), ("verbosity", "executionStats")])
+
+
+def _nos_plano(no: Any):
+    """Percorre os nós (estágio, estágios abaixo dele) dos planos vencedores"""
+    if isinstance(no, list):
+        for item in no:
+            yield from _nos_plano(item)
+        return
+    if not isinstance(no, dict):
+        return
+    estagio = no.get("stage")
+    if isinstance(estagio, str):
+        yield estagio, no
+    for chave, valor in no.items():
+        # Planos rejeitados não executam: um COLLSCAN descartado não é problema
+        if chave in ("rejectedPlans", "allPlansExecution"):
+            continue
+        yield from _nos_plano(valor)
+
+
+def _estagios_abaixo(no: Dict) -> List[str]:
+    return [estagio for estagio, _ in _nos_plano({k: v for k, v in no.items() if k != "stage"})]
+
+
+def analisar_explain(explain: Dict[str, Any], alertas_aceitos: Sequence[str] = ()) -> Dict[str, Any]:
+    """Resume o explain("executionStats") de um aggregate e aponta regressões
+
+    - COLLSCAN: algum plano vencedor percorre a coleção inteira;
+    - ORDENACAO_EM_MEMORIA: um SORT do plano (ou um $sort logo depois do
+      cursor) ordena documentos lidos da coleção, em vez de vir na ordem de um
+      índice; ordenar a saída de um $group é esperado e não conta;
+    - DISCO: algum estágio precisou gravar em disco (usedDisk).
+    """
+    estagios_plano = []
+    alertas = set()
+    for estagio, no in _nos_plano(explain):
+        estagios_plano.append(estagio)
+        if estagio == "COLLSCAN":
+            alertas.add(COLLSCAN)
+        elif estagio == "SORT" and "GROUP" not in _estagios_abaixo(no):
+            alertas.add(ORDENACAO_EM_MEMORIA)
+        if no.get("usedDisk"):
+            alertas.add(DISCO)
+
+    estagios_pipeline = []
+    for estagio in explain.get("stages", []):
+        nome = next(iter(estagio), "")
+        estagios_pipeline.append(nome)
+        if estagio.get("usedDisk"):
+            alertas.add(DISCO)
+    if estagios_pipeline[:2] == ["$cursor", "$sort"] and "GROUP" not in estagios_plano:
+        alertas.add(ORDENACAO_EM_MEMORIA)
+
+    estatisticas = _estatisticas_execucao(explain)
+    return {
+        "estagios_plano": list(dict.fromkeys(estagios_plano)),
+        "estagios_pipeline": estagios_pipeline,
+        "docs_examinados": estatisticas.get("totalDocsExamined"),
+        "chaves_examinadas": estatisticas.get("totalKeysExamined"),
+        "documentos_retornados": estatisticas.get("nReturned"),
+        "tempo_ms": estatisticas.get("executionTimeMillis"),
+        "alertas": sorted(alertas - set(alertas_aceitos)),
+        "alertas_aceitos": sorted(alertas & set(alertas_aceitos)),
+    }
+
+
+def _estatisticas_execucao(explain: Dict[str, Any]) -> Dict[str, Any]:
+    if "executionStats" in explain:
+        return explain["executionStats"]
+    for estagio in explain.get("stages", []):
+        cursor = estagio.get("$cursor")
+        if cursor and "executionStats" in cursor:
+            return cursor["executionStats"]
+    for shard in (explain.get("shards") or {}).values():
+        return _estatisticas_execucao(shard)
+    return {}
+
+
+def _resultado_explain(definicao: PipelineRegistrado, empresa_id: Optional[str], explain: Dict) -> Dict[str, Any]:
+    return {
+        "pipeline": definicao.identificador,
+        "colecao": definicao.nome_colecao(empresa_id),
+        "opcoes": definicao.opcoes(),
+        **analisar_explain(explain, definicao.alertas_aceitos),
+    }
+
+
+def explicar(db, nome: str, empresa_id: Optional[str], argumentos: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Explain de um pipeline registrado com o cliente síncrono (cli.py)"""
+    definicao = obter(nome)
+    explain = db.command(
+        comando_explain(definicao, empresa_id, argumentos),
+        read_preference=resolver_preferencia(definicao.preferencia_leitura),
+    )
+    return _resultado_explain(definicao, empresa_id, explain)
+
+
+async def explicar_async(
+    db, nome: str, empresa_id: Optional[str], argumentos: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Mesmo explain, pelo cliente assíncrono da API"""
+    definicao = obter(nome)
+    explain = await db.command(
+        comando_explain(definicao, empresa_id, argumentos),
+        read_preference=resolver_preferencia(definicao.preferencia_leitura),
+    )
+    return _resultado_explain(definicao, empresa_id, explain)
+
+
+# Relatórios sobre os clientes da empresa (v2: amostras com $firstN e contagens em dois $group)
+registrar(PipelineRegistrado(
+    "faixa_etaria", 2, lambda: pipelines.pipeline_faixa_etaria(),
+    descricao="Clientes, valor médio e produtos de exemplo por faixa etária",
+    allow_disk_use=True,
+))
+registrar(PipelineRegistrado(
+    "segmentacao_rfm", 1,
+    lambda campos_derivados=False: pipelines.pipeline_segmentacao_rfm(campos_derivados),
+    descricao="Segmentos de recência da última compra",
+    allow_disk_use=True,
+    exemplo={"campos_derivados": True},
+))
+registrar(PipelineRegistrado(
+    "produtos_mais_vendidos", 2,
+    lambda limit=10: pipelines.pipeline_produtos_mais_vendidos(limit),
+    descricao="Produtos da última compra com mais vendas",
+    allow_disk_use=True,
+))
+registrar(PipelineRegistrado(
+    "maior_valor_compra", 1,
+    lambda limit=10: pipelines.pipeline_clientes_maior_valor_compra(limit),
+    descricao="Clientes com as últimas compras de maior valor",
+    # Ordem e limite saem direto do índice, sem SORT em memória
+    hint=[("empresa_id", 1), ("ultima_compra.valor", -1)],
+    batch_size=100,
+))
+registrar(PipelineRegistrado(
+    # v3: mesmas faixas e rótulos de faixa_etaria ("0-19" ... "60+" e "Outros")
+    "comportamento_idade", 3,
+    lambda campos_derivados=False: pipelines.pipeline_comportamento_por_idade(campos_derivados),
+    descricao="Valor médio e variedade de produtos por faixa etária",
+    allow_disk_use=True,
+    exemplo={"campos_derivados": True},
+))
+registrar(PipelineRegistrado(
+    # v2: faceta comportamento_idade na v3
+    "dashboard", 2,
+    lambda facetas=tuple(pipelines.FACETAS_DASHBOARD), limit=10, campos_derivados=False:
+        pipelines.pipeline_dashboard(list(facetas), limit, campos_derivados),
+    descricao="Relatórios escolhidos como ramos de um único $facet",
+    allow_disk_use=True,
+))
+# Relatórios da Atividade 3 ("Atividade 3 fastapi/pipelines.py" monta os mesmos)
+registrar(PipelineRegistrado(
+    "clientes_por_faixa", 1,
+    lambda max_clientes=pipelines.MAX_AMOSTRA: pipelines.pipeline_clientes_por_faixa(max_clientes),
+    descricao="Clientes, total gasto e nomes de exemplo por faixa etária",
+    allow_disk_use=True,
+))
+registrar(PipelineRegistrado(
+    "produtos_clientes_distintos", 1,
+    lambda limit=5, max_clientes=pipelines.MAX_AMOSTRA:
+        pipelines.pipeline_produtos_clientes_distintos(limit, max_clientes),
+    descricao="Produtos com maior faturamento e quantos clientes distintos os compraram",
+    allow_disk_use=True,
+))
+registrar(PipelineRegistrado(
+    "busca_fuzzy", 1,
+    lambda termo, limite=20, similaridade_min=0.3: busca.pipeline_fuzzy(termo, limite, similaridade_min),
+    descricao="Candidatos da busca aproximada por trigramas em comum",
+    colecao=busca.COLECAO_TRIGRAMAS,
+    # Faz parte da busca por nome (CRUD): lê do primário
+    preferencia_leitura="primary",
+    exemplo={"termo": "maria"},
+    # A ordenação é pela similaridade calculada, que nenhum índice cobre
+    alertas_aceitos=(ORDENACAO_EM_MEMORIA,),
+))
+
+# Rollups diários de compras
+registrar(PipelineRegistrado(
+    # v2: posições com $rank (empates recebem a mesma nota)
+    "rfm_janela", 2, pipelines.pipeline_rfm_janela,
+    descricao="RFM com notas por quintil a partir do rollup diário por cliente",
+    colecao="compras_cliente_diario",
+    allow_disk_use=True,
+    hint=[("empresa_id", 1), ("dia", 1), ("cliente_id", 1), ("compras", 1), ("valor", 1)],
+    exemplo={"inicio": datetime(2024, 1, 1), "fim": datetime(2024, 12, 31)},
+))
+registrar(PipelineRegistrado(
+    "produtos_periodo", 1, pipelines.pipeline_produtos_periodo,
+    descricao="Produtos mais vendidos em uma janela de datas",
+    colecao="compras_produto_diario",
+    hint=[("empresa_id", 1), ("dia", 1), ("produto", 1), ("vendas", 1), ("valor", 1)],
+    exemplo={"inicio": datetime(2024, 1, 1), "fim": datetime(2024, 12, 31)},
+))
+
+# Reconstrução dos rollups (cli.py); sem empresa, percorrem a coleção inteira
+def _rollup(construir: Callable[[str], List[Dict]]) -> Callable[..., List[Dict]]:
+    # Documentos sem empresa_id (anteriores à separação) contam para a EMPRESA_PADRAO
+    # destino: coleção que recebe o $merge (a temporária da reconstrução)
+    return lambda padrao=None, **argumentos: construir(padrao or empresa_padrao(), **argumentos)
+
+# v2 de rollup_produto: amostra de clientes em pares {id, nome} (amostra_clientes)
+for _nome, _versao, _construir, _descricao in (
+    ("rollup_idade", 1, pipelines.pipeline_rollup_idade, "Totais por empresa e faixa de idade"),
+    ("rollup_idade_produto", 1, pipelines.pipeline_rollup_idade_produto, "Clientes por empresa, faixa e produto"),
+    ("rollup_produto", 2, pipelines.pipeline_rollup_produto, "Vendas e exemplos por empresa e produto"),
+):
+    registrar(PipelineRegistrado(
+        _nome, _versao, _rollup(_construir),
+        descricao=_descricao,
+        allow_disk_use=True,
+        max_time_ms=0,
+        preferencia_leitura="primary",
+        alertas_aceitos=(COLLSCAN,),
+    ))
+
+registrar(PipelineRegistrado(
+    "historico_cliente_produto", 1, pipelines.pipeline_historico_cliente_produto,
+    descricao="Compras por cliente e produto a partir dos eventos (matriz das recomendações)",
+    colecao="compras",
+    allow_disk_use=True,
+    max_time_ms=0,
+    preferencia_leitura="primary",
+    alertas_aceitos=(COLLSCAN,),
+))
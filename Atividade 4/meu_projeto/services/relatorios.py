@@ -0,0 +1,440 @@
+"""Geração de relatórios em segundo plano (CSV, XLSX e PDF)
+
+Os pedidos ficam na coleção ``relatorios`` e são executados por uma fila
+assíncrona que despacha cada um para um pool de processos. O processo
+trabalhador abre a sua própria conexão síncrona, executa as análises do
+ClienteService e escreve o arquivo em disco linha a linha; a exportação de
+clientes percorre o cursor do MongoDB sem carregar a coleção em memória.
+
+Pedidos iguais sobre os mesmos dados (mesma impressão digital) reaproveitam o
+mesmo job. XLSX requer ``openpyxl`` e PDF requer ``reportlab`` (opcionais).
+
+Só jobs "pendente" são assumidos. Quem executa um job grava um prazo
+(``lease_ate``) e o renova a cada terço dele (``heartbeat_em``); um job
+"executando" com o prazo vencido é de um processo da API que parou e volta a
+ser assumido, por este ou por outro processo que compartilhe a coleção.
+"""
+import asyncio
+import csv
+import hashlib
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+
+from database import para_analises
+from services.empresas import colecao_clientes, empresa_padrao
+
+logger = logging.getLogger(__name__)
+
+COLECAO_RELATORIOS = "relatorios"
+
+TITULOS = {
+    "faixa_etaria": "Clientes por faixa etária",
+    "rfm": "Segmentação RFM",
+    "produtos_mais_vendidos": "Produtos mais vendidos",
+    "maior_valor_compra": "Clientes com maior valor de compra",
+    "comportamento_idade": "Comportamento de compra por idade",
+    "clientes": "Clientes",
+}
+COLUNAS_CLIENTES = ["id", "nome", "idade", "ultima_compra.produto", "ultima_compra.valor", "ultima_compra.data"]
+EXTENSOES = {"csv": "csv", "xlsx": "xlsx", "pdf": "pdf"}
+# Frequência de atualização do progresso ao exportar clientes
+PROGRESSO_A_CADA = 5000
+
+def achatar(doc: Dict[str, Any], prefixo: str = "") -> Dict[str, Any]:
+    """Transforma subdocumentos em colunas com nomes pontuados (ultima_compra.valor)"""
+    linha = {}
+    for chave, valor in doc.items():
+        nome = f"{prefixo}{chave}"
+        if isinstance(valor, dict):
+            linha.update(achatar(valor, f"{nome}."))
+        elif isinstance(valor, list):
+            linha[nome] = "; ".join(
+                json.dumps(v, ensure_ascii=False, default=str) if isinstance(v, dict) else str(v) for v in valor
+            )
+        else:
+            linha[nome] = valor
+    return linha
+
+async def impressao_digital_dados(db: AsyncIOMotorDatabase, empresa_id: str) -> str:
+    """Identifica o estado atual dos clientes da empresa sem percorrer a coleção
+
+    Usa a última alteração (índice empresa_id + atualizado_em), a última remoção
+    e, nas coleções dedicadas, a contagem estimada; qualquer escrita pela API
+    muda pelo menos um deles. Escritas de outras empresas não mudam a impressão.
+    """
+    nome = colecao_clientes(empresa_id)
+    filtro = {"empresa_id": empresa_id}
+    ultimo = await db[nome].find_one(filtro, {"_id": 0, "atualizado_em": 1}, sort=[("atualizado_em", -1)])
+    removido = await db.clientes_removidos.find_one(filtro, {"removido_em": 1}, sort=[("removido_em", -1)])
+    # Na coleção compartilhada a contagem estimada mistura as empresas
+    total = await db[nome].estimated_document_count() if nome != "clientes" else None
+    return json.dumps([
+        str((ultimo or {}).get("atualizado_em")), str((removido or {}).get("removido_em")), total
+    ])
+
+def chave_relatorio(empresa_id: str, analises: List[str], formato: str, limit: int, impressao: str) -> str:
+    bruto = json.dumps([empresa_id, sorted(set(analises)), formato, limit, impressao]).encode()
+    return hashlib.sha256(bruto).hexdigest()[:32]
+
+# --- Execução no processo trabalhador ---------------------------------------
+
+_db_trabalhador = None
+
+def _db_do_processo():
+    """Conexão síncrona criada uma vez por processo do pool"""
+    global _db_trabalhador
+    if _db_trabalhador is None:
+        from config import get_settings
+        from database import criar_cliente_mongo
+        settings = get_settings()
+        _db_trabalhador = criar_cliente_mongo(settings)[settings.mongo_db]
+    return _db_trabalhador
+
+def _secoes(
+    db, empresa_id: str, analises: List[str], limit: int, progresso
+) -> Iterator[Tuple[str, List[str], Iterable[Dict]]]:
+    """Gera (título, colunas, linhas) de cada análise da empresa, na ordem pedida"""
+    from services.cliente_service import ClienteService
+    service = ClienteService(db, empresa_id)
+    calculos = {
+        "faixa_etaria": service.analisar_faixa_etaria,
+        "rfm": service.segmentacao_rfm,
+        "produtos_mais_vendidos": lambda: service.produtos_mais_vendidos(limit),
+        "maior_valor_compra": lambda: service.clientes_maior_valor_compra(limit),
+        "comportamento_idade": service.comportamento_por_idade,
+    }
+    for indice, nome in enumerate(analises):
+        if nome == "clientes":
+            total = max(service.clientes.count_documents({"empresa_id": empresa_id}), 1)
+            def linhas(indice=indice, total=total):
+                cursor = para_analises(service.clientes).find(
+                    {"empresa_id": empresa_id}, {"_id": 0, "id": 1, "nome": 1, "idade": 1, "ultima_compra": 1}
+                )
+                for numero, doc in enumerate(cursor.sort("id", 1).batch_size(1000), 1):
+                    if numero % PROGRESSO_A_CADA == 0:
+                        progresso((indice + min(numero / total, 1)) / len(analises))
+                    yield achatar(doc)
+            yield TITULOS[nome], COLUNAS_CLIENTES, linhas()
+        else:
+            resultado = [achatar(doc) for doc in calculos[nome]()]
+            colunas = list(dict.fromkeys(coluna for linha in resultado for coluna in linha))
+            yield TITULOS[nome], colunas, resultado
+        progresso((indice + 1) / len(analises))
+
+def _escrever_csv(caminho: str, secoes) -> None:
+    with open(caminho, "w", newline="", encoding="utf-8-sig") as arquivo:
+        escritor = csv.writer(arquivo, delimiter=";")
+        for numero, (titulo, colunas, linhas) in enumerate(secoes):
+            if numero:
+                escritor.writerow([])
+            escritor.writerow([f"# {titulo}"])
+            escritor.writerow(colunas)
+            for linha in linhas:
+                escritor.writerow([linha.get(coluna) for coluna in colunas])
+
+def _escrever_xlsx(caminho: str, secoes) -> None:
+    from openpyxl import Workbook
+    # write_only grava as linhas em disco conforme chegam
+    planilha = Workbook(write_only=True)
+    for titulo, colunas, linhas in secoes:
+        aba = planilha.create_sheet(title=titulo[:31])
+        aba.append(colunas)
+        for linha in linhas:
+            aba.append([linha.get(coluna) for coluna in colunas])
+    planilha.save(caminho)
+
+def _escrever_pdf(caminho: str, secoes) -> None:
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.pdfgen import canvas
+
+    largura, altura = landscape(A4)
+    margem, entrelinha = 30, 12
+    pdf = canvas.Canvas(caminho, pagesize=(largura, altura))
+    y = altura - margem
+
+    def nova_linha():
+        nonlocal y
+        y -= entrelinha
+        if y < margem:
+            pdf.showPage()
+            y = altura - margem
+
+    def desenhar(valores: List[Any], largura_coluna: float, fonte: str) -> None:
+        pdf.setFont(fonte, 7)
+        limite = int(largura_coluna / 4.5)
+        for i, valor in enumerate(valores):
+            pdf.drawString(margem + i * largura_coluna, y, ("" if valor is None else str(valor))[:limite])
+        nova_linha()
+
+    # Desenha linha a linha, uma página por vez (memória constante)
+    for titulo, colunas, linhas in secoes:
+        pdf.setFont("Helvetica-Bold", 11)
+        pdf.drawString(margem, y, titulo)
+        nova_linha()
+        largura_coluna = (largura - 2 * margem) / max(len(colunas), 1)
+        desenhar(colunas, largura_coluna, "Helvetica-Bold")
+        for linha in linhas:
+            desenhar([linha.get(coluna) for coluna in colunas], largura_coluna, "Helvetica")
+        nova_linha()
+    pdf.save()
+
+ESCRITORES = {"csv": _escrever_csv, "xlsx": _escrever_xlsx, "pdf": _escrever_pdf}
+DEPENDENCIAS = {"xlsx": "openpyxl", "pdf": "reportlab"}
+
+def dependencia_ausente(formato: str) -> Optional[str]:
+    """Pacote opcional necessário para o formato e que não está instalado"""
+    pacote = DEPENDENCIAS.get(formato)
+    if pacote and importlib.util.find_spec(pacote) is None:
+        return pacote
+    return None
+
+def gerar_relatorio(
+    job_id: str, executor: str, empresa_id: str, analises: List[str], formato: str, limit: int, caminho: str
+) -> int:
+    """Executado no pool de processos: gera o arquivo e retorna o tamanho em bytes"""
+    db = _db_do_processo()
+    def progresso(fracao: float) -> None:
+        # Uma execução substituída (prazo vencido e job assumido por outro) não grava mais
+        db[COLECAO_RELATORIOS].update_one(
+            {"_id": job_id, "executor": executor}, {"$set": {"progresso": round(fracao, 4)}}
+        )
+
+    # Escreve em um arquivo temporário para nunca servir um relatório pela metade;
+    # o nome é único por execução, para que duas execuções do mesmo job não se misturem
+    temporario = f"{caminho}.{uuid.uuid4().hex}.parcial"
+    try:
+        ESCRITORES[formato](temporario, _secoes(db, empresa_id, analises, limit, progresso))
+        os.replace(temporario, caminho)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+    return os.path.getsize(caminho)
+
+# --- Fila no processo da API ------------------------------------------------
+
+# Execuções interrompidas pela queda de um processo do pool antes de o job virar "erro"
+MAX_TENTATIVAS_POOL = 3
+
+async def exportar_clientes_csv(db: AsyncIOMotorDatabase, empresa_id: str, batch_size: int = 1000):
+    """Exportação direta em CSV dos clientes da empresa, uma linha por documento conforme o cursor avança"""
+    class _Linha:
+        def write(self, texto):
+            return texto
+    escritor = csv.writer(_Linha(), delimiter=";")
+    yield "\ufeff" + escritor.writerow(COLUNAS_CLIENTES)
+    # Varredura completa: segue a preferência de leitura das análises
+    cursor = para_analises(db[colecao_clientes(empresa_id)]).find(
+        {"empresa_id": empresa_id}, {"_id": 0, "id": 1, "nome": 1, "idade": 1, "ultima_compra": 1}
+    )
+    async for doc in cursor.sort("id", 1).batch_size(batch_size):
+        linha = achatar(doc)
+        yield escritor.writerow([linha.get(coluna) for coluna in COLUNAS_CLIENTES])
+
+class FilaRelatorios:
+    """Fila de relatórios presa ao event loop da API, com execução em processos"""
+
+    def __init__(self, db: AsyncIOMotorDatabase, pasta: str, processos: int = 2, lease_s: float = 60):
+        self.db = db
+        self.colecao = db[COLECAO_RELATORIOS]
+        self.pasta = pasta
+        self.processos = processos
+        self.lease_s = lease_s
+        # Identifica esta fila nos jobs que ela executa (heartbeat e conclusão)
+        self.executor = uuid.uuid4().hex
+        self._fila: "asyncio.Queue[str]" = asyncio.Queue()
+        self._trabalhadores: List[asyncio.Task] = []
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _criar_pool(self) -> ProcessPoolExecutor:
+        # spawn: o processo filho não herda o cliente do MongoDB do processo da API
+        return ProcessPoolExecutor(self.processos, mp_context=multiprocessing.get_context("spawn"))
+
+    def _substituir_pool(self, quebrado: Optional[ProcessPoolExecutor]) -> None:
+        """Troca o pool depois que um processo morreu (BrokenProcessPool); só o primeiro a notar troca"""
+        if quebrado is not None and self._pool is quebrado:
+            quebrado.shutdown(wait=False, cancel_futures=True)
+            self._pool = self._criar_pool()
+
+    async def iniciar(self) -> None:
+        os.makedirs(self.pasta, exist_ok=True)
+        self._pool = self._criar_pool()
+        # Retoma os jobs pendentes e os interrompidos por uma reinicialização
+        await self._enfileirar_disponiveis()
+        self._trabalhadores = [asyncio.create_task(self._trabalhar()) for _ in range(self.processos)]
+        self._trabalhadores.append(asyncio.create_task(self._recuperar_vencidos()))
+
+    async def encerrar(self) -> None:
+        for tarefa in self._trabalhadores:
+            tarefa.cancel()
+        await asyncio.gather(*self._trabalhadores, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _disponivel(agora: datetime) -> Dict[str, Any]:
+        """Filtro dos jobs que podem ser assumidos: pendentes ou com o prazo vencido"""
+        return {"$or": [
+            {"status": "pendente"},
+            # Sem lease_ate: job assumido antes de existir o prazo
+            {"status": "executando", "lease_ate": {"$not": {"$gt": agora}}},
+        ]}
+
+    def _prazo(self, agora: datetime) -> Dict[str, Any]:
+        return {"heartbeat_em": agora, "lease_ate": agora + timedelta(seconds=self.lease_s)}
+
+    async def _enfileirar_disponiveis(self) -> None:
+        async for job in self.colecao.find(self._disponivel(datetime.now(timezone.utc)), {"_id": 1}):
+            self._fila.put_nowait(job["_id"])
+
+    async def _recuperar_vencidos(self) -> None:
+        """Devolve à fila os jobs cujo executor parou de renovar o prazo"""
+        while True:
+            await asyncio.sleep(self.lease_s)
+            try:
+                agora = datetime.now(timezone.utc)
+                filtro = {"status": "executando", "lease_ate": {"$not": {"$gt": agora}}}
+                async for job in self.colecao.find(filtro, {"_id": 1}):
+                    self._fila.put_nowait(job["_id"])
+            except Exception:
+                logger.exception("Falha ao procurar relatórios com o prazo vencido")
+
+    async def _renovar(self, job_id: str) -> None:
+        """Heartbeat: estende o prazo enquanto o relatório é gerado"""
+        while True:
+            await asyncio.sleep(self.lease_s / 3)
+            try:
+                await self.colecao.update_one(
+                    {"_id": job_id, "status": "executando", "executor": self.executor},
+                    {"$set": self._prazo(datetime.now(timezone.utc))},
+                )
+            except Exception:
+                logger.warning("Falha ao renovar o prazo do relatório %s", job_id, exc_info=True)
+
+    def caminho(self, job: Dict[str, Any]) -> str:
+        return os.path.join(self.pasta, f"{job['_id']}.{EXTENSOES[job['formato']]}")
+
+    async def enfileirar(
+        self, empresa_id: str, analises: List[str], formato: str, limit: int
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Cria o job ou devolve o existente para as mesmas entradas; retorna (job, novo)"""
+        impressao = await impressao_digital_dados(self.db, empresa_id)
+        chave = chave_relatorio(empresa_id, analises, formato, limit, impressao)
+        agora = datetime.now(timezone.utc)
+        novo = {
+            "status": "pendente", "progresso": 0.0, "empresa_id": empresa_id, "analises": analises, "formato": formato,
+            "limit": limit, "criado_em": agora, "concluido_em": None, "tamanho_bytes": None, "erro": None,
+            "executor": None, "lease_ate": None, "heartbeat_em": None, "tentativas": 0,
+        }
+        # O upsert pelo _id (a própria chave) torna a deduplicação atômica
+        job = await self.colecao.find_one_and_update(
+            {"_id": chave}, {"$setOnInsert": novo}, upsert=True, return_document=ReturnDocument.BEFORE
+        )
+        if job is not None and not self._precisa_refazer(job):
+            return job, False
+        if job is not None:
+            # Só refaz se o job ainda está como foi lido: com dois pedidos simultâneos, ou
+            # com o job já assumido por um trabalhador, o outro pedido recebe o job atual
+            refeito = await self.colecao.update_one({"_id": chave, "status": job["status"]}, {"$set": novo})
+            if not refeito.matched_count:
+                return await self.colecao.find_one({"_id": chave}), False
+        self._fila.put_nowait(chave)
+        return {"_id": chave, **novo}, True
+
+    def _precisa_refazer(self, job: Dict[str, Any]) -> bool:
+        if job["status"] == "erro":
+            return True
+        return job["status"] == "concluido" and not os.path.exists(self.caminho(job))
+
+    async def obter(self, job_id: str, empresa_id: str) -> Optional[Dict[str, Any]]:
+        """Job da empresa; jobs de outra empresa não são visíveis"""
+        job = await self.colecao.find_one({"_id": job_id})
+        if job is None or (job.get("empresa_id") or empresa_padrao()) != empresa_id:
+            return None
+        return job
+
+    async def _atualizar(self, filtro: Dict[str, Any], campos: Dict[str, Any], descricao: str) -> bool:
+        """Grava o status do job; uma falha do MongoDB é registrada e não derruba o trabalhador"""
+        try:
+            await self.colecao.update_one(filtro, {"$set": campos})
+            return True
+        except Exception:
+            logger.exception("Falha ao gravar %s do relatório %s", descricao, filtro["_id"])
+            return False
+
+    def _reenfileirar_depois(self, job_id: str) -> None:
+        asyncio.get_running_loop().call_later(self.lease_s / 3, self._fila.put_nowait, job_id)
+
+    async def _trabalhar(self) -> None:
+        """Cada falha (do MongoDB, da geração ou do pool) fica no job; o laço nunca termina por ela
+
+        Se a gravação do resultado falhar, o job segue "executando" até o prazo
+        vencer e ser retomado por _recuperar_vencidos.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            job_id = await self._fila.get()
+            # A conclusão só vale enquanto o job é desta fila (o prazo pode ter vencido e outro assumido)
+            deste_executor = {"_id": job_id, "executor": self.executor}
+            heartbeat = None
+            try:
+                agora = datetime.now(timezone.utc)
+                try:
+                    job = await self.colecao.find_one_and_update(
+                        {"_id": job_id, **self._disponivel(agora)},
+                        {"$set": {"status": "executando", "progresso": 0.0, "executor": self.executor, **self._prazo(agora)}},
+                        return_document=ReturnDocument.AFTER,
+                    )
+                except Exception:
+                    logger.exception("Falha ao assumir o relatório %s; nova tentativa em seguida", job_id)
+                    self._reenfileirar_depois(job_id)
+                    continue
+                if job is None:
+                    continue
+                heartbeat = asyncio.create_task(self._renovar(job_id))
+                empresa_id = job.get("empresa_id") or empresa_padrao()
+                pool = self._pool
+                try:
+                    tamanho = await loop.run_in_executor(
+                        pool, gerar_relatorio, job_id, self.executor, empresa_id,
+                        job["analises"], job["formato"], job["limit"], self.caminho(job),
+                    )
+                except BrokenProcessPool as e:
+                    # Um processo do pool morreu (por exemplo, sem memória): o pool inteiro
+                    # fica inutilizável; troca o pool e devolve o job à fila
+                    self._substituir_pool(pool)
+                    tentativas = job.get("tentativas", 0) + 1
+                    if tentativas >= MAX_TENTATIVAS_POOL:
+                        raise RuntimeError(f"O processo do relatório caiu {tentativas} vezes") from e
+                    logger.warning("Pool de relatórios quebrado no job %s; job devolvido à fila", job_id)
+                    if await self._atualizar(deste_executor, {
+                        "status": "pendente", "executor": None, "lease_ate": None, "tentativas": tentativas,
+                    }, "a devolução"):
+                        self._fila.put_nowait(job_id)
+                    continue
+                await self._atualizar(deste_executor, {
+                    "status": "concluido", "progresso": 1.0, "tamanho_bytes": tamanho,
+                    "concluido_em": datetime.now(timezone.utc), "lease_ate": None,
+                }, "a conclusão")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Falha ao gerar o relatório %s", job_id)
+                await self._atualizar(deste_executor, {
+                    "status": "erro", "erro": f"{type(e).__name__}: {e}", "concluido_em": datetime.now(timezone.utc),
+                    "lease_ate": None,
+                }, "o erro")
+            finally:
+                if heartbeat is not None:
+                    heartbeat.cancel()
+                self._fila.task_done()
@@ -0,0 +1,254 @@
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.database import Database
+
+from database import substituir_colecao
+from services import registro_pipelines
+from services.comparacao import comparar_relatorios
+from services.empresas import colecao_clientes, colecoes_clientes, empresa_padrao
+from services.pipelines import FAIXA_OUTROS, LIMITES_IDADE, MAX_EXEMPLOS, ROTULOS_IDADE
+
+COLECAO_IDADE = "rollup_idade"
+COLECAO_IDADE_PRODUTO = "rollup_idade_produto"
+COLECAO_PRODUTO = "rollup_produto"
+
+def bucket_idade(idade: Any):
+    """Reproduz o $bucket de idade: limite inferior da faixa ou "Outros" """
+    if isinstance(idade, bool) or not isinstance(idade, (int, float)):
+        return FAIXA_OUTROS
+    if not LIMITES_IDADE[0] <= idade < LIMITES_IDADE[-1]:
+        return FAIXA_OUTROS
+    return max(limite for limite in LIMITES_IDADE[:-1] if limite <= idade)
+
+def _valor_numerico(valor: Any) -> bool:
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool)
+
+def operacoes_rollup(
+    removidos: Iterable[Dict] = (), adicionados: Iterable[Dict] = ()
+) -> Dict[str, List[UpdateOne]]:
+    """Converte clientes removidos/adicionados em operações $inc nos rollups
+
+    Os documentos de rollup são separados por empresa: o _id inclui a empresa
+    do cliente e o campo empresa_id replica-a para o índice de leitura.
+
+    Os exemplos de clientes de cada produto ficam em amostra_clientes, pares
+    {id, nome}: a saída de um cliente o retira pelo id e as entradas mantêm os
+    MAX_EXEMPLOS mais recentes. A amostra é aproximada: depois de remoções ela
+    pode ficar menor que MAX_EXEMPLOS até novas entradas ou até a reconstrução
+    (reconstruir_rollups), que a preenche de novo; verificar_rollups aponta
+    as amostras desatualizadas ou incompletas.
+    """
+    incrementos: Dict[tuple, Counter] = defaultdict(Counter)
+    exemplos_novos: Dict[Any, List[Tuple[str, str]]] = defaultdict(list)
+    exemplos_removidos: Dict[Any, List[Tuple[str, str]]] = defaultdict(list)
+    padrao = empresa_padrao()
+
+    def acumular(cliente: Dict, sinal: int):
+        compra = cliente.get("ultima_compra") or {}
+        produto = compra.get("produto")
+        valor = compra.get("valor")
+        faixa = bucket_idade(cliente.get("idade"))
+        empresa = cliente.get("empresa_id") or padrao
+
+        idade = incrementos[(COLECAO_IDADE, (empresa, faixa))]
+        idade["total"] += sinal
+        if _valor_numerico(valor):
+            idade["soma_valor"] += sinal * valor
+            idade["qtd_valor"] += sinal
+        if produto is None:
+            return
+        incrementos[(COLECAO_IDADE_PRODUTO, (empresa, faixa, produto))]["total"] += sinal
+        por_produto = incrementos[(COLECAO_PRODUTO, (empresa, produto))]
+        por_produto["total_vendas"] += sinal
+        if _valor_numerico(valor):
+            por_produto["valor_total"] += sinal * valor
+        if cliente.get("nome"):
+            exemplo = (cliente["id"], cliente["nome"])
+            (exemplos_novos if sinal > 0 else exemplos_removidos)[(empresa, produto)].append(exemplo)
+
+    for cliente in removidos:
+        acumular(cliente, -1)
+    for cliente in adicionados:
+        acumular(cliente, 1)
+
+    operacoes: Dict[str, List[UpdateOne]] = defaultdict(list)
+    for (colecao, chave), campos in incrementos.items():
+        inc = {campo: delta for campo, delta in campos.items() if delta}
+        update: Dict[str, Any] = {"$inc": inc, "$setOnInsert": {"empresa_id": chave[0]}} if inc else {}
+        if colecao == COLECAO_IDADE_PRODUTO:
+            filtro = {"_id": {"empresa_id": chave[0], "faixa": chave[1], "produto": chave[2]}}
+        elif colecao == COLECAO_IDADE:
+            filtro = {"_id": {"empresa_id": chave[0], "faixa": chave[1]}}
+        else:
+            filtro = {"_id": {"empresa_id": chave[0], "produto": chave[1]}}
+        if colecao == COLECAO_PRODUTO:
+            # Um cliente que mudou de nome sai pelo id e volta com o nome novo
+            novos = [e for e in exemplos_novos.get(chave, []) if e not in exemplos_removidos.get(chave, [])]
+            antigos = [e for e in exemplos_removidos.get(chave, []) if e not in exemplos_novos.get(chave, [])]
+            if antigos:
+                # $pull e $push no mesmo campo não podem estar no mesmo update (bulk ordenado: o $pull vem antes)
+                operacoes[colecao].append(UpdateOne(
+                    filtro, {"$pull": {"amostra_clientes": {"id": {"$in": [id_ for id_, _ in antigos]}}}}
+                ))
+            if novos:
+                update["$push"] = {"amostra_clientes": {
+                    "$each": [{"id": id_, "nome": nome} for id_, nome in novos[-MAX_EXEMPLOS:]],
+                    "$slice": -MAX_EXEMPLOS,
+                }}
+                update.setdefault("$setOnInsert", {"empresa_id": chave[0]})
+        if update:
+            operacoes[colecao].append(UpdateOne(filtro, update, upsert=True))
+    return operacoes
+
+# Montagem dos relatórios a partir dos documentos de rollup
+def relatorio_faixa_etaria(docs_idade: List[Dict], docs_idade_produto: List[Dict]) -> List[Dict[str, Any]]:
+    produtos_por_faixa: Dict[Any, List[Dict]] = defaultdict(list)
+    for doc in docs_idade_produto:
+        if doc.get("total", 0) > 0:
+            produtos_por_faixa[doc["_id"]["faixa"]].append(doc)
+    resultado = []
+    for doc in docs_idade:
+        if doc.get("total", 0) <= 0:
+            continue
+        faixa = doc["_id"]["faixa"]
+        populares = sorted(produtos_por_faixa[faixa], key=lambda d: (-d["total"], d["_id"]["produto"]))
+        qtd_valor = doc.get("qtd_valor", 0)
+        resultado.append({
+            "faixa": ROTULOS_IDADE.get(faixa, "Desconhecido"),
+            "total_clientes": doc["total"],
+            "valor_medio": round(doc.get("soma_valor", 0) / qtd_valor, 2) if qtd_valor > 0 else None,
+            "produtos_populares": [d["_id"]["produto"] for d in populares[:5]],
+        })
+    return sorted(resultado, key=lambda r: r["faixa"])
+
+def relatorio_comportamento_por_idade(docs_idade: List[Dict], docs_idade_produto: List[Dict]) -> List[Dict[str, Any]]:
+    grupos: Dict[str, Counter] = defaultdict(Counter)
+    produtos: Dict[str, set] = defaultdict(set)
+    for doc in docs_idade:
+        if doc.get("total", 0) <= 0:
+            continue
+        grupo = grupos[ROTULOS_IDADE[doc["_id"]["faixa"]]]
+        grupo["total"] += doc["total"]
+        grupo["soma_valor"] += doc.get("soma_valor", 0)
+        grupo["qtd_valor"] += doc.get("qtd_valor", 0)
+    for doc in docs_idade_produto:
+        if doc.get("total", 0) > 0:
+            produtos[ROTULOS_IDADE[doc["_id"]["faixa"]]].add(doc["_id"]["produto"])
+    resultado = [
+        {
+            "faixa_etaria": faixa,
+            "total_clientes": grupo["total"],
+            "valor_medio_compra": round(grupo["soma_valor"] / grupo["qtd_valor"], 2) if grupo["qtd_valor"] > 0 else None,
+            "variedade_produtos": len(produtos[faixa]),
+        }
+        for faixa, grupo in grupos.items()
+    ]
+    return sorted(resultado, key=lambda r: r["faixa_etaria"])
+
+def _nomes_amostra(doc: Dict) -> List[str]:
+    if "amostra_clientes" in doc:
+        return [exemplo["nome"] for exemplo in doc["amostra_clientes"]]
+    # Documento anterior aos pares {id, nome}: só nomes, até a próxima reconstrução
+    return doc.get("exemplo_clientes", [])
+
+def relatorio_produto(doc: Dict) -> Dict[str, Any]:
+    return {
+        "produto": doc["_id"]["produto"],
+        "total_vendas": doc["total_vendas"],
+        "valor_total": round(doc.get("valor_total", 0), 2),
+        "valor_medio": round(doc.get("valor_total", 0) / doc["total_vendas"], 2),
+        "exemplo_clientes": _nomes_amostra(doc)[-MAX_EXEMPLOS:],
+    }
+
+FILTRO_PRODUTOS = {"total_vendas": {"$gt": 0}}
+ORDEM_PRODUTOS = [("total_vendas", -1), ("_id", 1)]
+
+# Reconstrução e verificação (usadas pelo cli.py com o cliente síncrono)
+def reconstruir_rollups(db: Database, empresa_id: Optional[str] = None) -> None:
+    """Recalcula os rollups a partir dos clientes (de uma empresa ou de todas)
+
+    Cada rollup é montado com $merge em uma coleção temporária, alimentada pelas
+    coleções dedicadas e pela compartilhada, e trocado pelo atual de uma vez
+    (substituir_colecao); as leituras nunca veem um rollup vazio ou parcial.
+    Com --empresa, os documentos das demais empresas são copiados como estão.
+
+    Os $inc das escritas de clientes feitas durante a reconstrução caem na
+    coleção antiga e se perdem na troca: pare as escritas da API enquanto o
+    comando roda (ou rode ``rollups verificar`` em seguida).
+    """
+    colecoes = [colecao_clientes(empresa_id)] if empresa_id else colecoes_clientes()
+    for nome in (COLECAO_IDADE, COLECAO_IDADE_PRODUTO, COLECAO_PRODUTO):
+        temporaria = f"{nome}_reconstrucao"
+        db[temporaria].drop()
+        if empresa_id:
+            db[nome].aggregate([{"$match": {"empresa_id": {"$ne": empresa_id}}}, {"$merge": {"into": temporaria}}])
+        definicao = registro_pipelines.obter(nome)
+        for colecao in colecoes:
+            definicao.colecao_alvo(db, empresa_id, colecao).aggregate(
+                definicao.montar(empresa_id, destino=temporaria), **definicao.opcoes()
+            )
+        substituir_colecao(db, temporaria, nome)
+
+def verificar_amostras(
+    db: Database, empresa_id: str, docs_produto: List[Dict], produtos_vivo: List[Dict]
+) -> List[str]:
+    """Amostras de clientes que não batem com os clientes atuais ou que ficaram menores que o possível
+
+    Os exemplos não precisam ser os mesmos da agregação ao vivo (qualquer
+    cliente do produto serve), mas cada um deve existir, ainda ter o produto
+    como última compra e o mesmo nome.
+    """
+    amostras = {doc["_id"]["produto"]: doc.get("amostra_clientes") for doc in docs_produto}
+    ids = [exemplo["id"] for amostra in amostras.values() for exemplo in amostra or []]
+    atuais = {
+        doc["id"]: doc for doc in db[colecao_clientes(empresa_id)].find(
+            {"empresa_id": empresa_id, "id": {"$in": ids}}, {"_id": 0, "id": 1, "nome": 1, "ultima_compra.produto": 1}
+        )
+    } if ids else {}
+    possiveis = {produto["produto"]: len(produto["exemplo_clientes"]) for produto in produtos_vivo}
+    divergencias = []
+    for produto, amostra in sorted(amostras.items(), key=lambda item: str(item[0])):
+        if amostra is None:
+            divergencias.append(f"amostra_clientes[{produto}]: formato antigo (só nomes), reconstrua os rollups")
+            continue
+        for exemplo in amostra:
+            atual = atuais.get(exemplo["id"])
+            if atual is None or (atual.get("ultima_compra") or {}).get("produto") != produto or atual.get("nome") != exemplo["nome"]:
+                divergencias.append(f"amostra_clientes[{produto}]: obtido={exemplo} esperado={atual}")
+        if len(amostra) < possiveis.get(produto, 0):
+            divergencias.append(
+                f"amostra_clientes[{produto}]: {len(amostra)} exemplos, esperado={possiveis[produto]}"
+            )
+    return divergencias
+
+def verificar_rollups(db: Database, empresa_id: Optional[str] = None) -> List[str]:
+    """Compara os relatórios dos rollups com as agregações ao vivo; retorna as divergências"""
+    from services.cliente_service import ClienteService
+    empresa_id = empresa_id or empresa_padrao()
+    ao_vivo = ClienteService(db, empresa_id)
+    docs_idade = list(db[COLECAO_IDADE].find({"empresa_id": empresa_id}))
+    docs_idade_produto = list(db[COLECAO_IDADE_PRODUTO].find({"empresa_id": empresa_id}))
+    docs_produto = list(db[COLECAO_PRODUTO].find({**FILTRO_PRODUTOS, "empresa_id": empresa_id}))
+
+    produtos_vivo = ao_vivo.produtos_mais_vendidos(len(docs_produto) or 1)
+    for produto in produtos_vivo:
+        produto["valor_total"] = round(produto["valor_total"], 2)
+    # produtos_populares e exemplo_clientes vêm de $push sem ordem definida;
+    # as amostras são conferidas com os clientes atuais (verificar_amostras)
+    return (
+        comparar_relatorios(
+            "faixa_etaria", relatorio_faixa_etaria(docs_idade, docs_idade_produto),
+            ao_vivo.analisar_faixa_etaria(), "faixa", ["produtos_populares"],
+        )
+        + comparar_relatorios(
+            "comportamento_idade", relatorio_comportamento_por_idade(docs_idade, docs_idade_produto),
+            ao_vivo.comportamento_por_idade(), "faixa_etaria",
+        )
+        + comparar_relatorios(
+            "produtos_mais_vendidos", [relatorio_produto(d) for d in docs_produto],
+            produtos_vivo, "produto", ["exemplo_clientes"],
+        )
+        + verificar_amostras(db, empresa_id, docs_produto, produtos_vivo)
+    )
@@ -0,0 +1,122 @@
+"""Fixtures comuns dos testes
+
+``api`` sobe a aplicação inteira (lifespan incluído) sobre um MongoDB em memória
+(mongomock-motor); ``db`` é o mesmo banco pelo cliente síncrono, usado pelo
+modelo de recomendação, pela CLI e para conferir o que foi gravado.
+
+Testes marcados com ``mongo_real`` precisam de um servidor de verdade em
+MONGO_TESTES_URI (um replica set para os de leitura em secundários) e são
+pulados sem ele:
+
+    MONGO_TESTES_URI="mongodb://localhost:27017/?replicaSet=rs0" python -m pytest -m mongo_real
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "mongo_real: precisa de um MongoDB de verdade em MONGO_TESTES_URI")
+
+def pytest_collection_modifyitems(config, items):
+    if os.getenv("MONGO_TESTES_URI"):
+        return
+    pular = pytest.mark.skip(reason="MONGO_TESTES_URI não definido")
+    for item in items:
+        if "mongo_real" in item.keywords:
+            item.add_marker(pular)
+
+@pytest.fixture
+def cliente_mongomock():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    return mongomock_motor.AsyncMongoMockClient()
+
+@pytest.fixture
+def db(cliente_mongomock):
+    """Banco síncrono que compartilha os dados com o cliente assíncrono da API"""
+    return cliente_mongomock._AsyncMongoMockClient__client["clientes_testes"]
+
+@pytest.fixture
+def api(monkeypatch, tmp_path, cliente_mongomock):
+    from fastapi.testclient import TestClient
+    from config import get_settings
+    import main
+
+    async def sem_colecoes_compras(db):
+        # Coleções time series não existem no mongomock
+        pass
+
+    for nome, valor in {
+        "MONGO_DB": "clientes_testes",
+        # mongomock-motor não embrulha o cursor devolvido por with_options
+        "LEITURAS_ANALISES": "primary",
+        "RELATORIOS_DIR": str(tmp_path),
+        "RELATORIOS_PROCESSOS": "1",
+        "RECOMENDACOES_PROCESSOS": "0",
+        "CACHE_CLIENTES_REDIS_URL": "",
+    }.items():
+        monkeypatch.setenv(nome, valor)
+    get_settings.cache_clear()
+    monkeypatch.setattr(main, "criar_cliente_mongo_async", lambda *a, **k: cliente_mongomock)
+    monkeypatch.setattr(main, "criar_cliente_mongo", lambda *a, **k: cliente_mongomock._AsyncMongoMockClient__client)
+    monkeypatch.setattr(main, "configurar_colecoes_compras", sem_colecoes_compras)
+    with TestClient(main.app) as cliente:
+        yield cliente
+    get_settings.cache_clear()
+
+@pytest.fixture(scope="session")
+def mongo_real():
+    """Cliente síncrono para MONGO_TESTES_URI; cada teste usa um banco próprio e o apaga"""
+    from pymongo import MongoClient
+    cliente = MongoClient(os.environ["MONGO_TESTES_URI"], serverSelectionTimeoutMS=5000)
+    yield cliente
+    cliente.close()
+
+@pytest.fixture
+def db_real(mongo_real, request):
+    """Banco descartável no servidor real, com os índices da aplicação"""
+    from database import configurar_indices
+    nome = f"testes_{request.node.name}"[:60]
+    mongo_real.drop_database(nome)
+    db = mongo_real[nome]
+    configurar_indices(db)
+    yield db
+    mongo_real.drop_database(nome)
+
+@pytest.fixture
+def replica_set(mongo_real):
+    """URI de MONGO_TESTES_URI quando ela aponta para um replica set (senão o teste é pulado)"""
+    hello = mongo_real.admin.command("hello")
+    if not hello.get("setName") or not mongo_real.secondaries:
+        pytest.skip("MONGO_TESTES_URI não é um replica set com secundários")
+    return os.environ["MONGO_TESTES_URI"]
+
+@pytest.fixture
+def api_real(monkeypatch, tmp_path, replica_set, mongo_real, request):
+    """A aplicação sobre o replica set, com as análises em secondaryPreferred e sem caches"""
+    from fastapi.testclient import TestClient
+    from config import get_settings
+    import main
+
+    nome = f"testes_{request.node.name}"[:60]
+    for variavel, valor in {
+        "MONGO_URI": replica_set,
+        "MONGO_DB": nome,
+        "LEITURAS_ANALISES": "secondaryPreferred",
+        "CACHE_ANALISES_TTL_SEGUNDOS": "0",
+        "CACHE_CLIENTES_TTL_SEGUNDOS": "0",
+        "CACHE_CLIENTES_REDIS_URL": "",
+        "RELATORIOS_DIR": str(tmp_path),
+        "RELATORIOS_PROCESSOS": "1",
+        "RECOMENDACOES_PROCESSOS": "0",
+    }.items():
+        monkeypatch.setenv(variavel, valor)
+    get_settings.cache_clear()
+    mongo_real.drop_database(nome)
+    with TestClient(main.app) as cliente:
+        yield cliente
+    mongo_real.drop_database(nome)
+    get_settings.cache_clear()
@@ -0,0 +1,42 @@
+"""Controle de admissão: a vaga volta ao semáforo em qualquer saída da fila"""
+import asyncio
+
+import pytest
+
+from admissao import LimitadorAdmissao, Sobrecarga
+
+def _vagas_livres(limitador):
+    return limitador._semaforo._value
+
+def test_cancelar_depois_de_obter_a_vaga_devolve_a_vaga():
+    async def cenario():
+        limitador = LimitadorAdmissao("testes", max_concorrentes=1, max_fila=5, espera_max_ms=1000)
+        await limitador.entrar()
+        espera = asyncio.create_task(limitador.entrar())
+        await asyncio.sleep(0)
+        assert limitador.na_fila == 1
+        # A vaga é passada para quem espera e o cliente desconecta antes de ela ser usada
+        limitador.sair()
+        espera.cancel()
+        # O cancelamento não é engolido e a vaga recebida volta ao semáforo
+        with pytest.raises(asyncio.CancelledError):
+            await espera
+        assert limitador.na_fila == 0
+        assert limitador.em_execucao == 0
+        assert _vagas_livres(limitador) == 1
+        await asyncio.wait_for(limitador.entrar(), 0.1)
+
+    asyncio.run(cenario())
+
+def test_espera_esgotada_recusa_e_nao_consome_vaga():
+    async def cenario():
+        limitador = LimitadorAdmissao("testes", max_concorrentes=1, max_fila=5, espera_max_ms=20)
+        await limitador.entrar()
+        with pytest.raises(Sobrecarga) as erro:
+            await limitador.entrar()
+        assert erro.value.motivo == "espera"
+        assert limitador.na_fila == 0 and limitador.rejeitadas_espera == 1
+        limitador.sair()
+        assert _vagas_livres(limitador) == 1
+
+    asyncio.run(cenario())
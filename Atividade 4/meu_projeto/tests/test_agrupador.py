@@ -0,0 +1,107 @@
+"""Agrupador de buscas por id e POST /clientes/batch-get"""
+import asyncio
+
+from models.cliente import ClienteCreate
+from services.agrupador import AgrupadorBuscas
+from services.cliente_service_async import ClienteServiceAsync, PROJECAO_CLIENTE_VERSAO, buscar_clientes_por_chaves
+
+class _Lotes:
+    """buscar_lote falso que registra os lotes e pode ficar preso até ser liberado"""
+    def __init__(self, documentos):
+        self.documentos = documentos
+        self.lotes = []
+        self.liberar = None
+
+    async def __call__(self, chaves):
+        self.lotes.append(sorted(chaves))
+        # Retrato do "banco" no momento da consulta
+        encontrados = {chave: self.documentos[chave] for chave in chaves if chave in self.documentos}
+        if self.liberar is not None:
+            await self.liberar.wait()
+        return encontrados
+
+def test_buscas_concorrentes_viram_um_lote():
+    lotes = _Lotes({"1": {"id": "1"}, "2": {"id": "2"}})
+
+    async def cenario():
+        agrupador = AgrupadorBuscas(lotes, janela_ms=5)
+        resultados = await asyncio.gather(*(agrupador.obter(chave) for chave in ("1", "2", "1", "x")))
+        return resultados, agrupador.estatisticas()
+
+    resultados, estatisticas = asyncio.run(cenario())
+    # Cada chamador recebe o seu documento; a chave repetida vai uma vez só ao banco
+    assert resultados == [{"id": "1"}, {"id": "2"}, {"id": "1"}, None]
+    assert lotes.lotes == [["1", "2", "x"]]
+    assert estatisticas["buscas"] == 4 and estatisticas["lotes"] == 1
+
+def test_lote_cheio_e_despachado_sem_esperar_a_janela():
+    lotes = _Lotes({})
+
+    async def cenario():
+        agrupador = AgrupadorBuscas(lotes, janela_ms=10_000, max_lote=2)
+        return await asyncio.wait_for(asyncio.gather(agrupador.obter("1"), agrupador.obter("2")), 1)
+
+    assert asyncio.run(cenario()) == [None, None]
+
+def test_lote_despachado_nao_recebe_novos_chamadores():
+    lotes = _Lotes({"1": {"id": "1", "versao": 1}})
+
+    async def cenario():
+        lotes.liberar = asyncio.Event()
+        agrupador = AgrupadorBuscas(lotes, janela_ms=1)
+        primeira = asyncio.create_task(agrupador.obter("1"))
+        while not lotes.lotes:
+            await asyncio.sleep(0.001)
+        # O primeiro lote já está no banco: uma leitura feita depois de uma escrita
+        # não pode receber o resultado dele
+        lotes.documentos["1"] = {"id": "1", "versao": 2}
+        segunda = asyncio.create_task(agrupador.obter("1"))
+        await asyncio.sleep(0.01)
+        lotes.liberar.set()
+        return await primeira, await segunda
+
+    primeira, segunda = asyncio.run(cenario())
+    assert lotes.lotes == [["1"], ["1"]]
+    assert primeira["versao"] == 1 and segunda["versao"] == 2
+
+def test_erro_do_lote_chega_a_todos_os_chamadores():
+    async def falhar(chaves):
+        raise RuntimeError("banco indisponível")
+
+    async def cenario():
+        agrupador = AgrupadorBuscas(falhar, janela_ms=1)
+        return await asyncio.gather(agrupador.obter("1"), agrupador.obter("2"), return_exceptions=True)
+
+    assert [type(r) for r in asyncio.run(cenario())] == [RuntimeError, RuntimeError]
+
+def test_cliente_ausente_no_lote_agrupado_e_404_so_para_quem_pediu(cliente_mongomock):
+    db = cliente_mongomock["clientes_testes"]
+
+    async def cenario():
+        agrupador = AgrupadorBuscas(lambda chaves: buscar_clientes_por_chaves(db, chaves, PROJECAO_CLIENTE_VERSAO))
+        service = ClienteServiceAsync(db, "loja", agrupador=agrupador)
+        await service.criar_cliente(ClienteCreate(id="1", nome="Ana", idade=25))
+        resultados = await asyncio.gather(
+            service.obter_cliente_versionado("1"), service.obter_cliente_versionado("9"), return_exceptions=True
+        )
+        return resultados, agrupador.lotes
+
+    (encontrado, ausente), lotes = asyncio.run(cenario())
+    assert lotes == 1
+    assert encontrado == ({"id": "1", "nome": "Ana", "idade": 25, "ultima_compra": None}, '"1-1"')
+    assert isinstance(ausente, ValueError)
+
+def test_batch_get_segue_a_ordem_pedida_e_lista_os_ausentes(api):
+    for id_, nome in [("1", "Ana"), ("2", "Bia"), ("3", "Caio")]:
+        api.post("/clientes/", json={"id": id_, "nome": nome, "idade": 30})
+    resposta = api.post("/clientes/batch-get", json={"ids": ["3", "x", "1", "3"]})
+    assert resposta.status_code == 200
+    assert [c["id"] for c in resposta.json()["itens"]] == ["3", "1"]
+    assert resposta.json()["nao_encontrados"] == ["x"]
+
+def test_batch_get_limita_a_quantidade_de_ids(api):
+    from config import get_settings
+    maximo = get_settings().batch_get_max_ids
+    resposta = api.post("/clientes/batch-get", json={"ids": [str(i) for i in range(maximo + 1)]})
+    assert resposta.status_code == 400
+    assert api.post("/clientes/batch-get", json={"ids": []}).status_code == 422
@@ -0,0 +1,105 @@
+"""Paridade da AnaliseVetorizada (NumPy) com o MongoDB, também depois da sincronização incremental
+
+O mongomock não executa a maior parte dos pipelines ($firstN, $dateDiff,
+$round); nele a referência são o pipeline de maior_valor_compra e os rollups,
+mantidos pelas mesmas escritas. A comparação com todos os pipelines reais
+(verificar_paridade) roda com MONGO_TESTES_URI.
+"""
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from benchmarks.gerador import PRODUTOS, gerar_clientes
+from models.cliente import ClienteCreate, ClienteUpdate
+from services import rollups
+from services.analise_vetorizada import AnaliseVetorizada, verificar_paridade
+from services.cliente_service import ClienteService
+from services.comparacao import comparar_relatorios
+
+EMPRESA = "loja"
+QUANTIDADE = 300
+
+@pytest.fixture
+def service(db):
+    service = ClienteService(db, EMPRESA, indexar_trigramas=False)
+    for cliente in gerar_clientes(QUANTIDADE, semente=7):
+        service.criar_cliente(ClienteCreate(**cliente))
+    return service
+
+def _alterar(service, semente: int = 11) -> None:
+    """Atualizações (idade, compra, nome), remoções e clientes novos"""
+    rnd = random.Random(semente)
+    ids = [f"c{n:08d}" for n in rnd.sample(range(1, QUANTIDADE + 1), 90)]
+    for cliente_id in ids[:30]:
+        service.atualizar_cliente(cliente_id, ClienteUpdate(idade=rnd.randint(15, 90)))
+    for cliente_id in ids[30:60]:
+        produto, preco = rnd.choice(PRODUTOS)
+        compra = {"produto": produto, "valor": preco, "data": "2025-03-0%d" % rnd.randint(1, 9)}
+        service.atualizar_cliente(cliente_id, ClienteUpdate(ultima_compra=compra, nome="Renomeado"))
+    for cliente_id in ids[60:]:
+        assert service.deletar_cliente(cliente_id)
+    for numero in range(QUANTIDADE + 1, QUANTIDADE + 21):
+        service.criar_cliente(ClienteCreate(id=f"c{numero:08d}", nome="Novo Cliente", idade=rnd.randint(18, 70)))
+
+def _relatorios(motor: AnaliseVetorizada):
+    total = len(motor) or 1
+    return {
+        "faixa_etaria": motor.analisar_faixa_etaria(),
+        "comportamento_idade": motor.comportamento_por_idade(),
+        "produtos_mais_vendidos": motor.produtos_mais_vendidos(total),
+        "maior_valor_compra": motor.clientes_maior_valor_compra(total),
+        "segmentacao_rfm": motor.segmentacao_rfm(),
+    }
+
+def _divergencias_mongomock(db, motor: AnaliseVetorizada):
+    """Compara com o pipeline de maior valor e com os relatórios dos rollups"""
+    filtro = {"empresa_id": EMPRESA}
+    docs_idade = list(db[rollups.COLECAO_IDADE].find(filtro))
+    docs_idade_produto = list(db[rollups.COLECAO_IDADE_PRODUTO].find(filtro))
+    docs_produto = list(db[rollups.COLECAO_PRODUTO].find({**rollups.FILTRO_PRODUTOS, **filtro}))
+    total = len(motor)
+    ao_vivo = ClienteService(db, EMPRESA)
+    return (
+        comparar_relatorios("faixa_etaria", motor.analisar_faixa_etaria(),
+                            rollups.relatorio_faixa_etaria(docs_idade, docs_idade_produto), "faixa", ["produtos_populares"])
+        + comparar_relatorios("comportamento_idade", motor.comportamento_por_idade(),
+                              rollups.relatorio_comportamento_por_idade(docs_idade, docs_idade_produto), "faixa_etaria")
+        + comparar_relatorios("produtos_mais_vendidos", motor.produtos_mais_vendidos(total),
+                              [rollups.relatorio_produto(d) for d in docs_produto], "produto", ["exemplo_clientes"])
+        + comparar_relatorios("maior_valor_compra", motor.clientes_maior_valor_compra(total),
+                              ao_vivo.clientes_maior_valor_compra(total), "id")
+    )
+
+def test_paridade_com_rollups_e_pipeline(db, service):
+    motor = AnaliseVetorizada(db, empresa_id=EMPRESA)
+    motor.carregar()
+    assert len(motor) == QUANTIDADE
+    assert _divergencias_mongomock(db, motor) == []
+
+def test_sincronizacao_incremental_igual_a_carga_completa(db, service):
+    motor = AnaliseVetorizada(db, empresa_id=EMPRESA)
+    motor.carregar()
+    _alterar(service)
+    contagem = motor.atualizar()
+    assert contagem["removidos"] == 30
+    assert len(motor) == QUANTIDADE - 30 + 20
+
+    completo = AnaliseVetorizada(db, empresa_id=EMPRESA)
+    completo.carregar()
+    assert _relatorios(motor) == _relatorios(completo)
+    assert _divergencias_mongomock(db, motor) == []
+
+@pytest.mark.mongo_real
+def test_paridade_com_os_pipelines_antes_e_depois_da_sincronizacao(db_real):
+    service = ClienteService(db_real, EMPRESA, indexar_trigramas=False)
+    for cliente in gerar_clientes(QUANTIDADE, semente=7):
+        service.criar_cliente(ClienteCreate(**cliente))
+    motor = AnaliseVetorizada(db_real, empresa_id=EMPRESA)
+    motor.carregar()
+    assert verificar_paridade(db_real, motor) == []
+
+    _alterar(service)
+    motor.atualizar()
+    assert verificar_paridade(db_real, motor) == []
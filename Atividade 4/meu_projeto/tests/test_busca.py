@@ -0,0 +1,55 @@
+import pytest
+
+from models.cliente import ClienteCreate, ClienteUpdate
+from services import busca
+from services.cliente_service import ClienteService
+from services.registro_pipelines import COLLSCAN, analisar_explain
+
+NOMES = ["José Silva", "Josefa Lima", "Ana Sousa", "João Josué", "Maria José"]
+
+def _popular(service):
+    for numero, nome in enumerate(NOMES, 1):
+        service.criar_cliente(ClienteCreate(id=str(numero), nome=nome, idade=20 + numero))
+
+def test_listar_por_nome_usa_o_prefixo_normalizado(db):
+    service = ClienteService(db, "loja", indexar_trigramas=False)
+    _popular(service)
+    assert {c["nome"] for c in service.listar_clientes({"nome": "jos"})} == {"José Silva", "Josefa Lima"}
+    # Ancorado no início: "José" no meio ou no fim do nome não entra
+    assert service.listar_clientes({"nome": "José S"})[0]["nome"] == "José Silva"
+    assert service.listar_clientes({"nome": "silva"}) == []
+
+def test_escritas_sincronas_mantem_trigramas_e_marcas_de_remocao(db):
+    service = ClienteService(db, "loja", indexar_trigramas=True)
+    _popular(service)
+    chave = {"empresa_id": "loja", "id": "1"}
+    assert db[busca.COLECAO_TRIGRAMAS].find_one({"_id": chave})["trigramas"] == busca.trigramas("José Silva")
+
+    service.atualizar_cliente("1", ClienteUpdate(nome="Zeca"))
+    assert db[busca.COLECAO_TRIGRAMAS].find_one({"_id": chave})["trigramas"] == busca.trigramas("Zeca")
+
+    _id = db.clientes.find_one({"id": "1"})["_id"]
+    assert service.deletar_cliente("1")
+    assert db[busca.COLECAO_TRIGRAMAS].find_one({"_id": chave}) is None
+    marca = db.clientes_removidos.find_one({"_id": _id})
+    assert marca["empresa_id"] == "loja" and marca["removido_em"] is not None
+
+def _plano(db, filtro):
+    explain = db.clientes.find({"empresa_id": "loja", **filtro}).limit(20).explain()
+    return analisar_explain(explain), str(explain["queryPlanner"]["winningPlan"])
+
+@pytest.mark.mongo_real
+def test_busca_por_prefixo_usa_o_indice_de_nome_normalizado(db_real):
+    _popular(ClienteService(db_real, "loja", indexar_trigramas=False))
+    resumo, plano = _plano(db_real, busca.filtro_prefixo("jos"))
+    assert COLLSCAN not in resumo["alertas"]
+    assert "IXSCAN" in resumo["estagios_plano"]
+    assert "empresa_id_1_nome_normalizado_1" in plano
+
+@pytest.mark.mongo_real
+def test_busca_por_texto_usa_o_indice_de_texto(db_real):
+    _popular(ClienteService(db_real, "loja", indexar_trigramas=False))
+    resumo, plano = _plano(db_real, busca.filtro_texto("Silva"))
+    assert COLLSCAN not in resumo["alertas"]
+    assert "TEXT_MATCH" in resumo["estagios_plano"]
+    assert "empresa_id_1_nome_text" in plano
@@ -0,0 +1,105 @@
+"""Cache dos relatórios: coalescência de misses, invalidação por geração, TTL e LRU"""
+import asyncio
+
+import pytest
+
+from services.cache import CacheAnalises, relatorios_afetados
+
+class _Calculo:
+    """Cálculo de relatório que conta as execuções e pode esperar ser liberado"""
+    def __init__(self):
+        self.execucoes = 0
+        self.liberar = asyncio.Event()
+
+    async def __call__(self):
+        self.execucoes += 1
+        await self.liberar.wait()
+        return {"execucao": self.execucoes}
+
+def test_misses_concorrentes_calculam_uma_vez():
+    async def cenario():
+        cache, calculo = CacheAnalises(), _Calculo()
+        chamadas = [asyncio.create_task(cache.obter("rfm", ("loja",), calculo)) for _ in range(5)]
+        await asyncio.sleep(0)
+        calculo.liberar.set()
+        resultados = await asyncio.gather(*chamadas)
+        return resultados, calculo.execucoes, cache.estatisticas()
+
+    resultados, execucoes, estatisticas = asyncio.run(cenario())
+    assert execucoes == 1
+    assert resultados == [{"execucao": 1}] * 5
+    assert estatisticas["misses"] == 1 and estatisticas["coalescidos"] == 4
+
+def test_resultado_calculado_antes_de_uma_invalidacao_nao_e_guardado():
+    async def cenario():
+        cache, calculo = CacheAnalises(), _Calculo()
+        em_andamento = asyncio.create_task(cache.obter("faixa_etaria", ("loja",), calculo))
+        await asyncio.sleep(0)
+        # Uma escrita chega enquanto o relatório é calculado com os dados antigos
+        cache.invalidar({"faixa_etaria"})
+        calculo.liberar.set()
+        antigo = await em_andamento
+        novo = await cache.obter("faixa_etaria", ("loja",), calculo)
+        return antigo, novo, await cache.obter("faixa_etaria", ("loja",), calculo)
+
+    antigo, novo, em_cache = asyncio.run(cenario())
+    assert antigo == {"execucao": 1}
+    assert novo == em_cache == {"execucao": 2}
+
+def test_invalidacao_so_afeta_os_relatorios_informados():
+    async def cenario():
+        cache = CacheAnalises()
+        async def calcular():
+            return object()
+        rfm = await cache.obter("rfm", ("loja",), calcular)
+        faixa = await cache.obter("faixa_etaria", ("loja",), calcular)
+        cache.invalidar(relatorios_afetados({"idade"}))
+        return (
+            await cache.obter("rfm", ("loja",), calcular) is rfm,
+            await cache.obter("faixa_etaria", ("loja",), calcular) is faixa,
+        )
+
+    assert relatorios_afetados({"idade"}) == {"faixa_etaria", "maior_valor_compra", "comportamento_idade", "dashboard"}
+    assert asyncio.run(cenario()) == (True, False)
+
+def test_erro_do_calculo_chega_aos_coalescidos_e_nao_e_guardado():
+    async def cenario():
+        cache = CacheAnalises()
+        liberar = asyncio.Event()
+        async def falhar():
+            await liberar.wait()
+            raise RuntimeError("pipeline falhou")
+        chamadas = [asyncio.create_task(cache.obter("rfm", ("loja",), falhar)) for _ in range(2)]
+        await asyncio.sleep(0)
+        liberar.set()
+        erros = await asyncio.gather(*chamadas, return_exceptions=True)
+        async def calcular():
+            return "ok"
+        return erros, await cache.obter("rfm", ("loja",), calcular)
+
+    erros, depois = asyncio.run(cenario())
+    assert [type(e) for e in erros] == [RuntimeError, RuntimeError]
+    assert depois == "ok"
+
+@pytest.mark.parametrize("ttl, esperado", [(60, 1), (0, 2)])
+def test_ttl(ttl, esperado):
+    async def cenario():
+        cache, execucoes = CacheAnalises(ttl_segundos=ttl), []
+        async def calcular():
+            execucoes.append(1)
+        for _ in range(2):
+            await cache.obter("rfm", ("loja",), calcular)
+        return len(execucoes)
+
+    assert asyncio.run(cenario()) == esperado
+
+def test_lru_descarta_o_menos_usado():
+    async def cenario():
+        cache = CacheAnalises(max_entradas=2)
+        async def calcular():
+            return None
+        for empresa in ("a", "b", "a", "c"):
+            await cache.obter("rfm", (empresa,), calcular)
+        return [chave[1][0] for chave in cache._entradas]
+
+    assert asyncio.run(cenario()) == ["a", "c"]
@@ -0,0 +1,75 @@
+"""ETag, If-Match e o cache de clientes sob leituras e escritas concorrentes"""
+import asyncio
+
+from models.cliente import ClienteCreate, ClienteUpdate
+from services.cache_clientes import BackendMemoria, CacheClientes
+from services.cliente_service_async import ClienteServiceAsync
+
+def test_get_com_if_none_match_responde_304(api):
+    criado = api.post("/clientes/", json={"id": "1", "nome": "Ana", "idade": 25})
+    etag = criado.headers["etag"]
+    assert api.get("/clientes/1").headers["etag"] == etag
+    resposta = api.get("/clientes/1", headers={"If-None-Match": etag})
+    assert resposta.status_code == 304 and resposta.headers["etag"] == etag
+    assert api.get("/clientes/1", headers={"If-None-Match": '"1-99"'}).status_code == 200
+
+def test_if_match_desatualizado_responde_412(api):
+    antigo = api.post("/clientes/", json={"id": "1", "nome": "Ana", "idade": 25}).headers["etag"]
+    atualizado = api.put("/clientes/1", json={"idade": 26}, headers={"If-Match": antigo})
+    assert atualizado.status_code == 200 and atualizado.headers["etag"] != antigo
+    # Outra requisição com o ETag anterior não sobrescreve a alteração
+    assert api.put("/clientes/1", json={"idade": 40}, headers={"If-Match": antigo}).status_code == 412
+    assert api.delete("/clientes/1", headers={"If-Match": antigo}).status_code == 412
+    assert api.put("/clientes/1", json={"idade": 40}, headers={"If-Match": '"outro"'}).status_code == 412
+    # O ETag antigo deixa de valer também para a leitura condicional
+    assert api.get("/clientes/1", headers={"If-None-Match": antigo}).json()["idade"] == 26
+    assert api.delete("/clientes/1", headers={"If-Match": atualizado.headers["etag"]}).status_code == 204
+    assert api.get("/clientes/1").status_code == 404
+
+class _LeituraAtrasada:
+    """Coleção cuja leitura por id devolve o documento só depois de liberada"""
+    def __init__(self, colecao):
+        self._colecao = colecao
+        self.lido = asyncio.Event()
+        self.liberar = asyncio.Event()
+
+    def __getattr__(self, nome):
+        return getattr(self._colecao, nome)
+
+    async def find_one(self, *args, **kwargs):
+        doc = await self._colecao.find_one(*args, **kwargs)
+        self.lido.set()
+        await self.liberar.wait()
+        return doc
+
+def _leitura_concorrente(cliente_mongomock, escrever):
+    """Lê o cliente, aplica ``escrever`` entre a leitura no banco e o preenchimento do cache"""
+    db = cliente_mongomock["clientes_testes"]
+    async def cenario():
+        cache = CacheClientes(BackendMemoria())
+        escritor = ClienteServiceAsync(db, "loja", cache_clientes=cache)
+        await escritor.criar_cliente(ClienteCreate(id="1", nome="Ana", idade=25))
+        await cache.backend.delete("loja/1")
+        leitor = ClienteServiceAsync(db, "loja", cache_clientes=cache)
+        leitor.clientes = _LeituraAtrasada(leitor.clientes)
+        leitura = asyncio.create_task(leitor.obter_cliente_versionado("1"))
+        await leitor.clientes.lido.wait()
+        await escrever(escritor)
+        leitor.clientes.liberar.set()
+        lido, _ = await leitura
+        return lido, await cache.obter("loja/1")
+    return asyncio.run(cenario())
+
+def test_leitura_anterior_a_remocao_nao_devolve_o_cliente_ao_cache(cliente_mongomock):
+    async def remover(escritor):
+        assert await escritor.deletar_cliente("1")
+    lido, entrada = _leitura_concorrente(cliente_mongomock, remover)
+    assert lido["nome"] == "Ana"
+    assert entrada is None
+
+def test_leitura_anterior_a_atualizacao_nao_substitui_a_versao_nova(cliente_mongomock):
+    async def atualizar(escritor):
+        await escritor.atualizar_cliente("1", ClienteUpdate(idade=26))
+    lido, entrada = _leitura_concorrente(cliente_mongomock, atualizar)
+    assert lido["idade"] == 25
+    assert entrada["doc"]["idade"] == 26 and entrada["etag"] == '"1-2"'
@@ -0,0 +1,111 @@
+"""Escritas do ClienteService síncrono (CLI, workers) mantêm o mesmo estado do assíncrono"""
+from datetime import datetime
+
+import pytest
+
+from models.cliente import ClienteCreate, ClienteUpdate
+from services import rollups
+from services.cliente_service import ClienteService
+
+COLECOES_ROLLUP = (rollups.COLECAO_IDADE, rollups.COLECAO_IDADE_PRODUTO, rollups.COLECAO_PRODUTO)
+
+def _cliente(id, nome, idade, produto=None, valor=None):
+    dados = {"id": id, "nome": nome, "idade": idade}
+    if produto:
+        dados["ultima_compra"] = {"produto": produto, "valor": valor, "data": "2025-01-10"}
+    return ClienteCreate(**dados)
+
+def _rollups(db):
+    # Contadores zerados equivalem a documentos ausentes
+    return {
+        colecao: sorted(
+            (str(d["_id"]), {k: round(v, 6) for k, v in d.items() if isinstance(v, (int, float)) and k != "_id"})
+            for d in db[colecao].find()
+            if any(v for k, v in d.items() if isinstance(v, (int, float)))
+        )
+        for colecao in COLECOES_ROLLUP
+    }
+
+@pytest.fixture
+def service(db):
+    return ClienteService(db, "loja")
+
+def test_escritas_sincronas_mantem_os_rollups(service, db, cliente_mongomock):
+    service.criar_cliente(_cliente("1", "Ana", 25, "Batom", 10.0))
+    service.criar_cliente(_cliente("2", "Bia", 34, "Perfume", 80.0))
+    service.criar_cliente(_cliente("3", "Caio", 61))
+    service.atualizar_cliente("1", ClienteUpdate(idade=41, ultima_compra={"produto": "Perfume", "valor": 20.0, "data": "2025-02-01"}))
+    service.deletar_cliente("2")
+
+    esperado = cliente_mongomock._AsyncMongoMockClient__client["esperado"]
+    for colecao, operacoes in rollups.operacoes_rollup(adicionados=list(db.clientes.find())).items():
+        esperado[colecao].bulk_write(operacoes, ordered=True)
+    assert _rollups(db) == _rollups(esperado)
+
+def test_deletar_inexistente_nao_mexe_nos_rollups(service, db):
+    service.criar_cliente(_cliente("1", "Ana", 25, "Batom", 10.0))
+    antes = _rollups(db)
+    assert service.deletar_cliente("9") is False
+    assert _rollups(db) == antes
+
+def test_escritas_sincronas_gravam_os_campos_derivados(service, db):
+    service.criar_cliente(_cliente("1", "José Álvares", 19, "Batom", 10.0))
+    criado = db.clientes.find_one({"id": "1"})
+    assert criado["nome_normalizado"] == "jose alvares"
+    assert criado["faixa_etaria"] == "0-19"
+    assert criado["ultima_compra_em"] == datetime(2025, 1, 10)
+    assert criado["atualizado_em"] is not None
+
+    service.atualizar_cliente("1", ClienteUpdate(nome="Zé", idade=45))
+    atualizado = db.clientes.find_one({"id": "1"})
+    assert atualizado["nome_normalizado"] == "ze"
+    assert atualizado["faixa_etaria"] == "40-49"
+    assert atualizado["atualizado_em"] >= criado["atualizado_em"]
+
+def _amostra(db, produto):
+    return db[rollups.COLECAO_PRODUTO].find_one({"_id": {"empresa_id": "loja", "produto": produto}})["amostra_clientes"]
+
+def test_amostra_de_clientes_sai_pelo_id_e_guarda_os_mais_recentes(service, db):
+    for id_, nome in [("1", "Ana"), ("2", "Bia"), ("3", "Ana"), ("4", "Caio")]:
+        service.criar_cliente(_cliente(id_, nome, 30, "Batom", 10.0))
+    assert _amostra(db, "Batom") == [{"id": "2", "nome": "Bia"}, {"id": "3", "nome": "Ana"}, {"id": "4", "nome": "Caio"}]
+
+    # Outra cliente com o mesmo nome saiu: a Ana da amostra continua
+    service.deletar_cliente("1")
+    service.atualizar_cliente("4", ClienteUpdate(nome="Caio Lima"))
+    assert _amostra(db, "Batom") == [{"id": "2", "nome": "Bia"}, {"id": "3", "nome": "Ana"}, {"id": "4", "nome": "Caio Lima"}]
+    service.deletar_cliente("3")
+    assert _amostra(db, "Batom") == [{"id": "2", "nome": "Bia"}, {"id": "4", "nome": "Caio Lima"}]
+    assert rollups.relatorio_produto(db[rollups.COLECAO_PRODUTO].find_one())["exemplo_clientes"] == ["Bia", "Caio Lima"]
+
+def test_verificar_amostras_aponta_exemplos_desatualizados_e_incompletos(service, db):
+    service.criar_cliente(_cliente("1", "Ana", 30, "Batom", 10.0))
+    service.criar_cliente(_cliente("2", "Bia", 30, "Batom", 10.0))
+    service.criar_cliente(_cliente("3", "Caio", 30, "Perfume", 10.0))
+    docs = list(db[rollups.COLECAO_PRODUTO].find({"empresa_id": "loja"}))
+    vivo = [{"produto": "Batom", "exemplo_clientes": ["Ana", "Bia"]}, {"produto": "Perfume", "exemplo_clientes": ["Caio"]}]
+    assert rollups.verificar_amostras(db, "loja", docs, vivo) == []
+
+    # Escrita que não passou pelos rollups: a amostra ficou com o nome antigo
+    db.clientes.update_one({"id": "1"}, {"$set": {"nome": "Ana Lima"}})
+    db[rollups.COLECAO_PRODUTO].update_one(
+        {"_id": {"empresa_id": "loja", "produto": "Perfume"}}, {"$set": {"amostra_clientes": []}}
+    )
+    docs = list(db[rollups.COLECAO_PRODUTO].find({"empresa_id": "loja"}))
+    divergencias = rollups.verificar_amostras(db, "loja", docs, vivo)
+    assert len(divergencias) == 2
+    assert divergencias[0].startswith("amostra_clientes[Batom]: obtido={'id': '1', 'nome': 'Ana'}")
+    assert divergencias[1] == "amostra_clientes[Perfume]: 0 exemplos, esperado=1"
+
+@pytest.mark.mongo_real
+def test_reconstrucao_preenche_as_amostras(db_real):
+    service = ClienteService(db_real, "loja")
+    for id_, nome in [("1", "Ana"), ("2", "Bia"), ("3", "Caio"), ("4", "Davi"), ("5", "Eva")]:
+        service.criar_cliente(_cliente(id_, nome, 30, "Batom", 10.0))
+    service.deletar_cliente("4")
+    service.deletar_cliente("5")
+    assert _amostra(db_real, "Batom") == [{"id": "3", "nome": "Caio"}]
+    assert rollups.verificar_rollups(db_real, "loja") == ["amostra_clientes[Batom]: 1 exemplos, esperado=3"]
+    rollups.reconstruir_rollups(db_real, "loja")
+    assert {e["id"] for e in _amostra(db_real, "Batom")} == {"1", "2", "3"}
+    assert rollups.verificar_rollups(db_real, "loja") == []
@@ -0,0 +1,68 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from models.compra import CompraCreate
+from services import compra_service
+from services.cliente_service_async import TempoEsgotado
+
+BRASILIA = timezone(timedelta(hours=-3))
+
+def test_datas_das_compras_sao_normalizadas_para_utc():
+    sem_fuso = CompraCreate(cliente_id="1", produto="Batom", valor=10, data=datetime(2025, 1, 1, 12))
+    com_fuso = CompraCreate(cliente_id="1", produto="Batom", valor=10, data=datetime(2025, 1, 1, 22, tzinfo=BRASILIA))
+    assert sem_fuso.data == datetime(2025, 1, 1, 12, tzinfo=timezone.utc)
+    assert com_fuso.data == datetime(2025, 1, 2, 1, tzinfo=timezone.utc)
+    assert min(sem_fuso.data, com_fuso.data) == sem_fuso.data
+
+def test_inicio_do_dia_usa_o_dia_em_utc():
+    assert compra_service.inicio_do_dia(datetime(2025, 1, 1, 22, tzinfo=BRASILIA)) == datetime(2025, 1, 2)
+    assert compra_service.inicio_do_dia(datetime(2025, 1, 1, 22)) == datetime(2025, 1, 1)
+
+def test_lote_com_datas_com_e_sem_fuso(api, db):
+    compras = [
+        {"cliente_id": "1", "produto": "Batom", "valor": 10, "data": "2025-01-01T12:00:00"},
+        {"cliente_id": "1", "produto": "Perfume", "valor": 30, "data": "2025-01-01T22:00:00-03:00"},
+    ]
+    resposta = api.post("/compras/", json={"compras": compras})
+    assert resposta.status_code == 201, resposta.text
+    assert resposta.json() == {"registradas": 2, "clientes_afetados": 1, "produtos_afetados": 2}
+    assert sorted(d["dia"] for d in db.compras_cliente_diario.find()) == [datetime(2025, 1, 1), datetime(2025, 1, 2)]
+    # metaField da time-series: os buckets ficam separados por empresa e cliente
+    assert [d["meta"] for d in db.compras.find()] == [{"empresa_id": "padrao", "cliente_id": "1"}] * 2
+    resumo = api.get("/compras/clientes/1/resumo").json()
+    assert resumo["frequencia"] == 2 and resumo["valor_total"] == 40
+
+def test_produtos_por_periodo_limita_o_limit(api):
+    parametros = {"inicio": "2025-01-01", "fim": "2025-01-31"}
+    for limite in (0, 101):
+        assert api.get("/compras/analise/produtos", params={**parametros, "limit": limite}).status_code == 422
+
+def test_produtos_por_periodo_tempo_esgotado_vira_503(api, monkeypatch):
+    async def estourar(*args, **kwargs):
+        raise TempoEsgotado("Pipeline produtos_periodo excedeu o tempo limite de 1 ms")
+    monkeypatch.setattr(compra_service, "agregar", estourar)
+    resposta = api.get("/compras/analise/produtos", params={"inicio": "2025-01-01", "fim": "2025-01-31"})
+    assert resposta.status_code == 503
+    assert resposta.headers["Retry-After"] == "5"
+
+@pytest.mark.mongo_real
+def test_colecao_de_eventos_separa_os_buckets_por_empresa_e_cliente(db_real):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def configurar():
+        cliente = AsyncIOMotorClient(os.environ["MONGO_TESTES_URI"])
+        try:
+            await compra_service.configurar_colecoes_compras(cliente[db_real.name])
+        finally:
+            cliente.close()
+
+    asyncio.run(configurar())
+    (info,) = db_real.list_collections(filter={"name": "compras"})
+    assert info["options"]["timeseries"]["metaField"] == "meta"
+    indices = [list(i["key"]) for i in db_real.compras.index_information().values()]
+    assert [("empresa_id", 1), ("cliente_id", 1), ("data", 1)] in indices or [
+        ("meta.empresa_id", 1), ("meta.cliente_id", 1), ("data", 1)
+    ] in indices
@@ -0,0 +1,78 @@
+"""Uma única definição de faixas de idade para faixa_etaria, comportamento_idade e a Atividade 3"""
+import pytest
+
+import migracoes
+from services import registro_pipelines, rollups
+from services.derivados import rotulo_faixa_etaria
+from services.pipelines import ROTULOS_IDADE
+
+EMPRESA = "loja"
+# Bordas das faixas, idades acima de 100 e sem idade
+IDADES = [0, 19, 20, 59, 60, 99, 100, 130, None]
+
+def _clientes():
+    return [
+        {"empresa_id": EMPRESA, "id": str(i), "nome": f"Cliente {i}", "idade": idade,
+         "ultima_compra": {"produto": "Batom", "valor": 10.0, "data": "2025-01-10"}}
+        for i, idade in enumerate(IDADES)
+    ]
+
+def _totais(linhas, campo):
+    return {linha[campo]: linha["total_clientes"] for linha in linhas}
+
+def test_rotulos_das_faixas():
+    assert [rotulo_faixa_etaria(idade) for idade in IDADES] == [
+        "0-19", "0-19", "20-29", "50-59", "60+", "60+", "Outros", "Outros", "Outros",
+    ]
+    assert set(ROTULOS_IDADE.values()) == {"0-19", "20-29", "30-39", "40-49", "50-59", "60+", "Outros"}
+
+def test_faixa_etaria_e_comportamento_usam_os_mesmos_rotulos(db):
+    db.clientes.insert_many(_clientes())
+    for colecao, operacoes in rollups.operacoes_rollup(adicionados=_clientes()).items():
+        db[colecao].bulk_write(operacoes, ordered=True)
+    filtro = {"empresa_id": EMPRESA}
+    docs_idade = list(db[rollups.COLECAO_IDADE].find(filtro))
+    docs_idade_produto = list(db[rollups.COLECAO_IDADE_PRODUTO].find(filtro))
+
+    esperado = {"0-19": 2, "20-29": 1, "50-59": 1, "60+": 2, "Outros": 3}
+    assert _totais(rollups.relatorio_faixa_etaria(docs_idade, docs_idade_produto), "faixa") == esperado
+    assert _totais(rollups.relatorio_comportamento_por_idade(docs_idade, docs_idade_produto), "faixa_etaria") == esperado
+
+    pytest.importorskip("numpy")
+    from services.analise_vetorizada import AnaliseVetorizada
+    motor = AnaliseVetorizada(db, empresa_id=EMPRESA)
+    motor.carregar()
+    assert _totais(motor.analisar_faixa_etaria(), "faixa") == esperado
+    assert _totais(motor.comportamento_por_idade(), "faixa_etaria") == esperado
+
+def test_migracao_regrava_os_rotulos_antigos(db):
+    db.clientes.insert_many([
+        {"empresa_id": EMPRESA, "id": "1", "idade": 15, "faixa_etaria": "Menor que 20"},
+        {"empresa_id": EMPRESA, "id": "2", "idade": 120, "faixa_etaria": "60+"},
+        {"empresa_id": EMPRESA, "id": "3", "idade": 45, "faixa_etaria": "40-49"},
+    ])
+    migracao = next(m for m in migracoes.MIGRACOES if m.nome == "0009_rotulos_faixa_etaria")
+    assert migracoes.executar_migracao(db, migracao) == 2
+    assert {d["id"]: d["faixa_etaria"] for d in db.clientes.find()} == {"1": "0-19", "2": "Outros", "3": "40-49"}
+
+def test_pipelines_da_atividade_3_estao_registrados():
+    from services.pipelines import expr_faixa_idade
+    faixa = registro_pipelines.obter("clientes_por_faixa").montar(None)
+    assert faixa[0]["$group"]["_id"] == expr_faixa_idade()
+    assert registro_pipelines.obter("produtos_clientes_distintos").montar(EMPRESA, limit=3)[-1] == {"$limit": 3}
+
+@pytest.mark.mongo_real
+def test_pipelines_agrupam_nas_mesmas_faixas(db_real):
+    from services.derivados import campos_derivados
+    docs = [{**doc, **campos_derivados(doc)} for doc in _clientes()]
+    db_real.clientes.insert_many(docs)
+    esperado = {"0-19": 2, "20-29": 1, "50-59": 1, "60+": 2, "Outros": 3}
+
+    def executar(nome, **argumentos):
+        definicao = registro_pipelines.obter(nome)
+        return list(db_real.clientes.aggregate(definicao.montar(EMPRESA, **argumentos), allowDiskUse=True))
+
+    assert _totais(executar("faixa_etaria"), "faixa") == esperado
+    assert _totais(executar("comportamento_idade"), "faixa_etaria") == esperado
+    assert _totais(executar("comportamento_idade", campos_derivados=True), "faixa_etaria") == esperado
+    assert {d["_id"]: d["total_clientes"] for d in executar("clientes_por_faixa")} == esperado
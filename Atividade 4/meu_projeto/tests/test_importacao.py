@@ -0,0 +1,50 @@
+import asyncio
+
+from services.importacao import ErroLinha, ler_csv, ler_ndjson, linhas_do_corpo
+
+async def _pedacos(corpo: bytes, tamanho: int = 7):
+    for inicio in range(0, len(corpo), tamanho):
+        yield corpo[inicio:inicio + tamanho]
+
+def _ler(leitor, corpo: bytes):
+    async def coletar():
+        return [item async for item in leitor(linhas_do_corpo(_pedacos(corpo)))]
+    return asyncio.run(coletar())
+
+def test_ndjson_linhas_que_nao_sao_objetos_viram_erro():
+    corpo = b'{"id": "1"}\n5\nnull\n[1]\n"texto"\n{"id": "2"}\n'
+    lidos = _ler(ler_ndjson, corpo)
+    assert lidos[0] == (1, {"id": "1"})
+    assert lidos[-1] == (6, {"id": "2"})
+    assert [numero for numero, registro in lidos if isinstance(registro, ErroLinha)] == [2, 3, 4, 5]
+
+def test_utf8_invalido_vira_erro_da_linha_e_a_leitura_continua():
+    corpo = '{"id": "1", "nome": "José"}\n'.encode() + b'{"id": "2", "nome": "Jos\xe9"}\n{"id": "3"}'
+    lidos = _ler(ler_ndjson, corpo)
+    assert lidos[0] == (1, {"id": "1", "nome": "José"})
+    assert isinstance(lidos[1][1], ErroLinha) and lidos[1][0] == 2
+    assert lidos[2] == (3, {"id": "3"})
+
+def test_csv_com_campo_entre_aspas_em_varias_linhas():
+    corpo = (
+        'id,nome,idade,produto,valor,data\n'
+        '1,"Ana\nMaria",30,"Batom ""Vermelho""",10,2025-01-01\n'
+        '2,Bia,22,,,\n'
+    ).encode()
+    lidos = _ler(ler_csv, corpo)
+    assert lidos[0][0] == 2
+    assert lidos[0][1]["nome"] == "Ana\nMaria"
+    assert lidos[0][1]["ultima_compra"]["produto"] == 'Batom "Vermelho"'
+    assert lidos[1] == (4, {"id": "2", "nome": "Bia", "idade": "22"})
+
+def test_csv_aspas_nao_fechadas():
+    lidos = _ler(ler_csv, b'id,nome,idade\n1,"Ana,30\n2,Bia,22\n')
+    assert len(lidos) == 1 and lidos[0][0] == 2 and isinstance(lidos[0][1], ErroLinha)
+
+def test_bulk_relata_linhas_invalidas_sem_interromper(api):
+    corpo = b'{"id": "1", "nome": "Ana", "idade": 25}\n5\n"x"\n\xff\xfe\n{"id": "2", "nome": "Bia", "idade": 30}\n'
+    resposta = api.post("/clientes/bulk", content=corpo)
+    assert resposta.status_code == 200
+    resultado = resposta.json()
+    assert resultado["inseridos"] == 2
+    assert [erro["linha"] for erro in resultado["erros"]] == [2, 3, 4]
@@ -0,0 +1,54 @@
+"""A memória dos relatórios não cresce com o volume de dados (ver benchmarks/memoria.py)"""
+import bson
+import pytest
+
+from benchmarks import memoria
+from services import registro_pipelines
+from services.compra_service import CAMPO_CLIENTES_HLL
+from services.empresas import colecao_clientes, empresa_padrao
+from services.sketches import HyperLogLog, PRECISAO_PADRAO
+
+def test_sketch_tem_memoria_constante():
+    medicoes = memoria.medir_sketches([2000, 50000])
+    pequeno, grande = medicoes[2000], medicoes[50000]
+    assert grande["registradores"] <= 2 ** PRECISAO_PADRAO
+    # 25x mais valores distintos, praticamente o mesmo pico
+    assert grande["pico_bytes"] <= pequeno["pico_bytes"] * 1.5
+    assert grande["erro_pct"] < 10
+
+def test_rollup_diario_guarda_um_sketch_limitado(api, db):
+    # Vários lotes: o sketch gravado é juntado com $max a cada escrita
+    for lote in range(4):
+        compras = [
+            {"cliente_id": f"c{lote * 200 + i}", "produto": "Batom", "valor": 10, "data": "2025-01-01T12:00:00"}
+            for i in range(200)
+        ]
+        assert api.post("/compras/", json={"compras": compras}).status_code == 201
+    (diario,) = list(db.compras_produto_diario.find())
+    assert len(diario[CAMPO_CLIENTES_HLL]) <= 2 ** PRECISAO_PADRAO
+    assert len(bson.encode(diario)) < 32 * 1024
+    estimativa = HyperLogLog(registradores=diario[CAMPO_CLIENTES_HLL]).estimar()
+    assert abs(estimativa - 800) < 800 * 0.1
+
+def _maior_documento(db, pipeline):
+    colecao = db[colecao_clientes(empresa_padrao())]
+    return max((len(bson.encode(doc)) for doc in colecao.aggregate(pipeline, allowDiskUse=True)), default=0)
+
+@pytest.mark.mongo_real
+def test_relatorios_tem_documentos_de_tamanho_constante(db_real):
+    from benchmarks.executar import carregar_dados
+    relatorios = {
+        nome: registro_pipelines.sem_gravacao(registro_pipelines.obter(nome).montar(empresa_padrao(), **argumentos))
+        for nome, argumentos in (
+            ("faixa_etaria", {}),
+            ("produtos_mais_vendidos", {"limit": 20}),
+            ("comportamento_idade", {}),
+            ("rollup_produto", {}),
+        )
+    }
+    tamanhos = {}
+    for quantidade in (2000, 40000):
+        carregar_dados(db_real, quantidade, semente=42)
+        tamanhos[quantidade] = {nome: _maior_documento(db_real, p) for nome, p in relatorios.items()}
+    for nome in relatorios:
+        assert tamanhos[40000][nome] <= tamanhos[2000][nome] * 1.1, (nome, tamanhos)
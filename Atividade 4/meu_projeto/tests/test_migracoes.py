@@ -0,0 +1,51 @@
+"""Migrações de clientes: empresas dedicadas e backfills em todas as coleções de clientes"""
+import pytest
+
+import migracoes
+from config import get_settings
+from services import busca
+
+@pytest.fixture
+def dedicada(monkeypatch):
+    monkeypatch.setenv("EMPRESAS_DEDICADAS", "grande")
+    get_settings.cache_clear()
+    yield "grande"
+    get_settings.cache_clear()
+
+def _migrar(db, **argumentos):
+    return {m.nome: migracoes.executar_migracao(db, m, tamanho_lote=2, **argumentos) for m in migracoes.MIGRACOES}
+
+def test_move_os_clientes_das_empresas_dedicadas(db, dedicada):
+    db.clientes.insert_many([
+        {"empresa_id": "grande", "id": str(i), "nome": f"Cliente {i}", "idade": 30 + i} for i in range(5)
+    ] + [{"empresa_id": "loja", "id": "1", "nome": "Ana", "idade": 25}])
+    _migrar(db)
+
+    assert [d["id"] for d in db.clientes.find()] == ["1"]
+    movidos = list(db["clientes__grande"].find())
+    assert sorted(d["id"] for d in movidos) == ["0", "1", "2", "3", "4"]
+    # Os backfills ficaram com os documentos (rodaram antes na compartilhada)
+    assert all(d["nome_normalizado"].startswith("cliente ") and d["faixa_etaria"] for d in movidos)
+    assert db[busca.COLECAO_TRIGRAMAS].count_documents({"empresa_id": "grande"}) == 5
+
+def test_backfills_percorrem_as_colecoes_dedicadas(db, dedicada):
+    db["clientes__grande"].insert_one({"empresa_id": "grande", "id": "7", "nome": "José", "idade": 70})
+    _migrar(db)
+
+    doc = db["clientes__grande"].find_one({"id": "7"})
+    assert doc["nome_normalizado"] == "jose"
+    assert doc["faixa_etaria"] == "60+"
+    assert doc["versao"] == 1
+    assert db[busca.COLECAO_TRIGRAMAS].find_one({"_id": {"empresa_id": "grande", "id": "7"}})
+    estados = {(e["nome"], e["colecao"]): e for e in migracoes.estado_migracoes(db)}
+    assert estados[("0002_campos_derivados", "clientes__grande")]["concluida"]
+    assert ("0008_clientes_dedicados", "clientes__grande") not in estados
+
+def test_mover_mantem_o_cliente_ja_gravado_na_dedicada(db, dedicada):
+    db.clientes.insert_one({"empresa_id": "grande", "id": "1", "nome": "Antigo", "idade": 20})
+    db["clientes__grande"].create_index([("empresa_id", 1), ("id", 1)], unique=True)
+    db["clientes__grande"].insert_one({"empresa_id": "grande", "id": "1", "nome": "Novo", "idade": 21})
+    _migrar(db)
+
+    assert db.clientes.count_documents({}) == 0
+    assert [d["nome"] for d in db["clientes__grande"].find()] == ["Novo"]
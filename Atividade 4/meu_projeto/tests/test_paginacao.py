@@ -0,0 +1,56 @@
+"""Paginação por chave de GET /clientes e o cursor opaco"""
+import asyncio
+
+import pytest
+
+from models.cliente import ClienteCreate
+from services.cliente_service_async import ClienteServiceAsync, codificar_cursor, decodificar_cursor
+
+@pytest.mark.parametrize("ultimo_id", ["1", "cliente-42", "José/Ä", ""])
+def test_cursor_ida_e_volta(ultimo_id):
+    cursor = codificar_cursor(ultimo_id)
+    # Seguro em URL e sem o preenchimento "="
+    assert "=" not in cursor and "/" not in cursor and "+" not in cursor
+    assert decodificar_cursor(cursor) == ultimo_id
+
+@pytest.mark.parametrize("cursor", ["não-é-base64!", codificar_cursor("1")[:-2] + "@@", "e30"])
+def test_cursor_invalido(cursor):
+    with pytest.raises(ValueError):
+        decodificar_cursor(cursor)
+
+def _paginas(cliente_mongomock, quantidade, limite):
+    db = cliente_mongomock["clientes_testes"]
+
+    async def cenario():
+        service = ClienteServiceAsync(db, "loja")
+        for i in range(quantidade):
+            await service.criar_cliente(ClienteCreate(id=f"{i:03d}", nome=f"Cliente {i}", idade=30))
+        paginas, cursor = [], None
+        while True:
+            pagina = await service.listar_clientes({}, limite, cursor)
+            paginas.append([c["id"] for c in pagina["itens"]])
+            cursor = pagina["next"]
+            if cursor is None:
+                return paginas
+
+    return asyncio.run(cenario())
+
+@pytest.mark.parametrize("quantidade, limite, tamanhos", [
+    (3, 3, [3]),       # exatamente o limite: o documento extra não existe, sem próxima página
+    (4, 3, [3, 1]),    # limite + 1: uma página a mais, com o último
+    (6, 3, [3, 3]),
+    (0, 3, [0]),
+])
+def test_paginas_cobrem_todos_os_clientes_sem_repetir(cliente_mongomock, quantidade, limite, tamanhos):
+    paginas = _paginas(cliente_mongomock, quantidade, limite)
+    assert [len(p) for p in paginas] == tamanhos
+    assert [i for p in paginas for i in p] == [f"{i:03d}" for i in range(quantidade)]
+
+def test_rota_pagina_e_recusa_cursor_invalido(api):
+    for i in range(3):
+        api.post("/clientes/", json={"id": str(i), "nome": f"Cliente {i}", "idade": 30})
+    primeira = api.get("/clientes/", params={"limite": 2}).json()
+    assert [c["id"] for c in primeira["itens"]] == ["0", "1"]
+    segunda = api.get("/clientes/", params={"limite": 2, "cursor": primeira["next"]}).json()
+    assert [c["id"] for c in segunda["itens"]] == ["2"] and segunda["next"] is None
+    assert api.get("/clientes/", params={"cursor": "invalido!"}).status_code == 400
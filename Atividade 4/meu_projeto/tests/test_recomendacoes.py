@@ -0,0 +1,141 @@
+"""Recomendações: índice depois da sincronização, carga fora da trava, limite de modelos, campanhas e histórico"""
+import asyncio
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip("scipy")
+
+from benchmarks.gerador import gerar_clientes, gerar_historico
+from benchmarks.recomendacoes import campanha
+from models.cliente import ClienteCreate, ClienteUpdate
+from services.cliente_service import ClienteService
+from services.compra_service import COLECAO_CLIENTE_PRODUTO
+from services.recomendacoes import GerenciadorRecomendacoes, ModeloRecomendacao, reconstruir_historico
+
+EMPRESA = "loja"
+QUANTIDADE = 200
+
+@pytest.fixture
+def service(db):
+    service = ClienteService(db, EMPRESA, indexar_trigramas=False)
+    for cliente in gerar_clientes(QUANTIDADE, semente=7):
+        service.criar_cliente(ClienteCreate(**cliente))
+    agora = datetime.now(timezone.utc)
+    db[COLECAO_CLIENTE_PRODUTO].insert_many([
+        {**doc, "empresa_id": EMPRESA, "atualizado_em": agora} for doc in gerar_historico(QUANTIDADE, semente=7)
+    ])
+    return service
+
+@pytest.fixture
+def modelo(db, service):
+    modelo = ModeloRecomendacao(db, EMPRESA, indice_max=50)
+    modelo.carregar()
+    modelo.indexar()
+    return modelo
+
+def test_sincronizacao_refaz_so_o_indice_dos_produtos_consultados(modelo, service):
+    consultado, outro = modelo.produtos[0], modelo.produtos[1]
+    primeiro = modelo.clientes_para_produto(consultado, 10)[0]["id"]
+    assert len(modelo._indice) == len(modelo.produtos)
+
+    # O melhor candidato compra o produto: deixa de ser candidato depois da sincronização
+    service.atualizar_cliente(primeiro, ClienteUpdate(ultima_compra={"produto": consultado, "valor": 1.0, "data": "2025-03-01"}))
+    assert modelo.atualizar()["alterados"]
+    assert modelo._indice == {}
+    modelo.reindexar()
+    assert set(modelo._indice) == {modelo._codigos_produto[consultado]}
+
+    assert primeiro not in [c["id"] for c in modelo.clientes_para_produto(consultado, 10)]
+    # Os demais são calculados na primeira consulta, já com a matriz nova
+    novo = ModeloRecomendacao(modelo.db, EMPRESA, indice_max=50)
+    novo.carregar()
+    assert modelo.clientes_para_produto(outro, 10) == novo.clientes_para_produto(outro, 10)
+
+def test_campanha_monta_os_blocos_fora_do_event_loop(db, service):
+    gerenciador = GerenciadorRecomendacoes(db, intervalo_s=0, processos=0, indice_max=50)
+    threads = []
+
+    async def cenario():
+        await gerenciador.iniciar()
+        try:
+            modelo = await gerenciador.modelo(EMPRESA)
+            original = modelo.blocos_campanha
+
+            def blocos_campanha(*argumentos):
+                threads.append(threading.get_ident())
+                return original(*argumentos)
+
+            modelo.blocos_campanha = blocos_campanha
+            produtos = modelo.produtos[:3]
+            resultado = await gerenciador.pontuar_campanha(EMPRESA, produtos, 5)
+            modelo.blocos_campanha = original
+            return threading.get_ident(), resultado, campanha(modelo, produtos, None, 4, 5)
+        finally:
+            await gerenciador.encerrar()
+
+    thread_do_loop, resultado, esperado = asyncio.run(cenario())
+    assert threads and thread_do_loop not in threads
+    assert resultado == esperado
+
+def test_carga_monta_fora_da_trava_e_mantem_os_consultados(modelo):
+    consultado = modelo.produtos[-1]
+    modelo.clientes_para_produto(consultado, 10)
+    travada = []
+    busca = modelo.clientes.find
+    def find(*argumentos, **opcoes):
+        travada.append(modelo._trava.locked())
+        return busca(*argumentos, **opcoes)
+    modelo.clientes.find = find
+    modelo.carregar()
+    assert travada == [False]
+    assert modelo._consultados == {modelo._codigos_produto[consultado]}
+    assert len(modelo) == QUANTIDADE
+
+def test_gerenciador_limita_os_modelos_em_memoria(db, service):
+    ClienteService(db, "outra", indexar_trigramas=False).criar_cliente(
+        ClienteCreate(id="1", nome="Ana", idade=30, ultima_compra={"produto": "Batom", "valor": 1.0, "data": "2025-01-01"})
+    )
+    gerenciador = GerenciadorRecomendacoes(db, intervalo_s=0, processos=0, indice_max=50, max_empresas=1, ociosa_s=60)
+
+    async def cenario():
+        # Empresa sem clientes (cabeçalho arbitrário): nenhum modelo é montado
+        with pytest.raises(ValueError):
+            await gerenciador.modelo("inexistente")
+        assert not gerenciador._modelos and not gerenciador._carregando
+        await gerenciador.modelo(EMPRESA)
+        await gerenciador.modelo("outra")
+        # O limite descarta o modelo usado há mais tempo
+        assert list(gerenciador._modelos) == ["outra"]
+        gerenciador._usado_em["outra"] -= 120
+        gerenciador._descartar_ociosos()
+        return dict(gerenciador._modelos), dict(gerenciador._usado_em)
+
+    assert asyncio.run(cenario()) == ({}, {})
+
+@pytest.mark.mongo_real
+def test_reconstruir_historico_troca_a_colecao_de_uma_vez(db_real):
+    db_real.compras.insert_many([
+        {"empresa_id": EMPRESA, "cliente_id": "1", "produto": "Batom", "valor": 10.0},
+        {"empresa_id": EMPRESA, "cliente_id": "1", "produto": "Batom", "valor": 12.0},
+        {"empresa_id": EMPRESA, "cliente_id": "2", "produto": "Perfume", "valor": 80.0},
+        {"empresa_id": "outra", "cliente_id": "9", "produto": "Batom", "valor": 5.0},
+    ])
+    # Histórico desatualizado da empresa e um da outra empresa, que fica como está
+    db_real[COLECAO_CLIENTE_PRODUTO].insert_many([
+        {"_id": {"empresa_id": EMPRESA, "cliente_id": "3", "produto": "Batom"},
+         "empresa_id": EMPRESA, "cliente_id": "3", "produto": "Batom", "compras": 7},
+        {"_id": {"empresa_id": "outra", "cliente_id": "8", "produto": "Batom"},
+         "empresa_id": "outra", "cliente_id": "8", "produto": "Batom", "compras": 1},
+    ])
+    reconstruir_historico(db_real, EMPRESA)
+
+    historico = {
+        (d["empresa_id"], d["cliente_id"], d["produto"]): d["compras"]
+        for d in db_real[COLECAO_CLIENTE_PRODUTO].find()
+    }
+    assert historico == {(EMPRESA, "1", "Batom"): 2, (EMPRESA, "2", "Perfume"): 1, ("outra", "8", "Batom"): 1}
+    indices = [[campo for campo, _ in i["key"]] for i in db_real[COLECAO_CLIENTE_PRODUTO].index_information().values()]
+    assert ["empresa_id", "atualizado_em"] in indices and ["empresa_id", "cliente_id"] in indices
+    assert f"{COLECAO_CLIENTE_PRODUTO}_reconstrucao" not in db_real.list_collection_names()
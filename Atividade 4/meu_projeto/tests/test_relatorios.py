@@ -0,0 +1,170 @@
+"""Fila de relatórios: só jobs pendentes ou com o prazo vencido são assumidos"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+from services import relatorios
+
+def _job(job_id, status, lease_ate=None, executor=None):
+    return {
+        "_id": job_id, "status": status, "progresso": 0.0, "empresa_id": "loja", "analises": ["faixa_etaria"],
+        "formato": "csv", "limit": 10, "criado_em": datetime.now(timezone.utc), "concluido_em": None,
+        "tamanho_bytes": None, "erro": None, "executor": executor, "lease_ate": lease_ate, "heartbeat_em": None,
+    }
+
+@pytest.fixture
+def gerados(monkeypatch):
+    """Substitui a geração do arquivo (que roda no pool de processos) por uma espera curta"""
+    chamadas = []
+    def gerar(job_id, executor, empresa_id, analises, formato, limit, caminho):
+        chamadas.append(job_id)
+        time.sleep(0.5)
+        with open(caminho, "w") as arquivo:
+            arquivo.write("ok")
+        return 2
+    monkeypatch.setattr(relatorios, "gerar_relatorio", gerar)
+    return chamadas
+
+def _executar(cliente_mongomock, tmp_path, jobs, esperar_s, lease_s=0.3, durante=None, preparar=None):
+    db = cliente_mongomock["relatorios_testes"]
+    async def cenario():
+        await db[relatorios.COLECAO_RELATORIOS].insert_many(jobs)
+        fila = relatorios.FilaRelatorios(db, str(tmp_path), processos=1, lease_s=lease_s)
+        # Threads do próprio processo: a geração substituída não é serializável
+        fila._criar_pool = lambda: ThreadPoolExecutor(1)
+        if preparar is not None:
+            preparar(fila)
+        await fila.iniciar()
+        observado = None
+        if durante is not None:
+            await asyncio.sleep(durante[0])
+            observado = await db[relatorios.COLECAO_RELATORIOS].find_one({"_id": durante[1]})
+            observado["observado_em"] = datetime.now(timezone.utc)
+        await asyncio.sleep(esperar_s)
+        await fila.encerrar()
+        finais = {j["_id"]: j async for j in db[relatorios.COLECAO_RELATORIOS].find()}
+        return finais, observado
+    return asyncio.run(cenario())
+
+def test_job_em_execucao_por_outro_processo_nao_e_assumido(cliente_mongomock, tmp_path, gerados):
+    futuro = datetime.now(timezone.utc) + timedelta(minutes=5)
+    finais, _ = _executar(cliente_mongomock, tmp_path, [_job("a", "pendente"), _job("b", "executando", futuro, "outro")], 1.0)
+    assert gerados == ["a"]
+    assert finais["a"]["status"] == "concluido"
+    assert finais["b"]["status"] == "executando" and finais["b"]["executor"] == "outro"
+
+def test_job_com_prazo_vencido_e_retomado(cliente_mongomock, tmp_path, gerados):
+    vencido = datetime.now(timezone.utc) - timedelta(seconds=1)
+    jobs = [_job("a", "executando", vencido, "parado"), _job("b", "executando", None, None)]
+    finais, _ = _executar(cliente_mongomock, tmp_path, jobs, 1.5)
+    assert sorted(gerados) == ["a", "b"]
+    assert {finais["a"]["status"], finais["b"]["status"]} == {"concluido"}
+
+def test_prazo_vencido_durante_a_espera_e_recuperado(cliente_mongomock, tmp_path, gerados):
+    quase = datetime.now(timezone.utc) + timedelta(seconds=0.2)
+    finais, _ = _executar(cliente_mongomock, tmp_path, [_job("a", "executando", quase, "parado")], 1.5)
+    assert gerados == ["a"]
+    assert finais["a"]["status"] == "concluido"
+
+def test_heartbeat_renova_o_prazo_durante_a_geracao(cliente_mongomock, tmp_path, monkeypatch):
+    def gerar_lento(job_id, executor, empresa_id, analises, formato, limit, caminho):
+        time.sleep(1.2)
+        with open(caminho, "w") as arquivo:
+            arquivo.write("ok")
+        return 2
+    monkeypatch.setattr(relatorios, "gerar_relatorio", gerar_lento)
+    finais, durante = _executar(cliente_mongomock, tmp_path, [_job("a", "pendente")], 0.8, lease_s=0.3, durante=(0.6, "a"))
+    # Bem depois do prazo inicial (0,3 s) o job segue com o prazo no futuro
+    assert durante["status"] == "executando"
+    assert durante["lease_ate"].replace(tzinfo=timezone.utc) > durante["observado_em"]
+    assert finais["a"]["status"] == "concluido" and finais["a"]["lease_ate"] is None
+
+class _FalhaAoConcluir:
+    """Coleção cuja primeira gravação de "concluido" falha, como numa troca de primário"""
+    def __init__(self, colecao):
+        self._colecao = colecao
+        self.falhas = 1
+
+    def __getattr__(self, nome):
+        return getattr(self._colecao, nome)
+
+    async def update_one(self, filtro, atualizacao, *args, **kwargs):
+        if self.falhas and atualizacao.get("$set", {}).get("status") == "concluido":
+            self.falhas -= 1
+            raise AutoReconnect("primário indisponível")
+        return await self._colecao.update_one(filtro, atualizacao, *args, **kwargs)
+
+def test_falha_ao_gravar_status_nao_derruba_o_trabalhador(cliente_mongomock, tmp_path, gerados):
+    def preparar(fila):
+        fila.colecao = _FalhaAoConcluir(fila.colecao)
+    finais, _ = _executar(
+        cliente_mongomock, tmp_path, [_job("a", "pendente"), _job("b", "pendente")], 2.5, preparar=preparar
+    )
+    # O único trabalhador segue para o próximo job, e o job sem conclusão gravada
+    # é retomado quando o prazo vence
+    assert "b" in gerados and gerados.count("a") == 2
+    assert {finais["a"]["status"], finais["b"]["status"]} == {"concluido"}
+
+def test_pool_quebrado_e_substituido_e_o_job_volta_para_a_fila(cliente_mongomock, tmp_path, monkeypatch):
+    chamadas, pools = [], []
+    def gerar(job_id, executor, empresa_id, analises, formato, limit, caminho):
+        chamadas.append(job_id)
+        if len(chamadas) == 1:
+            raise BrokenProcessPool("processo encerrado abruptamente")
+        with open(caminho, "w") as arquivo:
+            arquivo.write("ok")
+        return 2
+    monkeypatch.setattr(relatorios, "gerar_relatorio", gerar)
+    def preparar(fila):
+        def criar():
+            pools.append(ThreadPoolExecutor(1))
+            return pools[-1]
+        fila._criar_pool = criar
+    finais, _ = _executar(cliente_mongomock, tmp_path, [_job("a", "pendente")], 0.5, preparar=preparar)
+    assert chamadas == ["a", "a"] and len(pools) == 2
+    assert finais["a"]["status"] == "concluido" and finais["a"]["tentativas"] == 1
+
+def test_pool_quebrado_repetidamente_marca_erro(cliente_mongomock, tmp_path, monkeypatch):
+    def gerar(job_id, executor, empresa_id, analises, formato, limit, caminho):
+        raise BrokenProcessPool("processo encerrado abruptamente")
+    monkeypatch.setattr(relatorios, "gerar_relatorio", gerar)
+    finais, _ = _executar(cliente_mongomock, tmp_path, [_job("a", "pendente")], 0.5)
+    assert finais["a"]["status"] == "erro"
+    assert finais["a"]["tentativas"] == relatorios.MAX_TENTATIVAS_POOL - 1
+
+class _LeiturasSimultaneas:
+    """Segura cada leitura do job até que os dois pedidos o tenham lido"""
+    def __init__(self, colecao, pedidos):
+        self._colecao = colecao
+        self._faltam = pedidos
+        self._lidos = asyncio.Event()
+
+    def __getattr__(self, nome):
+        return getattr(self._colecao, nome)
+
+    async def find_one_and_update(self, *args, **kwargs):
+        job = await self._colecao.find_one_and_update(*args, **kwargs)
+        self._faltam -= 1
+        if not self._faltam:
+            self._lidos.set()
+        await self._lidos.wait()
+        return job
+
+def test_pedidos_simultaneos_refazem_o_job_uma_vez(cliente_mongomock, tmp_path):
+    db = cliente_mongomock["relatorios_testes"]
+    async def cenario():
+        fila = relatorios.FilaRelatorios(db, str(tmp_path))
+        fila.colecao = _LeiturasSimultaneas(fila.colecao, 2)
+        impressao = await relatorios.impressao_digital_dados(db, "loja")
+        chave = relatorios.chave_relatorio("loja", ["faixa_etaria"], "csv", 10, impressao)
+        await db[relatorios.COLECAO_RELATORIOS].insert_one({**_job(chave, "erro"), "erro": "falhou"})
+        resultados = await asyncio.gather(*(fila.enfileirar("loja", ["faixa_etaria"], "csv", 10) for _ in range(2)))
+        return resultados, fila._fila.qsize()
+    resultados, na_fila = asyncio.run(cenario())
+    assert sorted(novo for _, novo in resultados) == [False, True]
+    assert na_fila == 1
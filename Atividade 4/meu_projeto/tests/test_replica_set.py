@@ -0,0 +1,118 @@
+"""Leituras das análises em secundários e leitura das próprias escritas (X-Consistencia-Causal)
+
+Os testes marcados com mongo_real precisam de um replica set com secundários em
+MONGO_TESTES_URI (por exemplo o de benchmarks/replica_set.py):
+
+    MONGO_TESTES_URI="mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0" \\
+        python -m pytest -m mongo_real tests/test_replica_set.py
+"""
+from types import SimpleNamespace
+
+import bson
+import pytest
+from pymongo import MongoClient, ReadPreference, monitoring
+
+from config import get_settings
+from consistencia import CABECALHO, codificar_token, decodificar_token
+from database import para_analises, preferencia_leitura_analises
+from services import registro_pipelines
+
+EMPRESA = "loja"
+
+@pytest.fixture
+def leituras(monkeypatch):
+    def configurar(modo, atraso="90"):
+        monkeypatch.setenv("LEITURAS_ANALISES", modo)
+        monkeypatch.setenv("LEITURAS_ANALISES_MAX_ATRASO_S", atraso)
+        get_settings.cache_clear()
+        return get_settings()
+    yield configurar
+    get_settings.cache_clear()
+
+def test_preferencia_das_analises(leituras):
+    assert preferencia_leitura_analises(leituras("primary")) == ReadPreference.PRIMARY
+    preferencia = preferencia_leitura_analises(leituras("secondaryPreferred"))
+    assert preferencia.mode == ReadPreference.SECONDARY_PREFERRED.mode
+    assert preferencia.max_staleness == 90
+    assert preferencia_leitura_analises(leituras("nearest", "0")).max_staleness == -1
+    with pytest.raises(ValueError):
+        preferencia_leitura_analises(leituras("secondary"))
+    with pytest.raises(ValueError):
+        preferencia_leitura_analises(leituras("secondaryPreferred", "30"))
+
+def test_token_causal_ida_e_volta():
+    sessao = SimpleNamespace(
+        operation_time=bson.Timestamp(1700000000, 3),
+        cluster_time={"clusterTime": bson.Timestamp(1700000000, 4), "signature": {"keyId": 0}},
+    )
+    tempos = decodificar_token(codificar_token(sessao))
+    assert tempos["operationTime"] == sessao.operation_time
+    assert tempos["clusterTime"]["clusterTime"] == bson.Timestamp(1700000000, 4)
+    assert decodificar_token("1") == {}
+    with pytest.raises(ValueError):
+        decodificar_token("não é um token")
+
+def test_token_causal_invalido_devolve_400(api):
+    resposta = api.get("/clientes/analise/maior-valor-compra", headers={CABECALHO: "xyz"})
+    assert resposta.status_code == 400
+    assert CABECALHO in resposta.json()["detail"]
+
+
+class _Ouvinte(monitoring.CommandListener):
+    """Guarda o membro que recebeu cada comando"""
+
+    def __init__(self):
+        self.comandos = []
+
+    def started(self, evento):
+        self.comandos.append((evento.command_name, evento.connection_id))
+
+    def succeeded(self, evento):
+        pass
+
+    def failed(self, evento):
+        pass
+
+    def membros(self, comando):
+        return {membro for nome, membro in self.comandos if nome == comando}
+
+
+@pytest.mark.mongo_real
+def test_relatorios_leem_dos_secundarios_e_crud_do_primario(replica_set, leituras, request):
+    leituras("secondaryPreferred")
+    ouvinte = _Ouvinte()
+    cliente = MongoClient(replica_set, event_listeners=[ouvinte])
+    db = cliente[f"testes_{request.node.name}"[:60]]
+    try:
+        db.clientes.insert_one({"empresa_id": EMPRESA, "id": "1", "nome": "Ana", "idade": 30})
+        db.clientes.find_one({"empresa_id": EMPRESA, "id": "1"})
+        primarios = ouvinte.membros("find")
+        ouvinte.comandos.clear()
+
+        para_analises(db.clientes).find_one({"empresa_id": EMPRESA})
+        definicao = registro_pipelines.obter("faixa_etaria")
+        list(definicao.colecao_alvo(db, EMPRESA, "clientes").aggregate(definicao.montar(EMPRESA), **definicao.opcoes()))
+
+        assert primarios == {cliente.primary}
+        assert ouvinte.membros("find") <= cliente.secondaries
+        assert ouvinte.membros("aggregate") <= cliente.secondaries
+    finally:
+        cliente.drop_database(db.name)
+        cliente.close()
+
+@pytest.mark.mongo_real
+def test_leitura_causal_ve_a_propria_escrita(api_real):
+    novo = {
+        "id": "causal-1", "nome": "Leitura Causal", "idade": 30,
+        "ultima_compra": {"produto": "Notebook", "valor": 10 ** 9, "data": "2024-01-01"},
+    }
+    escrita = api_real.post("/clientes/", json=novo, headers={CABECALHO: "1"})
+    assert escrita.status_code == 201, escrita.text
+    token = escrita.headers[CABECALHO]
+
+    # O relatório vem de um secundário; a sessão causal espera ele aplicar a escrita
+    leitura = api_real.get("/clientes/analise/maior-valor-compra", params={"limit": 1}, headers={CABECALHO: token})
+    assert leitura.status_code == 200, leitura.text
+    assert [c["id"] for c in leitura.json()] == ["causal-1"]
+    # O token devolvido pela leitura não fica antes do da escrita
+    assert decodificar_token(leitura.headers[CABECALHO])["operationTime"] >= decodificar_token(token)["operationTime"]